@@ -1,11 +1,48 @@
 '''
 Interactive CLI to store scripts into
 '''
+import importlib
+import sys
+import types
+
 __version__ = '1.5.0'
 
-from dogeek_cli.logging import Logger  # noqa
-from dogeek_cli.config import config, env, tmp_dir, templates, templates_path  # noqa
-from dogeek_cli.state import state  # noqa
-from dogeek_cli.utils import open_editor, open_pager  # noqa
-from dogeek_cli.plugin import Plugin  # noqa
-from dogeek_cli.formatter import formatter  # noqa
+# Public API of the package, imported on first access to keep the CLI's startup fast.
+_LAZY_ATTRIBUTES = {
+    'Logger': 'dogeek_cli.logging',
+    'config': 'dogeek_cli.config',
+    'env': 'dogeek_cli.config',
+    'tmp_dir': 'dogeek_cli.config',
+    'templates': 'dogeek_cli.config',
+    'templates_path': 'dogeek_cli.config',
+    'state': 'dogeek_cli.state',
+    'open_editor': 'dogeek_cli.utils',
+    'open_pager': 'dogeek_cli.utils',
+    'Plugin': 'dogeek_cli.plugin',
+    'formatter': 'dogeek_cli.formatter',
+    'Serializer': 'dogeek_cli.serializers',
+    'register_serializer': 'dogeek_cli.serializers',
+}
+__all__ = ('__version__', *_LAZY_ATTRIBUTES)
+
+
+class _LazyModule(types.ModuleType):
+    def __getattr__(self, name: str):
+        if name not in _LAZY_ATTRIBUTES:
+            raise AttributeError(f'module {self.__name__!r} has no attribute {name!r}')
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        super().__setattr__(name, value)
+        return value
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in _LAZY_ATTRIBUTES and isinstance(value, types.ModuleType):
+            # Importing a submodule binds it on the package, it must not
+            # shadow the attribute of the same name (config, state, formatter)
+            return
+        super().__setattr__(name, value)
+
+    def __dir__(self) -> list[str]:
+        return sorted({*super().__dir__(), *_LAZY_ATTRIBUTES})
+
+
+sys.modules[__name__].__class__ = _LazyModule
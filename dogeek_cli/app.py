@@ -2,80 +2,135 @@
 CLI application supporting plugins to centralize
 scripts and other odds and ends.
 '''
+import importlib
 import logging
 
+import click
 import typer
+from typer.models import TyperInfo
 
-from dogeek_cli import __version__
+from dogeek_cli import __version__, snapshot
 from dogeek_cli.config import config, plugins_registry
 from dogeek_cli.enums import OutputFormat
+from dogeek_cli.lazy import LazyGroup
 from dogeek_cli.logging import Logger
+from dogeek_cli.meta import make_group
+from dogeek_cli.serializers import serializers
 from dogeek_cli.state import State
-from dogeek_cli.subcommands import env
-from dogeek_cli.subcommands import config as cfg
-from dogeek_cli.subcommands import plugins
-from dogeek_cli.subcommands import system
 from dogeek_cli.utils import clean_help_string, check_version
 from dogeek_cli.plugin import Plugin
 
 logging.setLoggerClass(Logger)
 logger = Logger('cli')
 
+# The CLI's own subcommands, only imported to rebuild the command tree or to run them.
+SUBCOMMANDS = {
+    'env': 'dogeek_cli.subcommands.env',
+    'config': 'dogeek_cli.subcommands.config',
+    'plugins': 'dogeek_cli.subcommands.plugins',
+    'system': 'dogeek_cli.subcommands.system',
+}
 
-def add_plugins_hook(app: typer.Typer):
-    for module_name, cached_module in plugins_registry.items():
-        # Cached module is in the form {"path": "...", "metadata": {...}}
+
+def add_subcommands_hook(tree: dict) -> dict:
+    '''Adds the CLI's own subcommands to the description of its command tree.'''
+    for name, module_name in SUBCOMMANDS.items():
+        module = importlib.import_module(module_name)
+        subcommand_info = TyperInfo(module.app, name=name, help=clean_help_string(module.__doc__))
+        tree['groups'].append({**make_group(subcommand_info), 'module': module_name, 'attr': 'app'})
+    return tree
+
+
+def add_plugins_hook(tree: dict) -> dict:
+    '''
+    Adds the enabled plugins to the description of the CLI's command tree.
+
+    Plugins are described from their cached metadata, and only imported
+    when that metadata is missing or outdated.
+    '''
+    command_names = {node['name'] for node in tree['commands'] + tree['groups']}
+    for module_name in plugins_registry:
         plugin = Plugin(module_name)
-        plugin.make_meta()
         if not plugin.enabled:
             logger.info('Plugin %s is not enabled', module_name)
             continue
-        logger.info(
-            'Loading plugin %s into context with data %s',
-            module_name, cached_module
-        )
-        plugin_app = getattr(plugin.module, 'app', None)
-        if plugin_app is None:
-            for variable_name in dir(plugin.module):
-                variable = getattr(plugin.module, variable_name)
-                if isinstance(variable, typer.Typer):
-                    plugin_app = variable
-                    break
-            else:
-                logger.error('Plugin %s does not export a typer.Typer instance.', module_name)
-                continue
-        app.add_typer(plugin_app, **cached_module['metadata'])
-    return app
+        try:
+            plugin.make_meta()
+        except (FileNotFoundError, TypeError) as e:
+            logger.error('Could not load plugin %s : %s', module_name, e)
+            continue
+        meta = plugin.meta
+        if meta['name'] in command_names:
+            logger.error(
+                'Plugin %s conflicts with the existing command %s.',
+                module_name, meta['name']
+            )
+            continue
+        logger.info('Adding plugin %s to the CLI as %s', module_name, meta['name'])
+        command_names.add(meta['name'])
+        tree['groups'].append({**meta, 'plugin': module_name})
+    return tree
 
 
 app = typer.Typer(help=__doc__)
-app = add_plugins_hook(app)
+
+
+def validate_format(ctx: click.Context, format: str) -> OutputFormat | str:
+    '''Returns the format of `--format`, raises typer.BadParameter if no serializer is registered for it.'''
+    if format in OutputFormat._value2member_map_:
+        return OutputFormat(format)
+    if format not in serializers and ctx.invoked_subcommand is not None:
+        # Plugins register their formats when imported, which is otherwise done after this callback
+        command = ctx.command.get_command(ctx, ctx.invoked_subcommand)
+        if isinstance(command, LazyGroup):
+            command.load()
+    if format not in serializers:
+        formats = dict.fromkeys([*(f.value for f in OutputFormat), *serializers])
+        raise typer.BadParameter(
+            f'Unknown format {format!r}, the formats are {", ".join(formats)}.', param_hint="'--format'"
+        )
+    return format
 
 
 @app.callback()
 def callback(
-    format: OutputFormat = typer.Option(
-        OutputFormat.DEFAULT, '--format', '-f',
-        help='Format the output into the given format.'
+    format: str = typer.Option(
+        OutputFormat.DEFAULT.value, '--format', '-f',
+        help=(
+            f'Format the output into the given format : {", ".join(dict.fromkeys(f.value for f in OutputFormat))}, '
+            'or a format registered by a plugin.'
+        ),
     ),
     verbosity: int = typer.Option(
         config['app.default_verbosity'], "--verbose", "-v", count=True, min=0,
         max=5, help='Set the verbosity level of the command.',
     ),
+    raw: bool = typer.Option(
+        False, '--raw', '--no-color',
+        help='Print the output without colors nor highlighting, as when it is not a terminal.',
+    ),
 ) -> None:
     state = State()
-    state.format = format
+    state.format = validate_format(click.get_current_context(), format)
     state.verbosity = verbosity
+    state.raw = raw
     if config['app.notify_new_version']:
         check_version(__version__)
     return
 
 
-app.add_typer(env.app, name='env', help=clean_help_string(env.__doc__))
-app.add_typer(cfg.app, name='config', help=clean_help_string(cfg.__doc__))
-app.add_typer(plugins.app, name='plugins', help=clean_help_string(plugins.__doc__))
-app.add_typer(system.app, name='system', help=clean_help_string(system.__doc__))
-typer_click_object = typer.main.get_command(app)
+def make_command_tree(force_rebuild: bool = False) -> LazyGroup:
+    '''Builds the CLI's command tree, from its snapshot when it is still valid.'''
+    fingerprint = snapshot.fingerprint()
+    tree = None if force_rebuild else snapshot.load(fingerprint)
+    if tree is None:
+        logger.info('Rebuilding the command tree snapshot.')
+        tree = add_plugins_hook(add_subcommands_hook(make_group(TyperInfo(app))))
+        snapshot.dump(tree, fingerprint)
+    return LazyGroup(tree, {'module': 'dogeek_cli.app', 'attr': 'app'}, [], is_root=True)
+
+
+typer_click_object = make_command_tree()
 
 
 def main():
@@ -1,27 +1,102 @@
-from base64 import b64encode
+from base64 import b64decode, b64encode
+import functools
+from http import HTTPStatus
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Iterator
 from urllib.parse import urlparse, ParseResult, urljoin
 
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding, rsa
 import requests
+from requests.adapters import HTTPAdapter
 
-from dogeek_cli.config import config
+from dogeek_cli.config import config, tmp_dir
+from dogeek_cli.http_cache import HTTPCache, is_storable
+from dogeek_cli.utils import Singleton
+
+
+# Maximum number of connections kept alive to each registry
+POOL_SIZE = 16
+http_cache = HTTPCache(tmp_dir / 'http_cache', config['app.http_cache.max_size'])
+ARCHIVE_CONTENT_TYPES = ('application/gzip', 'application/x-gzip', 'application/octet-stream')
+registries_health_path: Path = tmp_dir / 'registries_health.json'
+uploads_path: Path = tmp_dir / 'uploads.json'
+# Time waited for a registry without known latency before the next one is queried too, in seconds
+HEDGE_DELAY = 0.5
+# Size of the chunks of uploaded archives
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+def get_sha256(headers: requests.structures.CaseInsensitiveDict) -> str | None:
+    '''Returns the hex SHA-256 of a response body from its `Digest` header, if any.'''
+    for digest in headers.get('Digest', '').split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.lower() == 'sha-256' and value:
+            return b64decode(value).hex()
+    return None
+
+
+@functools.cache
+def load_public_key() -> str:
+    return (config.app_path / 'key.pub').read_text()
+
+
+@functools.cache
+def load_private_key():
+    '''Loads the private key, only needed to sign requests.'''
+    # cryptography takes ~20ms to import
+    from cryptography.hazmat.primitives import serialization
+
+    return serialization.load_pem_private_key((config.app_path / 'key').read_bytes(), None)
+
+
+def read_uploads() -> dict[str, str]:
+    '''Returns the identifiers of the uploads in progress, by archive SHA-256.'''
+    try:
+        return json.loads(uploads_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_uploads(uploads: dict[str, str]) -> None:
+    uploads_path.write_text(json.dumps(uploads, indent=2))
+    return
+
+
+def iter_file(path: Path, offset: int, on_progress: Callable[[int], None] | None) -> Iterator[bytes]:
+    '''Yields the content of a file from `offset`, reporting the number of bytes sent so far.'''
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        while chunk := fp.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+            offset += len(chunk)
+            if on_progress is not None:
+                on_progress(offset)
+    return
 
 
 class Client(requests.Session):
-    def __init__(self, registry, *a, **kw):
+    def __init__(self, registry, *a, cache: HTTPCache | None = http_cache, **kw):
         super().__init__(*a, **kw)
-        self.pub_key_str: str = (config.app_path / 'key.pub').read_text()
-        self.pub_key = serialization.load_ssh_public_key(self.pub_key_str.encode('utf8'))
-        self.priv_key_str: str = (config.app_path / 'key').read_text()
-        self.priv_key: rsa.RSAPrivateKey = serialization.load_pem_private_key(
-            self.priv_key_str.encode('utf8'), None
-        )
+        self.cache = cache
+        self.pub_key_str: str = load_public_key()
         self.headers['Authorization'] = self.pub_key_str
         self.headers['X-Maintainer-Email'] = config['app.email']
         self.registry = registry
+        adapter = HTTPAdapter(pool_maxsize=POOL_SIZE)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    @property
+    def priv_key(self):
+        return load_private_key()
 
     def make_signature(self, url: str) -> str:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
         url: ParseResult = urlparse(url)
         signature = self.priv_key.sign(
             url.path.encode('utf8'),
@@ -39,12 +114,45 @@ class Client(requests.Session):
         url = url.lstrip('/')
         if self.registry == 'localhost':
             url = urljoin('http://0.0.0.0:8000', url)
+        elif self.registry.startswith(('http://', 'https://')):
+            url = urljoin(self.registry.rstrip('/') + '/', url)
         else:
             url = urljoin(f'https://{self.registry}', url)
         if do_sign:
             headers['X-Signature'] = self.make_signature(url)
+        if method == 'GET' and self.cache is not None and not kw.get('stream'):
+            return self.cached_get(url, headers=headers, **kw)
         return super().request(method, url, headers=headers, **kw)
 
+    def cached_get(self, url: str, headers: dict, **kw) -> requests.Response:
+        '''
+        GET request going through the HTTP cache.
+
+        Fresh responses are served from the cache, stale ones are revalidated,
+        and served as is when the registry can't be reached.
+        '''
+        request = requests.Request('GET', url, params=kw.get('params')).prepare()
+        entry = self.cache.get(request.url)
+        if entry is not None and entry.is_fresh:
+            return entry.to_response(request)
+        if entry is not None:
+            headers.update(entry.validators)
+
+        try:
+            response = super().request('GET', url, headers=headers, **kw)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if entry is None:
+                raise
+            return entry.to_response(request, stale=True)
+
+        if entry is not None and response.status_code == HTTPStatus.NOT_MODIFIED:
+            return self.cache.refresh(entry, response).to_response(response.request)
+        if entry is not None and response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            return entry.to_response(request, stale=True)
+        if is_storable(response):
+            self.cache.store(request.url, response)
+        return response
+
     def get(self, url, **kw):
         return self.request('GET', url, **kw)
 
@@ -59,3 +167,278 @@ class Client(requests.Session):
 
     def delete(self, url, **kw):
         return self.request('DELETE', url, **kw)
+
+    def get_latest_version(self, plugin_name: str) -> str | None:
+        '''Returns the latest version of a plugin, None if the registry can't tell.'''
+        try:
+            response = self.get(f'/v1/plugins/{plugin_name}/versions/latest')
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != HTTPStatus.OK:
+            return None
+        return response.json()['data']['version']
+
+    def head(self, url, **kw):
+        return self.request('HEAD', url, **kw)
+
+    def upload_archive(
+        self, plugin_name: str, version: str, path: Path, sha256: str,
+        on_progress: Callable[[int], None] | None = None,
+    ) -> requests.Response | None:
+        '''
+        Uploads the archive of a plugin version as a chunked binary body.
+
+        An upload of the same archive which was interrupted is resumed from
+        the offset the registry reports. Returns None if the registry doesn't
+        support binary uploads.
+        '''
+        uploads_url = f'/v1/plugins/{plugin_name}/versions/{version}/uploads'
+        uploads = read_uploads()
+        upload_id = uploads.get(sha256)
+        offset = 0
+        if upload_id is not None:
+            response = self.head(f'{uploads_url}/{upload_id}', do_sign=True)
+            if response.status_code == HTTPStatus.OK:
+                offset = int(response.headers.get('Upload-Offset', 0))
+            else:
+                # The registry discarded the upload, it is started over
+                upload_id = None
+
+        if upload_id is None:
+            response = self.post(uploads_url, json={'size': path.stat().st_size, 'sha256': sha256}, do_sign=True)
+            if response.status_code in (HTTPStatus.NOT_FOUND, HTTPStatus.METHOD_NOT_ALLOWED):
+                return None
+            if response.status_code not in (HTTPStatus.OK, HTTPStatus.CREATED):
+                return response
+            upload_id = response.json()['data']['id']
+            write_uploads({**uploads, sha256: upload_id})
+
+        if on_progress is not None:
+            on_progress(offset)
+        response = self.patch(
+            f'{uploads_url}/{upload_id}',
+            data=iter_file(path, offset, on_progress),
+            headers={'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': str(offset)},
+            do_sign=True,
+        )
+        if response.status_code in (HTTPStatus.OK, HTTPStatus.CREATED, HTTPStatus.NO_CONTENT):
+            uploads = read_uploads()
+            uploads.pop(sha256, None)
+            write_uploads(uploads)
+        return response
+
+    def get_archive(self, plugin_name: str, version: str) -> requests.Response | None:
+        '''
+        Streams the gzipped tarball of a plugin version.
+
+        Returns None if the registry doesn't serve raw archives.
+        '''
+        try:
+            response = self.get(
+                f'/v1/plugins/{plugin_name}/versions/{version}/archive',
+                headers={'Accept': 'application/gzip'}, stream=True,
+            )
+        except requests.exceptions.RequestException:
+            return None
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        if response.status_code != HTTPStatus.OK or content_type not in ARCHIVE_CONTENT_TYPES:
+            response.close()
+            return None
+        return response
+
+    def get_manifest(self, plugin_name: str, version: str) -> dict | None:
+        '''
+        Returns the manifest of a plugin version : its version, and the SHA-256
+        and size of its files by path.
+
+        Returns None if the registry doesn't serve manifests.
+        '''
+        try:
+            response = self.get(f'/v1/plugins/{plugin_name}/versions/{version}/manifest')
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != HTTPStatus.OK:
+            return None
+        return response.json()['data']
+
+    def get_file(self, plugin_name: str, version: str, path: str) -> requests.Response | None:
+        '''Streams a single file of a plugin version, None if the registry can't.'''
+        try:
+            response = self.get(f'/v1/plugins/{plugin_name}/versions/{version}/files/{path}', stream=True)
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != HTTPStatus.OK:
+            response.close()
+            return None
+        return response
+
+    def get_latest_versions(self, plugin_names: list[str]) -> dict[str, str | None] | None:
+        '''
+        Returns the latest version of several plugins in a single request.
+
+        Returns None if the registry doesn't support batched lookups.
+        '''
+        try:
+            response = self.get('/v1/plugins/versions/latest', params={'plugins': plugin_names})
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != HTTPStatus.OK:
+            return None
+        versions = {plugin['name']: plugin['version'] for plugin in response.json()['data']}
+        return {plugin_name: versions.get(plugin_name) for plugin_name in plugin_names}
+
+
+class ClientPool(metaclass=Singleton):
+    '''Process-wide registry clients, one per registry, so that connections are reused.'''
+
+    def __init__(self) -> None:
+        self._clients: dict[str, Client] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, registry: str) -> Client:
+        with self._lock:
+            if registry not in self._clients:
+                self._clients[registry] = Client(registry)
+            return self._clients[registry]
+
+
+clients = ClientPool()
+
+
+class RegistriesHealth:
+    '''
+    Latency and failures of the registries, remembered across runs.
+
+    Registries which failed on their last lookup are queried last, and the
+    timeout of a registry is adapted to its usual latency.
+    '''
+
+    def __init__(self) -> None:
+        try:
+            self.stats: dict[str, dict] = json.loads(registries_health_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stats = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, registry: str) -> bool:
+        return self.stats.get(registry, {}).get('failures', 0) == 0
+
+    def order(self, registries: list[str]) -> list[str]:
+        '''Orders registries by health, keeping their priority otherwise.'''
+        return sorted(registries, key=lambda registry: not self.is_healthy(registry))
+
+    def hedge_delay(self, registry: str) -> float:
+        '''Returns the time after which the next registry is queried too, while waiting for `registry`.'''
+        latency = self.stats.get(registry, {}).get('latency')
+        if latency is None:
+            return HEDGE_DELAY
+        return min(self.timeout(registry), 2 * latency)
+
+    def timeout(self, registry: str) -> float:
+        max_timeout = config['app.registries_timeout']
+        latency = self.stats.get(registry, {}).get('latency')
+        if latency is None:
+            return max_timeout
+        return min(max_timeout, max(1.0, 4 * latency))
+
+    def record(self, registry: str, latency: float | None) -> None:
+        '''Records the latency of a lookup, None if the registry failed to answer.'''
+        with self._lock:
+            stats = self.stats.setdefault(registry, {'latency': None, 'failures': 0})
+            if latency is None:
+                stats['failures'] += 1
+            elif stats['latency'] is None:
+                stats['latency'], stats['failures'] = latency, 0
+            else:
+                # Exponential moving average, to smooth out outliers
+                stats['latency'], stats['failures'] = 0.7 * stats['latency'] + 0.3 * latency, 0
+        return
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self.stats, indent=2)
+        # Replaced atomically, the lookups and the CLI's processes save it concurrently
+        tmp_path = registries_health_path.with_name(
+            f'.{registries_health_path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        )
+        tmp_path.write_text(data)
+        os.replace(tmp_path, registries_health_path)
+        return
+
+
+def is_found(response: requests.Response | None) -> bool:
+    return response is not None and response.status_code == HTTPStatus.OK
+
+
+def find_plugin_version(
+    plugin_name: str, version: str, registries: list[str]
+) -> tuple[str | None, requests.Response | None]:
+    '''
+    Looks a plugin version up in the registries, in priority order.
+
+    The next registry is queried as soon as the previous ones don't have the
+    plugin version, or are slower to answer than they usually are. Returns the
+    first registry, in priority order, which has the plugin version and its
+    response. The lookups run on daemon threads, which don't delay the exit.
+    '''
+    health = RegistriesHealth()
+    registries = health.order(registries)
+    condition = threading.Condition()
+    responses: dict[str, requests.Response | None] = {}
+    found = None
+    finished = False
+
+    def lookup(registry: str) -> None:
+        start = time.monotonic()
+        try:
+            # Streamed, so that only the body of the response which is used is downloaded
+            response = clients[registry].get(
+                f'/v1/plugins/{plugin_name}/versions/{version}', timeout=health.timeout(registry), stream=True,
+            )
+        except requests.exceptions.RequestException:
+            response = None
+        if response is not None and response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            response.close()
+            response = None
+        health.record(registry, None if response is None else time.monotonic() - start)
+        health.save()
+        with condition:
+            if finished:
+                # Answered once the lookup was over
+                if response is not None:
+                    response.close()
+                return
+            responses[registry] = response
+            condition.notify_all()
+        return
+
+    def query_next() -> None:
+        threading.Thread(target=lookup, args=(registries[len(queried)],), daemon=True).start()
+        queried.append(registries[len(queried)])
+        return
+
+    queried: list[str] = []
+    with condition:
+        try:
+            while True:
+                # The first registry which has the plugin version, unless a registry before it didn't answer yet
+                pending = None
+                for registry in queried:
+                    if registry not in responses:
+                        pending = registry
+                        break
+                    if is_found(responses[registry]):
+                        found = registry
+                        return found, responses[found]
+                if len(queried) == len(registries) and pending is None:
+                    return None, None
+                if pending is None:
+                    query_next()
+                elif not condition.wait(health.hedge_delay(pending)) and len(queried) < len(registries):
+                    # Slower than usual, the next registry is queried too
+                    query_next()
+        finally:
+            finished = True
+            for registry, response in responses.items():
+                if response is not None and registry != found:
+                    response.close()
@@ -1,13 +1,28 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
 from pathlib import Path
+from typing import ContextManager, Iterator
 
-from mako.lookup import TemplateLookup
 from xdgconfig import JsonConfig
+from xdgconfig.defaultdict import defaultdict
+from xdgconfig.utils import default_to_dict
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the files are still replaced atomically
+    fcntl = None
 
 
 class DefaultConfig:
     _DEFAULTS = {
         'app.theme': 'monokai',
         'app.logger.level': 'info',
+        'app.logger.max_file_size': 8 * 1024 * 1024,
+        'app.logger.max_total_size': 64 * 1024 * 1024,
+        'app.logger.max_age': 30 * 86400,
         'app.editor.prefer_visual': False,
         'app.editor.name': 'vi',
         'app.editor.flags': [],
@@ -17,28 +32,163 @@ class DefaultConfig:
         'app.email': '',
         'app.registries': ['cli.dogeek.me'],
         'app.notify_new_version': True,
+        'app.version_check_ttl': 86400,
+        'app.http_cache.max_size': 64 * 1024 * 1024,
+        'app.registries_timeout': 5,
+        'app.store.max_size': 256 * 1024 * 1024,
+        'app.plugins_scan_timeout': 30,
+        'app.registry_backend': 'json',
     }
 
 
-class Config(DefaultConfig, JsonConfig):
-    ...
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    '''Holds an advisory lock on `path`, shared by the CLI's processes.'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as fp:
+        if fcntl is not None:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+        yield
+
+
+class JsonStore(JsonConfig):
+    '''
+    A JSON file, replaced atomically under an advisory lock when saved.
+
+    Changes made in a `batch()` are saved once when leaving it, including the
+    changes made to nested sections, which aren't saved on their own.
+    '''
+    _batches = 0
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        '''Saves the file once when leaving the outermost batch, instead of on every change.'''
+        self._batches += 1
+        try:
+            yield
+        finally:
+            self._batches -= 1
+            if self._batches == 0 and self._autosave:
+                self.save()
+
+    def lock(self) -> ContextManager[None]:
+        return file_lock(self.config_path.with_name(f'{self.config_path.name}.lock'))
+
+    def save(self) -> None:
+        if self._batches:
+            # Saved when leaving the batch
+            return
+        # Serialized before the file is touched, so that an error can't truncate it
+        data = self._SERIALIZER.dumps(default_to_dict(self), indent=4)
+        tmp_path = self.config_path.with_name(f'.{self.config_path.name}.{os.getpid()}.tmp')
+        with self.lock():
+            tmp_path.write_text(data)
+            os.replace(tmp_path, self.config_path)
+        if self.is_git_repo:
+            self.commit_changes()
+        return
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        if self._autosave:
+            self.save()
+        return
+
+    def pop(self, key: str, *default):
+        value = super().pop(key, *default)
+        if self._autosave:
+            self.save()
+        return value
+
+
+class JsonRegistry(JsonStore):
+    '''The plugins registry, with the plugins' command metadata in separate files.'''
+
+    @property
+    def meta_path(self) -> Path:
+        return self.app_path / 'plugin_meta'
+
+    def __getitem__(self, plugin_name: str) -> dict:
+        # Entries are only created with `registry[plugin_name] = entry`, not when missing ones are looked up
+        if plugin_name not in self:
+            raise KeyError(plugin_name)
+        return super().__getitem__(plugin_name)
+
+    def read_meta(self, plugin_name: str) -> dict | None:
+        try:
+            return json.loads((self.meta_path / f'{plugin_name}.meta').read_text())
+        except FileNotFoundError:
+            return None
+
+    def write_meta(self, plugin_name: str, meta: dict) -> None:
+        self.meta_path.mkdir(parents=True, exist_ok=True)
+        (self.meta_path / f'{plugin_name}.meta').write_text(json.dumps(meta, indent=2, default=str))
+        return
+
+    def delete_meta(self, plugin_name: str) -> None:
+        (self.meta_path / f'{plugin_name}.meta').unlink(missing_ok=True)
+        return
+
+    def installed_from(self, registry: str | None = None) -> list[str]:
+        '''Returns the plugins installed from `registry`, or from any registry.'''
+        return [
+            plugin_name for plugin_name, entry in self.items()
+            if entry.get('installed_from') is not None and registry in (None, entry['installed_from'])
+        ]
+
+    def fingerprint(self) -> str:
+        try:
+            return hashlib.sha256(self.config_path.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            return ''
+
+
+class Config(DefaultConfig, JsonStore):
+    def _load(self) -> dict:
+        # Sections loaded from the file don't know the defaults of their keys, so
+        # keys added to the defaults after the file was written would be missing.
+        return {key: self._with_defaults(value, key) for key, value in super()._load().items()}
+
+    def _with_defaults(self, value, parent: str):
+        if not isinstance(value, dict):
+            return value
+        return defaultdict(
+            {key: self._with_defaults(v, f'{parent}.{key}') for key, v in value.items()},
+            _parent=parent, _defaults=self._DEFAULTS,
+        )
 
 
 config = Config('cli', 'config.json')
-env = JsonConfig('cli', 'env.json')
+env = JsonStore('cli', 'env.json')
 root_path = Path(__file__).parent.resolve()
 templates_path: Path = (config.app_path / 'templates')
 templates_path.mkdir(parents=True, exist_ok=True)
 plugins_path: Path = (config.app_path / 'plugins')
 plugins_path.mkdir(parents=True, exist_ok=True)
-plugins_registry = JsonConfig('cli', 'registry.json')
+if config['app.registry_backend'] == 'sqlite':
+    from dogeek_cli.registry_db import SqliteRegistry
+
+    plugins_registry = SqliteRegistry(
+        config.app_path / 'registry.db', config.app_path / 'registry.json', config.app_path / 'plugin_meta',
+    )
+else:
+    plugins_registry = JsonRegistry('cli', 'registry.json')
 RESERVED_COMMANDS = ('config', 'env', 'plugins', 'system')
+# Created when the first record is logged
 logs_path: Path = (config.app_path / 'logs')
-logs_path.mkdir(parents=True, exist_ok=True)
 tmp_dir: Path = (config.app_path / 'tmp')
 tmp_dir.mkdir(parents=True, exist_ok=True)
 
-templates = TemplateLookup(
-    directories=[str(templates_path.resolve())],
-    module_directory=str((tmp_dir / 'mako_modules').resolve()),
-)
+
+def __getattr__(name: str):
+    # The templates lookup is only created when used, so that mako isn't imported on startup.
+    global templates
+    if name != 'templates':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    from mako.lookup import TemplateLookup
+
+    templates = TemplateLookup(
+        directories=[str(templates_path.resolve())],
+        module_directory=str((tmp_dir / 'mako_modules').resolve()),
+    )
+    return templates
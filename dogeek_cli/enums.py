@@ -14,3 +14,11 @@ class OutputFormat(str, Enum):
 class PurgeWhat(str, Enum):
     LOGS = 'logs'
     TMP = 'tmp'
+
+
+class LogLevel(str, Enum):
+    DEBUG = 'debug'
+    INFO = 'info'
+    WARN = 'warn'
+    ERROR = 'error'
+    CRITICAL = 'critical'
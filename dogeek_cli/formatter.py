@@ -1,77 +1,212 @@
+'''Output of the commands' results, in the format of the `--format` option.'''
 import csv
 import io
-import json
+import itertools
+from typing import Iterable, Iterator, Sequence
 
+from rich import box
+from rich.cells import cell_len
 from rich.console import Console
-from rich.syntax import Syntax
 from rich.table import Table
-import toml
-import yaml
+import typer
 
 from dogeek_cli.config import config
 from dogeek_cli.enums import OutputFormat
+from dogeek_cli.serializers import Serializer, get_serializer
 from dogeek_cli.state import state
+from dogeek_cli.utils import open_pager
+
+# Rows printed at once when streaming
+CHUNK_SIZE = 1000
+# Rows of a table rendered at once
+PAGE_SIZE = 100
+# Rows of a table sizing its columns
+SAMPLE_SIZE = 200
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+    return
 
 
 class Formatter:
     def __init__(self):
         self.console = Console()
 
-    def __call__(self, data: dict | list):
-        match state.format:
-            case OutputFormat.JSON:
-                self.print_json(data)
-            case OutputFormat.YAML:
-                self.print_yaml(data)
-            case OutputFormat.YML:
-                self.print_yaml(data)
-            case OutputFormat.TOML:
-                self.print_toml(data)
-            case OutputFormat.CSV:
-                self.print_csv(data)
-            case OutputFormat.TABLE:
-                self.print_table(data)
-            case _:
-                self.print_default(data)
+    def __call__(self, data: dict | list | Iterable[dict], fieldnames: Sequence[str] | None = None):
+        # The console is shared by the commands run by the same process, as in the server
+        no_color = self.console.no_color
+        if state.raw:
+            # Tables and the default format are still printed by rich
+            self.console.no_color = True
+        try:
+            if not isinstance(data, (dict, list)):
+                self.stream(data, fieldnames)
+                return
+            match state.format:
+                case OutputFormat.CSV:
+                    self.print_csv(data)
+                case OutputFormat.TABLE:
+                    self.print_table(data)
+                case OutputFormat.DEFAULT:
+                    self.print_default(data)
+                case _:
+                    self.print_serialized(data, state.format)
+        finally:
+            self.console.no_color = no_color
+
+    @property
+    def plain(self) -> bool:
+        '''Checks if the output is written without highlighting.'''
+        return state.raw or self.console.no_color or not self.console.is_terminal
+
+    def serializer(self, output_format: OutputFormat | str) -> Serializer:
+        '''Returns the backend of a format, raises typer.BadParameter if there isn't any.'''
+        try:
+            return get_serializer(output_format.value if isinstance(output_format, OutputFormat) else output_format)
+        except LookupError as e:
+            raise typer.BadParameter(str(e), param_hint="'--format'")
+
+    def write(self, data: str | bytes):
+        '''Writes `data` to the output as it is, bypassing rich.'''
+        output = self.console.file
+        buffer = getattr(output, 'buffer', None)
+        if buffer is None:
+            output.write(data if isinstance(data, str) else data.decode('utf8', 'replace'))
+        else:
+            # What was written to the text layer goes first
+            output.flush()
+            buffer.write(data.encode(output.encoding or 'utf8', 'replace') if isinstance(data, str) else data)
+        output.flush()
+
+    def print_syntax(self, data: str | bytes, lexer: str | None):
+        if lexer is None:
+            # Binary formats
+            self.write(data)
+            return
+        if self.plain:
+            newline = b'\n' if isinstance(data, bytes) else '\n'
+            self.write(data if data.endswith(newline) else data + newline)
+            return
+        if isinstance(data, bytes):
+            data = data.decode('utf8')
+        # rich.syntax imports pygments, ~30ms
+        from rich.syntax import Syntax
 
-    def print_syntax(self, data: str, lexer: str):
-        lexer = Syntax(data, lexer, theme=config['app.theme'])
+        # The console ends the output with a newline
+        lexer = Syntax(data.rstrip('\n'), lexer, theme=config['app.theme'])
         self.console.print(lexer)
 
+    def print_serialized(self, data: dict | list, output_format: OutputFormat | str):
+        serializer = self.serializer(output_format)
+        self.print_syntax(serializer.dumps(data), serializer.lexer)
+
     def print_json(self, data: dict | list):
-        self.print_syntax(json.dumps(data, indent=2), 'json')
+        self.print_serialized(data, OutputFormat.JSON)
 
     def print_yaml(self, data: dict | list):
-        stream = io.StringIO()
-        yaml.dump(data, stream, indent=2)
-        stream.seek(0)
-        self.print_syntax(stream.read(), 'yaml')
+        self.print_serialized(data, OutputFormat.YAML)
 
     def print_toml(self, data: dict | list):
-        self.print_syntax(toml.dumps(data), 'toml')
+        self.print_serialized(data, OutputFormat.TOML)
 
     def print_csv(self, data: dict | list):
         if isinstance(data, dict):
             data = [data]
-        fieldnames = tuple({k for d in data for k in d.keys()})
+        # The fields of all the rows, in the order they appear in
+        fieldnames = tuple(dict.fromkeys(k for d in data for k in d.keys()))
+        self.print_syntax(''.join(self.iter_csv(data, fieldnames)), 'csv')
+
+    def iter_csv(self, rows: Iterable[dict], fieldnames: Sequence[str] | None = None) -> Iterator[str]:
+        '''Yields the header, then the lines of the rows, the fieldnames defaulting to the first row's keys.'''
+        rows = iter(rows)
+        if fieldnames is None:
+            first = next(rows, None)
+            if first is None:
+                return
+            fieldnames = tuple(first.keys())
+            rows = itertools.chain([first], rows)
         stream = io.StringIO()
         writer = csv.DictWriter(
             stream, fieldnames, 'N/A',
             delimiter=',', quotechar='"',
-            escapechar='"', lineterminator='\n',
+            escapechar='"', lineterminator='\n', extrasaction='ignore',
         )
-        writer.writerows(data)
-        stream.seek(0)
-        self.print_syntax(stream.read(), 'csv')
+        writer.writeheader()
+        yield stream.getvalue()
+        for row in rows:
+            stream.seek(0)
+            stream.truncate()
+            writer.writerow(row)
+            yield stream.getvalue()
+        return
 
     def print_table(self, data: dict | list):
         if isinstance(data, dict):
             data = [data]
-        fieldnames = tuple({k for d in data for k in d.keys()})
-        table = Table(fieldnames)
-        for row in data:
-            table.add_row(row.values())
-        self.console.print(table)
+        self.print_paged_table(data, tuple(dict.fromkeys(k for d in data for k in d.keys())))
+
+    def print_paged_table(self, rows: Iterable[dict], fieldnames: Sequence[str] | None = None):
+        '''Prints a table a page at a time, through the pager on terminals.'''
+        rows = iter(rows)
+        sample = list(itertools.islice(rows, SAMPLE_SIZE))
+        if not sample:
+            return
+        if fieldnames is None:
+            fieldnames = tuple(dict.fromkeys(k for row in sample for k in row.keys()))
+        widths = [
+            max(cell_len(field), *(cell_len(str(row.get(field, 'N/A'))) for row in sample))
+            for field in fieldnames
+        ]
+        # chain holds its arguments until the end, the iterator over the sample releases it once consumed
+        pages = self.render_table_pages(itertools.chain(iter(sample), rows), fieldnames, widths)
+        # The rows are only held by the page being rendered from now on
+        del sample
+        if not self.console.is_terminal:
+            for page in pages:
+                self.write(page)
+            return
+        open_pager(pages)
+        return
+
+    def render_table_pages(
+        self, rows: Iterable[dict], fieldnames: Sequence[str], widths: Sequence[int],
+    ) -> Iterator[str]:
+        '''Yields the rendered pages of a table, the header on the first one only.'''
+        for i, page in enumerate(chunked(rows, PAGE_SIZE)):
+            # Without edges, so that the pages are continued by the next ones
+            table = Table(box=box.SIMPLE_HEAD, show_edge=False, show_header=i == 0)
+            for field, width in zip(fieldnames, widths):
+                # The cells wider than the sampled ones are wrapped, rather than widening the columns
+                table.add_column(field, width=width, overflow='fold')
+            for row in page:
+                table.add_row(*(str(row.get(field, 'N/A')) for field in fieldnames))
+            with self.console.capture() as capture:
+                self.console.print(table)
+            yield capture.get()
+        return
+
+    def stream(self, rows: Iterable[dict], fieldnames: Sequence[str] | None = None):
+        '''Prints the rows as they are produced, without holding them all in memory.'''
+        match state.format:
+            case OutputFormat.CSV:
+                lexer, lines = 'csv', self.iter_csv(rows, fieldnames)
+            case OutputFormat.TABLE:
+                self.print_paged_table(rows, fieldnames)
+                return
+            case OutputFormat.DEFAULT:
+                for row in rows:
+                    self.print_default(row)
+                return
+            case _:
+                serializer = self.serializer(state.format)
+                lexer, lines = serializer.lexer, map(serializer.dumps_row or serializer.dumps, rows)
+        for chunk in chunked(lines, CHUNK_SIZE):
+            # The backends serialize to str or to bytes
+            self.print_syntax(chunk[0][:0].join(chunk), lexer)
+        return
 
     def print_default(self, data: dict | list, indent: int = 0):
         if indent == 0 and not isinstance(data, dict):
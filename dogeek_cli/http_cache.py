@@ -0,0 +1,169 @@
+'''
+On-disk cache of the responses to registry GET requests.
+
+Responses are stored along with their validators (`ETag`, `Last-Modified`)
+and freshness (`Cache-Control: max-age`, `Expires`), and revalidated with
+conditional requests once stale. The cache is bounded in size, the least
+recently used entries being evicted first.
+'''
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def parse_cache_control(header: str | None) -> dict[str, str | None]:
+    directives = {}
+    for directive in (header or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def get_expiry(headers: CaseInsensitiveDict) -> float:
+    '''Returns the timestamp until which a response is fresh.'''
+    cache_control = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-cache' in cache_control or 'must-revalidate' in cache_control:
+        return 0
+    if cache_control.get('max-age'):
+        try:
+            return time.time() + int(cache_control['max-age'])
+        except ValueError:
+            return 0
+    if headers.get('Expires'):
+        try:
+            return parsedate_to_datetime(headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+def is_storable(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    if 'no-store' in parse_cache_control(response.headers.get('Cache-Control')):
+        return False
+    return any(header in response.headers for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Expires'))
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    status_code: int
+    headers: dict[str, str]
+    expires: float
+    body_path: Path
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires
+
+    @property
+    def validators(self) -> dict[str, str]:
+        '''Headers making a conditional request for this entry.'''
+        validators = {}
+        if 'ETag' in self.headers:
+            validators['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            validators['If-Modified-Since'] = self.headers['Last-Modified']
+        return validators
+
+    def to_response(self, request: requests.PreparedRequest, stale: bool = False) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        if stale:
+            response.headers['Warning'] = '110 - "Response is Stale"'
+        response._content = self.body_path.read_bytes()
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = self.url
+        response.request = request
+        response.from_cache = True
+        return response
+
+
+class HTTPCache:
+    def __init__(self, path: Path, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return self.path / f'{key}.json', self.path / f'{key}.body'
+
+    def get(self, url: str) -> CacheEntry | None:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            # Keeps track of the last use of the entry for the LRU eviction
+            os.utime(body_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return CacheEntry(
+            meta['url'], meta['status_code'], CaseInsensitiveDict(meta['headers']), meta['expires'], body_path
+        )
+
+    def store(self, url: str, response: requests.Response) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        self._write(body_path, response.content)
+        self._write_meta(meta_path, url, response.status_code, response.headers)
+        self.evict()
+        return
+
+    def refresh(self, entry: CacheEntry, response: requests.Response) -> CacheEntry:
+        '''Updates an entry from the headers of a `304 Not Modified` response.'''
+        for header, value in response.headers.items():
+            if header.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+                entry.headers[header] = value
+        entry.expires = get_expiry(entry.headers)
+        meta_path, _ = self._paths(entry.url)
+        self._write_meta(meta_path, entry.url, entry.status_code, entry.headers)
+        return entry
+
+    def _write_meta(self, meta_path: Path, url: str, status_code: int, headers: CaseInsensitiveDict) -> None:
+        meta = {
+            'url': url,
+            'status_code': status_code,
+            'headers': dict(headers),
+            'expires': get_expiry(headers),
+        }
+        self._write(meta_path, json.dumps(meta).encode('utf8'))
+        return
+
+    def _write(self, path: Path, data: bytes) -> None:
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return
+
+    def evict(self) -> None:
+        '''Removes the least recently used entries until the cache fits in its maximum size.'''
+        bodies = []
+        for body_path in self.path.glob('*.body'):
+            try:
+                stat = body_path.stat()
+            except FileNotFoundError:
+                continue
+            bodies.append((stat.st_mtime, stat.st_size, body_path))
+        total_size = sum(size for _, size, _ in bodies)
+        for _, size, body_path in sorted(bodies):
+            if total_size <= self.max_size:
+                break
+            body_path.with_suffix('.json').unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+            total_size -= size
+        return
+
+    def clear(self) -> None:
+        for path in self.path.glob('*'):
+            path.unlink(missing_ok=True)
+        return
@@ -0,0 +1,242 @@
+'''
+Lazy command tree of the CLI, rebuilt from cached command descriptions.
+
+The descriptions are the ones produced by `dogeek_cli.meta.make_group` : the
+click objects are created from them without introspecting the functions they
+describe. Callbacks are only resolved, and plugins only imported, when a
+command is dispatched.
+'''
+import importlib
+from typing import Any, Callable
+
+import click
+import typer
+from typer.core import TyperArgument, TyperCommand, TyperGroup, TyperOption
+from typer.main import (
+    get_callback, get_command_from_info, get_command_name,
+    get_install_completion_arguments, get_params_convertors_ctx_param_name_from_function,
+    solve_typer_info_defaults,
+)
+from typer.models import CommandInfo, TyperInfo
+
+from dogeek_cli.plugin import Plugin
+
+
+PARAM_TYPES: dict[str, Callable[[dict], click.ParamType]] = {
+    'String': lambda info: click.STRING,
+    'Integer': lambda info: click.INT,
+    'Float': lambda info: click.FLOAT,
+    'Bool': lambda info: click.BOOL,
+    'UUID': lambda info: click.UUID,
+    'Choice': lambda info: click.Choice(info['choices'], info['case_sensitive']),
+    'IntRange': lambda info: click.IntRange(
+        info['min'], info['max'], info['min_open'], info['max_open'], info['clamp']
+    ),
+    'FloatRange': lambda info: click.FloatRange(
+        info['min'], info['max'], info['min_open'], info['max_open'], info['clamp']
+    ),
+    'DateTime': lambda info: click.DateTime(info['formats']),
+    'Path': lambda info: click.Path(
+        exists=info['exists'], file_okay=info['file_okay'], dir_okay=info['dir_okay'],
+        writable=info['writable'], readable=info['readable'], allow_dash=info['allow_dash'],
+    ),
+    'File': lambda info: click.File(info['mode'], info['encoding']),
+    'Tuple': lambda info: click.Tuple([make_param_type(t) for t in info['types']]),
+}
+
+
+def make_param_type(info: dict) -> click.ParamType:
+    factory = PARAM_TYPES.get(info['param_type'])
+    if factory is None:
+        # Custom parameter types can't be rebuilt, and are only used for display anyways.
+        return click.STRING
+    return factory(info)
+
+
+def make_param(info: dict) -> click.Parameter:
+    '''Rebuilds a click parameter from its info dict.'''
+    if info['param_type_name'] == 'argument':
+        return TyperArgument(
+            param_decls=[info['name']],
+            type=make_param_type(info['type']),
+            required=info['required'],
+            default=info['default'],
+            nargs=info['nargs'],
+            metavar=info.get('metavar'),
+            envvar=info['envvar'],
+            help=info.get('help'),
+            hidden=info.get('hidden') or False,
+            show_default=info.get('show_default', True),
+            rich_help_panel=info.get('rich_help_panel'),
+        )
+
+    opts = list(info['opts'])
+    for i, secondary_opt in enumerate(info['secondary_opts']):
+        opts[i] = f'{opts[i]}/{secondary_opt}'
+    return TyperOption(
+        param_decls=[info['name'], *opts],
+        type=None if info['is_flag'] or info['count'] else make_param_type(info['type']),
+        required=info['required'],
+        default=info['default'],
+        nargs=info['nargs'],
+        metavar=info.get('metavar'),
+        envvar=info['envvar'],
+        multiple=info['multiple'],
+        is_flag=info['is_flag'] or None,
+        count=info['count'],
+        prompt=info['prompt'] or False,
+        help=info['help'],
+        hidden=info['hidden'],
+        show_default=info.get('show_default') or False,
+        rich_help_panel=info.get('rich_help_panel'),
+    )
+
+
+def resolve_typer_info(origin: dict, path: list[str]) -> TyperInfo:
+    '''Finds the typer group described by `origin` and `path`, importing its module.'''
+    if 'plugin' in origin:
+        typer_app: typer.Typer = Plugin(origin['plugin']).typer_app
+        typer_info = TyperInfo(typer_app, name=origin['name'], help=origin['help'])
+    else:
+        typer_app = getattr(importlib.import_module(origin['module']), origin['attr'])
+        typer_info = TyperInfo(typer_app, **{key: origin[key] for key in ('name', 'help') if key in origin})
+
+    for name in path:
+        for group_info in typer_info.typer_instance.registered_groups:
+            if solve_typer_info_defaults(group_info).name == name:
+                typer_info = group_info
+                break
+        else:
+            raise LookupError(f'Group {name} not found in {typer_info.typer_instance}.')
+    return typer_info
+
+
+def resolve_command_info(group_info: TyperInfo, name: str) -> CommandInfo:
+    for command_info in group_info.typer_instance.registered_commands:
+        if (command_info.name or get_command_name(command_info.callback.__name__)) == name:
+            return command_info
+    raise LookupError(f'Command {name} not found in {group_info.typer_instance}.')
+
+
+class LazyCommand(TyperCommand):
+    '''
+    Command rebuilt from its cached description.
+
+    Its actual click command is only built, from the function it describes,
+    when the command is dispatched.
+    '''
+
+    def __init__(self, node: dict, origin: dict, path: list[str]) -> None:
+        super().__init__(
+            node['name'],
+            help=node['help'],
+            short_help=node.get('short_help'),
+            hidden=node.get('hidden') or False,
+            params=[make_param(info) for info in node['params']],
+        )
+        self.origin = origin
+        self.path = path
+        self._command = None
+
+    def load(self) -> click.Command:
+        '''Imports and introspects the command's callback to build the actual command.'''
+        if self._command is not None:
+            return self._command
+        group_info = resolve_typer_info(self.origin, self.path)
+        self._command = get_command_from_info(
+            resolve_command_info(group_info, self.name),
+            pretty_exceptions_short=group_info.typer_instance.pretty_exceptions_short,
+            rich_markup_mode=group_info.typer_instance.rich_markup_mode,
+        )
+        return self._command
+
+    def make_context(
+        self, info_name: str | None, args: list[str],
+        parent: click.Context | None = None, **extra: Any
+    ) -> click.Context:
+        return self.load().make_context(info_name, args, parent=parent, **extra)
+
+
+class LazyGroup(TyperGroup):
+    '''
+    Command group rebuilt from its cached description.
+
+    Subcommands are only built when looked up, and the group's callback is
+    only resolved when the group is invoked.
+    '''
+
+    def __init__(self, node: dict, origin: dict, path: list[str], is_root: bool = False) -> None:
+        callback = node.get('callback') or {'params': []}
+        super().__init__(
+            name=node['name'],
+            help=node['help'],
+            short_help=node.get('short_help'),
+            hidden=node.get('hidden') or False,
+            params=[make_param(info) for info in callback['params']],
+        )
+        self.origin = origin
+        self.path = path
+        self.nodes: dict[str, dict] = {}
+        for child in node['commands'] + node['groups']:
+            self.nodes[child['name']] = child
+        self.is_root = is_root
+        self.has_callback = node.get('callback') is not None
+        self._loaded = False
+
+    def load(self) -> None:
+        '''Imports and introspects the group's callback.'''
+        if self._loaded:
+            return
+        group_info = resolve_typer_info(self.origin, self.path)
+        solved = solve_typer_info_defaults(group_info)
+        params, convertors, context_param_name = get_params_convertors_ctx_param_name_from_function(
+            solved.callback
+        )
+        self.callback = get_callback(
+            callback=solved.callback,
+            params=params,
+            convertors=convertors,
+            context_param_name=context_param_name,
+            pretty_exceptions_short=group_info.typer_instance.pretty_exceptions_short,
+        )
+        if self.is_root and group_info.typer_instance._add_completion:
+            params.extend(get_install_completion_arguments())
+        self.params = params
+        self._loaded = True
+        return
+
+    def make_context(
+        self, info_name: str | None, args: list[str],
+        parent: click.Context | None = None, **extra: Any
+    ) -> click.Context:
+        if self.is_root:
+            # The root's module is the CLI's own, loading it adds the completion options
+            self.load()
+        return super().make_context(info_name, args, parent=parent, **extra)
+
+    def invoke(self, ctx: click.Context) -> Any:
+        # Help and completion are answered from the description, without importing the group
+        if self.has_callback:
+            self.load()
+        return super().invoke(ctx)
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(self.nodes)
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.commands and cmd_name in self.nodes:
+            self.add_command(make_command(self.nodes[cmd_name], self.origin, self.path))
+        return super().get_command(ctx, cmd_name)
+
+
+def make_command(node: dict, origin: dict, path: list[str]) -> click.Command:
+    '''Makes a lazy click command out of the description of a command or group.'''
+    if 'plugin' in node or 'module' in node:
+        # Plugins and the CLI's subcommands are resolved from their own root
+        origin = {key: node[key] for key in ('plugin', 'module', 'attr') if key in node}
+        origin.update(name=node['name'], help=node['help'])
+        return LazyGroup(node, origin, [])
+    if 'groups' in node:
+        return LazyGroup(node, origin, path + [node['name']])
+    return LazyCommand(node, origin, path)
+
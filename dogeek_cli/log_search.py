@@ -0,0 +1,297 @@
+'''
+Search and live tail of the log files of a logger.
+
+Every log file has a small search index next to it : the timestamps of its
+first and last records, the levels it contains, and the timestamp of a
+record every `MARK_INTERVAL` bytes. Searches bounded in time or by level
+skip the files, and the byte ranges of the files, which can't contain
+matching records, and scan the rest with regular expressions over
+memory-mapped files. Compressed archives are searched in memory, as they
+are bounded by `app.logger.max_file_size`.
+
+Timestamps are compared as strings, in the format of the log records.
+'''
+import ctypes
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import gzip
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import re
+import select
+import time
+from typing import Iterator
+
+from dogeek_cli.config import logs_path
+from dogeek_cli.logging import latest_log, read_index, search_index_path
+
+# A record starts with its timestamp and level, its next lines are part of it (tracebacks)
+RECORD_START = re.compile(rb'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) -- ([A-Z]+) : ', re.M)
+LEVEL_NAMES = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# Distance between two timestamps of the search index, in bytes
+MARK_INTERVAL = 64 * 1024
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Time between two checks of the followed file, without inotify
+POLL_INTERVAL = 0.5
+
+
+@dataclass
+class Query:
+    pattern: re.Pattern | None = None
+    since: bytes | None = None
+    until: bytes | None = None
+    levels: frozenset[bytes] = frozenset(name.encode('ascii') for name in LEVEL_NAMES)
+
+    def matches(self, timestamp: bytes | None, level: bytes | None) -> bool:
+        if timestamp is None:
+            # Lines logged before the first record of the file
+            return self.since is None and self.until is None
+        return (
+            (self.since is None or timestamp >= self.since)
+            and (self.until is None or timestamp <= self.until)
+            and level in self.levels
+        )
+
+    def may_match(self, index: dict) -> bool:
+        '''Checks if a file may contain matching records, from its search index.'''
+        if index['first'] is None:
+            return False
+        return (
+            (self.since is None or index['last'] >= self.since.decode('ascii'))
+            and (self.until is None or index['first'] <= self.until.decode('ascii'))
+            and any(level.encode('ascii') in self.levels for level in index['levels'])
+        )
+
+
+def parse_time(value: str) -> bytes:
+    '''Converts an ISO date, or a duration before now (30s, 15m, 2h, 7d), to the records' format.'''
+    if match := re.fullmatch(r'(\d+)([smhd])', value):
+        moment = datetime.now() - timedelta(seconds=int(match[1]) * DURATION_UNITS[match[2]])
+    else:
+        moment = datetime.fromisoformat(value)
+    return f'{moment:%Y-%m-%d %H:%M:%S},{moment.microsecond // 1000:03d}'.encode('ascii')
+
+
+def make_query(
+    pattern: str | None = None, since: str | None = None, until: str | None = None, level: int = logging.DEBUG,
+) -> Query:
+    '''Raises ValueError if the pattern or the dates are invalid.'''
+    try:
+        compiled_pattern = re.compile(pattern.encode('utf8')) if pattern is not None else None
+    except re.error as e:
+        raise ValueError(f'Invalid pattern {pattern!r} : {e}')
+    return Query(
+        compiled_pattern,
+        parse_time(since) if since is not None else None,
+        parse_time(until) if until is not None else None,
+        frozenset(name.encode('ascii') for name in LEVEL_NAMES if logging.getLevelName(name) >= level),
+    )
+
+
+def update_index(buffer: bytes | mmap.mmap, index: dict | None) -> dict:
+    '''Indexes the records of `buffer` which aren't already in `index`.'''
+    if index is None:
+        index = {'first': None, 'last': None, 'levels': [], 'marks': [], 'length': 0}
+    start = index['length']
+    if index['first'] is None and (match := RECORD_START.search(buffer)):
+        index['first'] = match[1].decode('ascii')
+
+    offset = index['marks'][-1][1] + MARK_INTERVAL if index['marks'] else 0
+    while offset < len(buffer) and (match := RECORD_START.search(buffer, offset)):
+        index['marks'].append([match[1].decode('ascii'), match.start()])
+        offset = match.start() + MARK_INTERVAL
+
+    last_line = buffer.rfind(b'\n', 0, max(len(buffer) - 1, 0)) + 1
+    while last_line > start and not RECORD_START.match(buffer, last_line):
+        last_line = buffer.rfind(b'\n', 0, max(last_line - 1, 0)) + 1
+    if match := RECORD_START.match(buffer, last_line):
+        index['last'] = match[1].decode('ascii')
+
+    for level in LEVEL_NAMES:
+        if level not in index['levels'] and buffer.find(f' -- {level} : '.encode('ascii'), start) != -1:
+            index['levels'].append(level)
+    index['length'] = len(buffer)
+    return index
+
+
+def load_index(path: Path, buffer: bytes | mmap.mmap) -> dict:
+    '''Returns the search index of a log file, built or updated if the file changed.'''
+    index_path = search_index_path(path)
+    stat = path.stat()
+    try:
+        index = json.loads(index_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = None
+    if index is not None and index.get('inode') == stat.st_ino and index.get('size') == stat.st_size:
+        return index
+    if index is not None and (
+        index.get('inode') != stat.st_ino or index['size'] > stat.st_size or path.suffix == '.gz'
+    ):
+        # Another file under the same name
+        index = None
+    index = update_index(buffer, index)
+    index.update(inode=stat.st_ino, size=stat.st_size)
+    tmp_path = index_path.with_name(f'{index_path.name}.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(index))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def byte_range(index: dict, query: Query) -> tuple[int, int]:
+    '''Returns the range of bytes of a file which may contain records matching `query`.'''
+    start, end = 0, index['length']
+    marks = index['marks']
+    if query.since is not None:
+        since = query.since.decode('ascii')
+        # The records between two marks are before the second one
+        for (timestamp, _), (_, offset) in zip(marks[1:], marks):
+            if timestamp >= since:
+                break
+            start = offset
+    if query.until is not None:
+        until = query.until.decode('ascii')
+        for timestamp, offset in marks:
+            if timestamp > until:
+                end = offset
+                break
+    return start, max(start, end)
+
+
+def record_start(buffer: bytes | mmap.mmap, position: int, start: int) -> int:
+    '''Returns the start of the record containing `position`.'''
+    line = buffer.rfind(b'\n', start, position) + 1 or start
+    while line > start and not RECORD_START.match(buffer, line):
+        line = buffer.rfind(b'\n', start, line - 1) + 1 or start
+    return line
+
+
+def iter_records(buffer: bytes | mmap.mmap, start: int, end: int, query: Query) -> Iterator[bytes]:
+    '''Yields the records of `buffer[start:end]` matching `query`.'''
+    position = start
+    while position < end:
+        if query.pattern is not None:
+            if (match := query.pattern.search(buffer, position, end)) is None:
+                return
+            position = record_start(buffer, match.start(), position)
+            next_record = RECORD_START.search(buffer, max(match.end(), position + 1), end)
+        else:
+            next_record = RECORD_START.search(buffer, position + 1, end)
+        record_end = next_record.start() if next_record is not None else end
+        header = RECORD_START.match(buffer, position)
+        if query.matches(header and header[1], header and header[2]):
+            yield buffer[position:record_end]
+        position = record_end
+    return
+
+
+def search_file(path: Path, query: Query) -> Iterator[bytes]:
+    if path.suffix == '.gz':
+        try:
+            index = json.loads(search_index_path(path).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = None
+        if index is not None and index.get('size') == path.stat().st_size and not query.may_match(index):
+            return
+        buffer = gzip.decompress(path.read_bytes())
+        index = load_index(path, buffer)
+        if query.may_match(index):
+            yield from iter_records(buffer, *byte_range(index, query), query)
+        return
+
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            index = load_index(path, buffer)
+            if query.may_match(index):
+                yield from iter_records(buffer, *byte_range(index, query), query)
+    return
+
+
+def search(logger_name: str, query: Query) -> Iterator[bytes]:
+    '''Yields the records of a logger matching `query`, from the oldest to the newest.'''
+    directory = logs_path / logger_name
+    for filename in read_index(directory):
+        try:
+            yield from search_file(directory / filename, query)
+        except FileNotFoundError:
+            # Rotated or removed in the meantime
+            continue
+    return
+
+
+class Watcher:
+    '''Waits for changes in a directory, with inotify on Linux and by polling elsewhere.'''
+    # IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENTS = 0x002 | 0x040 | 0x080 | 0x100 | 0x200
+
+    def __init__(self, path: Path) -> None:
+        self.fd = -1
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError):
+            return
+        if fd >= 0 and libc.inotify_add_watch(fd, bytes(path), self.EVENTS) >= 0:
+            self.fd = fd
+        elif fd >= 0:
+            os.close(fd)
+        return
+
+    def wait(self, timeout: float) -> None:
+        if self.fd < 0:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # The events only wake the follower up, they don't need to be parsed
+            while True:
+                try:
+                    os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    break
+        return
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+        return
+
+
+def follow(logger_name: str, query: Query) -> Iterator[bytes]:
+    '''Yields the records of a logger matching `query` as they are logged, following the rotations.'''
+    directory = logs_path / logger_name
+    directory.mkdir(parents=True, exist_ok=True)
+    watcher = Watcher(directory)
+    path, fp, pending = None, None, b''
+    # Only the records logged from now on are followed, then the next files are read from their start
+    from_start = False
+    try:
+        while True:
+            latest = latest_log(logger_name)
+            if fp is None and latest is not None and latest.suffix == '.log':
+                path, fp = latest, open(latest, 'rb')
+                if not from_start:
+                    fp.seek(0, os.SEEK_END)
+            if fp is not None:
+                pending += fp.read()
+                complete = pending.rfind(b'\n') + 1
+                yield from iter_records(pending, 0, complete, query)
+                pending = pending[complete:]
+                try:
+                    rotated = os.stat(path).st_ino != os.fstat(fp.fileno()).st_ino or latest != path
+                except FileNotFoundError:
+                    rotated = True
+                if rotated:
+                    # The rest of the file was read
+                    fp.close()
+                    fp, pending, from_start = None, b'', True
+                    continue
+            watcher.wait(1)
+    finally:
+        if fp is not None:
+            fp.close()
+        watcher.close()
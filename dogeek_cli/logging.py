@@ -1,31 +1,255 @@
+'''
+Logging of the CLI and its plugins, in a daily file per logger.
+
+Loggers don't write to their files themselves : the records are put in a
+queue, and written by a single listener thread, which opens the files when
+their first record is written. Nothing touches the filesystem until a
+record passes its logger's level.
+
+A logger's file is rotated when it exceeds `app.logger.max_file_size`, or
+when the day changes. Rotated files are compressed in background threads,
+and the oldest ones are removed when the logger's files exceed
+`app.logger.max_total_size`, or are older than `app.logger.max_age`. The
+files of each logger are listed, oldest first, in an index in its directory.
+'''
+import atexit
 from datetime import datetime
+import gzip
+import json
 import logging
 import logging.handlers
+import os
+from pathlib import Path
+import queue
+import shutil
+import threading
+import time
+from typing import ContextManager
+
+from dogeek_cli.config import config, file_lock, logs_path
+
+FORMAT = '%(asctime)s -- %(levelname)s : %(module)s::%(funcName)s -- %(message)s'
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warn': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+    'fatal': logging.FATAL
+}
+INDEX_NAME = 'index.json'
+
+
+def index_lock(path: Path) -> ContextManager[None]:
+    return file_lock(path / f'.{INDEX_NAME}.lock')
+
+
+def sort_key(filename: str) -> tuple[str, float]:
+    '''Sorts the log files by day, the rotated parts of a day before its current file.'''
+    stem = filename.removesuffix('.gz').removesuffix('.log')
+    _, _, part = stem.rpartition('.')
+    return filename[:10], int(part) if part.isdigit() else float('inf')
+
+
+def read_index(path: Path) -> list[str]:
+    '''Returns the log files of a logger's directory, from the oldest to the newest.'''
+    try:
+        return json.loads((path / INDEX_NAME).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        # Directories written before the index was
+        return sorted(
+            (fp.name for fp in path.glob('*.log*') if fp.name.endswith(('.log', '.log.gz'))),
+            key=sort_key,
+        )
+
+
+def write_index(path: Path, files: list[str]) -> None:
+    tmp_path = path / f'.{INDEX_NAME}.{os.getpid()}.tmp'
+    tmp_path.write_text(json.dumps(sorted(set(files), key=sort_key), indent=2))
+    os.replace(tmp_path, path / INDEX_NAME)
+    return
+
+
+def search_index_path(path: Path) -> Path:
+    '''Returns the path of the search index of a log file, see `dogeek_cli.log_search`.'''
+    return path.with_name(f'.{path.name}.idx')
+
+
+def latest_log(logger_name: str) -> Path | None:
+    '''Returns the newest log file of a logger, without listing its directory.'''
+    files = read_index(logs_path / logger_name)
+    return logs_path / logger_name / files[-1] if files else None
+
+
+class LogFilesHandler(logging.Handler):
+    '''Writes the records to the daily file of their logger, opened on its first record.'''
 
-from dogeek_cli.config import config, logs_path
+    def __init__(self) -> None:
+        super().__init__()
+        self.setFormatter(logging.Formatter(FORMAT))
+        self.max_file_size: int = config['app.logger.max_file_size']
+        self.max_total_size: int = config['app.logger.max_total_size']
+        self.max_age: float = config['app.logger.max_age']
+        # The day and handler of each logger's current file
+        self.files: dict[str, tuple[str, logging.handlers.WatchedFileHandler]] = {}
+        self.compressions: list[threading.Thread] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        day = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d')
+        current_day, handler = self.files.get(record.name, (None, None))
+        if current_day != day:
+            if handler is not None:
+                # The file is rotated when the next day's one is opened
+                handler.close()
+            handler = self.open(record.name, day)
+        # Reopens the file if another process rotated it
+        handler.reopenIfNeeded()
+        if os.fstat(handler.stream.fileno()).st_size >= self.max_file_size:
+            path = Path(handler.baseFilename)
+            # The parts of a day are named after the time they were rotated at
+            part = datetime.fromtimestamp(record.created).strftime('%H%M%S%f')
+            self.rotate(path, f'{path.stem}.{part}.log.gz')
+            handler.reopenIfNeeded()
+        handler.handle(record)
+        return
+
+    def open(self, logger_name: str, day: str) -> logging.handlers.WatchedFileHandler:
+        path = logs_path / logger_name / f'{day}-{logger_name}.log'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.WatchedFileHandler(path, 'a', 'utf8')
+        handler.setFormatter(self.formatter)
+        self.files[logger_name] = (day, handler)
+        with index_lock(path.parent):
+            files = read_index(path.parent)
+            if path.name not in files or not (path.parent / INDEX_NAME).exists():
+                write_index(path.parent, [*files, path.name])
+        for filename in files:
+            if filename.endswith('.log') and filename != path.name:
+                # The files of the previous days, written by this process or by exited ones
+                self.rotate(path.parent / filename, f'{filename}.gz')
+        return handler
+
+    def rotate(self, path: Path, archived_name: str) -> None:
+        '''Moves a log file aside, and compresses it in the background.'''
+        rotated_path = path.with_name(f'.{archived_name}.{os.getpid()}.rotating')
+        try:
+            # Only one of the processes writing to the file rotates it
+            os.rename(path, rotated_path)
+        except FileNotFoundError:
+            return
+        thread = threading.Thread(
+            target=self.compress, args=(rotated_path, path.name, archived_name), name='log-compression',
+        )
+        thread.start()
+        self.compressions = [compression for compression in self.compressions if compression.is_alive()]
+        self.compressions.append(thread)
+        return
+
+    def compress(self, rotated_path: Path, filename: str, archived_name: str) -> None:
+        directory = rotated_path.parent
+        tmp_path = directory / f'.{archived_name}.{os.getpid()}.tmp'
+        try:
+            with open(rotated_path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            # The archive is as old as the logs it contains
+            stat = rotated_path.stat()
+            os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+            os.replace(tmp_path, directory / archived_name)
+            rotated_path.unlink()
+            if archived_name == f'{filename}.gz':
+                # The file of a previous day won't be written to again
+                search_index_path(directory / filename).unlink(missing_ok=True)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with index_lock(directory):
+            # The file of a previous day is replaced by its archive
+            files = [f for f in read_index(directory) if f != filename or archived_name != f'{filename}.gz']
+            write_index(directory, self.prune(directory, [*files, archived_name]))
+        return
+
+    def prune(self, directory: Path, files: list[str]) -> list[str]:
+        '''Removes the oldest log files, returns the remaining ones.'''
+        files = sorted(files, key=sort_key)
+        stats = {}
+        for filename in files:
+            try:
+                stats[filename] = (directory / filename).stat()
+            except FileNotFoundError:
+                continue
+        total_size = sum(stat.st_size for stat in stats.values())
+        expired = time.time() - self.max_age
+        # The newest file is the one being written to
+        for filename in files[:-1]:
+            if filename not in stats:
+                continue
+            if total_size <= self.max_total_size and stats[filename].st_mtime >= expired:
+                continue
+            (directory / filename).unlink(missing_ok=True)
+            search_index_path(directory / filename).unlink(missing_ok=True)
+            total_size -= stats.pop(filename).st_size
+        # The current file is missing while it is being rotated
+        return [filename for filename in files if filename in stats or filename == files[-1]]
+
+    def close(self) -> None:
+        for _, handler in self.files.values():
+            handler.close()
+        self.files.clear()
+        for thread in self.compressions:
+            thread.join()
+        super().close()
+        return
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    '''Hands the records over to the listener thread, started on the first record.'''
+
+    def __init__(self) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.listener: logging.handlers.QueueListener | None = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.listener is None:
+            self.start()
+        super().enqueue(record)
+        return
+
+    def start(self) -> None:
+        with self._lock:
+            if self.listener is not None:
+                return
+            listener = logging.handlers.QueueListener(self.queue, LogFilesHandler())
+            listener.start()
+            # Writes the pending records before exiting
+            atexit.register(self.stop, listener)
+            self.listener = listener
+        return
+
+    def stop(self, listener: logging.handlers.QueueListener) -> None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        return
+
+    def reset(self) -> None:
+        '''Drops the listener inherited by a forked process, as its thread isn't running there.'''
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self._lock = threading.Lock()
+        return
+
+
+# Shared by all the loggers
+queue_handler = QueueHandler()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=queue_handler.reset)
 
 
 class Logger(logging.Logger):
     def __init__(self, name: str):
         level: str = config['app.logger.level'] or 'debug'
-        level = {
-            'debug': logging.DEBUG,
-            'info': logging.INFO,
-            'warn': logging.WARNING,
-            'error': logging.ERROR,
-            'critical': logging.CRITICAL,
-            'fatal': logging.FATAL
-        }[level.lower()]
-        path = (
-            logs_path / name /
-            f"{datetime.now().strftime('%Y-%m-%d')}-{name}.log"
-        )
-        (logs_path / name).mkdir(parents=True, exist_ok=True)
-        handler = logging.FileHandler(path, 'a', 'utf8')
-        formatter = logging.Formatter(
-            '%(asctime)s -- %(levelname)s : %(module)s::%(funcName)s -- %(message)s'
-        )
-        handler.setFormatter(formatter)
-        super().__init__(name, level)
-        self.addHandler(handler)
+        super().__init__(name, LEVELS[level.lower()])
+        self.addHandler(queue_handler)
         self.logger_name = name
@@ -1,25 +1,35 @@
+import inspect
 from typing import Any, Dict, Union, List, Optional
 
 from typer.models import CommandInfo, TyperInfo, DefaultPlaceholder
-from typer.main import get_click_param
+from typer.main import get_click_param, solve_typer_info_defaults
 from typer.utils import get_params_from_function
 from typer.core import TyperArgument, TyperOption
 
 
+# Attributes needed to render a parameter which are not part of click's info dict.
+PARAM_EXTRA_ATTRIBUTES = ('help', 'hidden', 'metavar', 'show_default', 'show_choices', 'rich_help_panel')
+
+
 def format_params(params: List[Union[TyperOption, TyperArgument]]) -> Dict[str, List[Dict[str, Any]]]:
     for param in params:
-        yield param.to_info_dict()
+        info = param.to_info_dict()
+        for attribute in PARAM_EXTRA_ATTRIBUTES:
+            info.setdefault(attribute, getattr(param, attribute, None))
+        yield info
 
 
 def make_cmd(command: CommandInfo):
     name = (command.name or command.callback.__name__).lower().replace('_', '-')
-    help = command.help or command.callback.__doc__
+    help = command.help or inspect.getdoc(command.callback)
     params = get_params_from_function(command.callback)
     click_params = [get_click_param(p)[0] for p in params.values()]
 
     return {
         'name': name,
         'help': help,
+        'short_help': command.short_help,
+        'hidden': command.hidden,
         'params': list(format_params(click_params)),
     }
 
@@ -41,3 +51,17 @@ def make_callback(callback: Optional[TyperInfo]):
         'help': help,
         'params': list(format_params(click_params))
     }
+
+
+def make_group(group: TyperInfo):
+    '''Describes a typer group, its callback, commands and subgroups recursively.'''
+    solved = solve_typer_info_defaults(group)
+    return {
+        'name': solved.name,
+        'help': solved.help,
+        'short_help': solved.short_help,
+        'hidden': solved.hidden,
+        'callback': make_callback(solved) if solved.callback is not None else None,
+        'commands': [make_cmd(command) for command in group.typer_instance.registered_commands],
+        'groups': [make_group(sub_group) for sub_group in group.typer_instance.registered_groups],
+    }
@@ -1,28 +1,120 @@
 from base64 import b85encode, b85decode
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from http import HTTPStatus
+import hashlib
 import importlib.util
 import os
 from pathlib import Path
 import json
 import shutil
 import sys
-from urllib.parse import urlparse
-import gzip
 import io
 import tarfile
 import secrets
+import tempfile
 import textwrap
 from types import ModuleType
+from typing import BinaryIO, TYPE_CHECKING
 
-from gitignore_parser import parse_gitignore
 import typer
+from typer.models import TyperInfo
 
-from dogeek_cli.client import Client
 from dogeek_cli.config import plugins_registry, plugins_path, config, tmp_dir
 from dogeek_cli.logging import Logger
 from dogeek_cli.utils import clean_help_string, cliignore_filter_factory
-from dogeek_cli.meta import make_cmd, make_callback
+from dogeek_cli.meta import make_group
+from dogeek_cli.snapshot import fingerprint_path, hash_path, iter_files
+from dogeek_cli.static_meta import StaticAnalysisError, describe
+from dogeek_cli.store import store
+
+if TYPE_CHECKING:
+    import requests
+
+    from dogeek_cli.client import Client
+
+latest_versions_path: Path = tmp_dir / 'latest_versions.json'
+archives_path: Path = tmp_dir / 'archives'
+# Size of the chunks read from streamed plugin archives
+CHUNK_SIZE = 64 * 1024
+
+
+def plugin_name_from_path(module_path: Path) -> str:
+    return module_path.name.split('.')[0] if not module_path.is_dir() else module_path.name
+
+
+def compression_level(path: Path) -> int:
+    '''Picks the gzip level of a plugin's archive: small plugins are cheap to compress harder.'''
+    files = path.rglob('*') if path.is_dir() else [path]
+    size = sum(fp.stat().st_size for fp in files if fp.is_file())
+    if size < 1024 * 1024:
+        return 9
+    if size < 16 * 1024 * 1024:
+        return 6
+    return 3
+
+
+def sha256_file(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while chunk := fp.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def check_member(member: tarfile.TarInfo, staging_path: Path) -> None:
+    '''Rejects the members of an archive which aren't plain files or directories inside `staging_path`.'''
+    if not (member.isfile() or member.isdir()):
+        raise tarfile.TarError(f'Unsafe member {member.name!r} in the archive : links and devices are rejected')
+    if not (staging_path / member.name).resolve().is_relative_to(staging_path.resolve()):
+        raise tarfile.TarError(f'Unsafe member {member.name!r} in the archive : it is outside of the plugin')
+    return
+
+
+def extract_archive(fileobj: BinaryIO, staging_path: Path) -> str | None:
+    '''
+    Extracts a gzipped tarball as it is read, returns the name of the plugin's file or directory.
+
+    Raises TarError before writing a member outside of `staging_path`.
+    '''
+    # The data filter also drops the permissions which aren't needed, on the versions of python which have it
+    extract_options = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+    filename = None
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+        for member in archive:
+            check_member(member, staging_path)
+            filename = filename or Path(member.name).parts[0]
+            archive.extract(member, staging_path, **extract_options)
+    return filename
+
+
+def extract_stored_archive(sha256: str, staging_path: Path) -> str | None:
+    '''Extracts an archive of the artifact store, in a worker process of bulk upgrades.'''
+    with open(store.archive_path(sha256), 'rb') as fp:
+        return extract_archive(fp, staging_path)
+
+
+class HashingReader:
+    '''File-like wrapper computing the SHA-256 of the data read through it, and copying it to `sink`.'''
+
+    def __init__(self, fileobj: BinaryIO, sink: BinaryIO | None = None) -> None:
+        self.fileobj = fileobj
+        self.sink = sink
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        if self.sink is not None:
+            self.sink.write(data)
+        return data
+
+    def drain(self) -> None:
+        '''Reads the rest of the file, so that the digest covers all of it.'''
+        while self.read(CHUNK_SIZE):
+            pass
+        return
 
 
 @dataclass
@@ -35,26 +127,41 @@ class Plugin:
     def __init__(self, plugin_name: str) -> None:
         self.plugin_name = plugin_name
         self._module = None
+        self._description = None
         self._client = None
+        # Path of a plugin described before its registry entry is made
+        self._path: Path | None = None
+        self._backups: list[tuple[Path, Path]] = []
 
     @property
     def exists(self):
         return (
             self.plugin_name in plugins_registry or
-            any(fp.name.split('.')[0] == self.plugin_name for fp in plugins_path.glob('*'))
+            (plugins_path / self.plugin_name).is_dir() or
+            (plugins_path / f'{self.plugin_name}.py').exists()
         )
 
     @property
-    def client(self) -> Client:
-        return Client(self.installed_from)
+    def client(self) -> 'Client':
+        # The client imports requests, which adds ~90ms to the startup
+        from dogeek_cli.client import clients
+
+        return clients[self.installed_from]
 
     @property
     def path(self) -> Path:
+        if self.plugin_name not in plugins_registry and self._path is not None:
+            return self._path
         return Path(plugins_registry[self.plugin_name]['path'])
 
     @path.setter
     def path(self, path: str | Path) -> None:
-        plugins_registry[self.plugin_name]['path'] = Path(path)
+        self._path = Path(path)
+        if self.plugin_name not in plugins_registry:
+            # Written with the rest of the entry
+            return
+        with plugins_registry.batch():
+            plugins_registry[self.plugin_name]['path'] = str(path)
         return
 
     @property
@@ -66,7 +173,8 @@ class Plugin:
 
     @is_dir.setter
     def is_dir(self, is_directory: bool) -> None:
-        plugins_registry[self.plugin_name]['is_dir'] = bool(is_directory)
+        with plugins_registry.batch():
+            plugins_registry[self.plugin_name]['is_dir'] = bool(is_directory)
         return
 
     @property
@@ -96,21 +204,30 @@ class Plugin:
     def installed_from(self, registry: str) -> None:
         if self.installed_from is not None:
             return
-        plugins_registry[self.plugin_name]['installed_from'] = registry
+        with plugins_registry.batch():
+            plugins_registry[self.plugin_name]['installed_from'] = registry
         return
 
     @property
     def upgrade_available(self) -> str:
+        if self.installed_from is None:
+            return self.upgrade_status(None)
+        return self.upgrade_status(self.client.get_latest_version(self.plugin_name))
+
+    def upgrade_status(self, latest_version: str | None) -> str:
+        '''Returns the symbol telling whether the plugin can be upgraded to `latest_version`.'''
         if self.installed_from is None:
             return '🔵'
+        if latest_version is None:
+            # The registry couldn't be reached
+            return '❔'
 
-        latest_version: str = self.client.get(
-            f'/v1/plugins/{self.plugin_name}/versions/latest'
-        ).json()['data']['version']
         latest_version: tuple[int] = tuple(int(c) for c in latest_version.split('.'))
         for i, (current, latest) in enumerate(zip(self.version, latest_version)):
             if current < latest:
                 return ['🔴', '🟠', '🟢'][i]
+            if current > latest:
+                break
         return '✅'
 
     @property
@@ -129,6 +246,10 @@ class Plugin:
     def module(self) -> ModuleType:
         if self._module is not None:
             return self._module
+        if f'plugins.{self.plugin_name}' in sys.modules:
+            # Already imported by another Plugin instance
+            self._module = sys.modules[f'plugins.{self.plugin_name}']
+            return self._module
         if self.path.is_dir():
             path = self.path / '__init__.py'
         else:
@@ -145,93 +266,368 @@ class Plugin:
         self._module = module
         return module
 
+    @property
+    def description(self) -> dict | None:
+        '''Describes the plugin from its source, None if it must be imported to be described.'''
+        if self._description is None:
+            try:
+                self._description = describe(self.path)
+            except StaticAnalysisError:
+                self._description = {}
+        return self._description or None
+
+    @property
+    def typer_app(self) -> typer.Typer:
+        '''Returns the typer.Typer instance exported by the plugin.'''
+        plugin_app = getattr(self.module, 'app', None)
+        if isinstance(plugin_app, typer.Typer):
+            return plugin_app
+        for variable_name in dir(self.module):
+            variable = getattr(self.module, variable_name)
+            if isinstance(variable, typer.Typer):
+                return variable
+        raise TypeError(f'Plugin {self.plugin_name} does not export a typer.Typer instance.')
+
+    @property
+    def meta(self) -> dict | None:
+        return plugins_registry.read_meta(self.plugin_name)
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint_path(self.path)
+
     @property
     def tarball(self) -> str:
-        output_filename = secrets.token_hex(8)
-        out_path = tmp_dir / output_filename
-        cliignore = None
-        if len(list(self.path.glob('**/.cliignore'))) > 0:
-            # There is a .cliignore file to process
-            cliignore = parse_gitignore(next(self.path.glob('**/.cliignore')))
-
-        with tarfile.open(out_path, "w:gz") as tar:
-            tar.add(
-                self.path,
-                arcname=os.path.basename(self.path),
-                recursive=True,
-                filter=cliignore_filter_factory(self.path, cliignore)
-            )
-
-        with open(out_path, 'rb') as fp:
-            data = fp.read()
-        os.remove(out_path)
-        return b85encode(data).decode('utf8')
+        '''The plugin's archive, base85 encoded for registries which only accept JSON.'''
+        archive_path, _ = self.build_archive()
+        return b85encode(archive_path.read_bytes()).decode('utf8')
+
+    def build_archive(self) -> tuple[Path, str]:
+        '''
+        Builds the gzipped tarball of the plugin, streamed to disk.
+
+        The archive is kept, keyed by the plugin's fingerprint, so that an
+        interrupted upload can be resumed with the same bytes. Returns its
+        path and SHA-256.
+        '''
+        from gitignore_parser import parse_gitignore
+
+        archives_path.mkdir(parents=True, exist_ok=True)
+        out_path = archives_path / f'{self.plugin_name}-{self.fingerprint[:16]}.tar.gz'
+        if not out_path.exists():
+            # Archives of previous versions of the plugin can't be resumed anymore
+            for stale_path in archives_path.glob(f'{self.plugin_name}-*.tar.gz'):
+                stale_path.unlink(missing_ok=True)
+            cliignore = None
+            if len(list(self.path.glob('**/.cliignore'))) > 0:
+                # There is a .cliignore file to process
+                cliignore = parse_gitignore(next(self.path.glob('**/.cliignore')))
+
+            tmp_path = out_path.with_suffix(f'.{secrets.token_hex(8)}.tmp')
+            with tarfile.open(tmp_path, 'w:gz', compresslevel=compression_level(self.path)) as tar:
+                tar.add(
+                    self.path,
+                    arcname=os.path.basename(self.path),
+                    recursive=True,
+                    filter=cliignore_filter_factory(self.path, cliignore)
+                )
+            os.replace(tmp_path, out_path)
+
+        return out_path, sha256_file(out_path)
 
     @property
     def short_help(self) -> str:
         return textwrap.shorten(self.metadata.help, 40)
 
     def cache_plugin_metadata(self, module_path: Path, installed_from: str | None) -> None:
-        plugin_name = (
-            module_path.name.split('.')[0]
-            if not module_path.is_dir()
-            else module_path.name
-        )
-        self.path = module_path
+        plugin_name = plugin_name_from_path(module_path)
+        with plugins_registry.batch(), config.batch():
+            self.path = module_path
+            self._description = None
+            plugins_registry[plugin_name] = self.make_entry(module_path, installed_from)
+            config[f'plugins.{plugin_name}.enabled'] = True
+        self.make_meta(force_update=True)
+        return
+
+    def make_entry(self, module_path: Path, installed_from: str | None) -> dict:
+        '''
+        Returns the entry of the plugin in the plugins registry.
+
+        The plugin is described from its source, and only imported if that fails.
+        '''
+        plugin_name = plugin_name_from_path(module_path)
+        description = self.description
+        if description is not None:
+            help_string = description['help']
+            metadata = description['metadata']
+            logger_name = description['logger'] or plugin_name
+            version = description['version']
+        else:
+            help_string = clean_help_string(self.module.__doc__)
+            metadata = getattr(self.module, 'metadata', {})
+            for variable_name in dir(self.module):
+                if isinstance(getattr(self.module, variable_name), Logger):
+                    logger_name = getattr(self.module, variable_name).logger_name
+                    break
+            else:
+                logger_name = plugin_name
+            version = getattr(self.module, '__version__', '1.0.0')
+
         default_metadata = {
-            'help': clean_help_string(self.module.__doc__),
+            'help': help_string,
             'name': plugin_name,
         }
-        metadata = getattr(self.module, 'metadata', {})
         for k, v in default_metadata.items():
             if k not in metadata:
                 metadata[k] = v
-
-        for variable_name in dir(self.module):
-            if isinstance(getattr(self.module, variable_name), Logger):
-                logger_name = getattr(self.module, variable_name).logger_name
-                break
-        else:
-            logger_name = plugin_name
-        plugins_registry[plugin_name] = {
+        return {
             'path': str(module_path),
             'is_dir': module_path.is_dir(),
             'logger': logger_name,
             'metadata': metadata,
-            'version': getattr(self.module, '__version__', '1.0.0'),
-            'installed_from': installed_from
+            'version': version,
+            'installed_from': installed_from,
+            'fingerprint': fingerprint_path(module_path),
+            'content_hash': hash_path(module_path),
         }
-        config[f'plugins.{plugin_name}.enabled'] = True
-        return
 
     def upgrade(self, new_version: str) -> int:
         if self.installed_from is None:
             print('Cannot upgrade a local plugin')
             return 1
+        if new_version != 'latest' and store.find(self.plugin_name, new_version) is not None:
+            return self.install_stored(new_version)
 
-        response = self.client.get(f'/v1/plugins/{self.plugin_name}/versions/{new_version}')
+        if self.is_dir:
+            return_code = self.upgrade_delta(new_version)
+            if return_code is not None:
+                return return_code
+
+        response = self.client.get(f'/v1/plugins/{self.plugin_name}/versions/{new_version}', stream=True)
         if response.status_code == HTTPStatus.NOT_FOUND:
             print(response.json()['detail'])
             return 1
 
-        self.remove_files()
-        # Install the new plugin version
-        return self.install(
-            response.json()['data']['file'],
-            urlparse(response.request.url).hostname
+        # Install the new plugin version, the current one is only replaced once it succeeded
+        return self.install_from_registry(self.installed_from, new_version, response)
+
+    def upgrade_delta(self, new_version: str) -> int | None:
+        '''
+        Upgrades a directory plugin by only downloading the files which changed.
+
+        The installed files are compared with the manifest of the new version,
+        and a staging copy of the plugin is patched, then swapped in. Returns
+        None if a full download is needed instead.
+        '''
+        manifest = self.client.get_manifest(self.plugin_name, new_version)
+        if manifest is None or not self.path.exists():
+            return None
+        files: dict[str, dict] = manifest['files']
+        if any(Path(path).parts[0] != self.path.name or '..' in Path(path).parts for path in files):
+            return None
+
+        local_files = {
+            filepath.relative_to(plugins_path).as_posix(): filepath for filepath in iter_files(self.path)
+        }
+        staging_path = Path(tempfile.mkdtemp(prefix='.install-', dir=plugins_path))
+        downloaded_size = 0
+        try:
+            new_path = staging_path / self.path.name
+            shutil.copytree(self.path, new_path, ignore=shutil.ignore_patterns('__pycache__'))
+            for path in set(local_files) - set(files):
+                (staging_path / path).unlink()
+            for path, file_ in files.items():
+                if path in local_files and sha256_file(local_files[path]) == file_['sha256']:
+                    continue
+                response = self.client.get_file(self.plugin_name, manifest['version'], path)
+                if response is None:
+                    return None
+                (staging_path / path).parent.mkdir(parents=True, exist_ok=True)
+                with response, open(staging_path / path, 'wb') as fp:
+                    response.raw.decode_content = True
+                    reader = HashingReader(response.raw, fp)
+                    reader.drain()
+                if reader.sha256.hexdigest() != file_['sha256']:
+                    print(f'Checksum mismatch for file {path} of plugin {self.plugin_name}, aborting.')
+                    return 1
+                downloaded_size += file_['size']
+            backup = self.backup_entry()
+            path = self.swap_in(new_path, staging_path)
+            if not self.cache_swapped_in(path, staging_path, self.installed_from, backup):
+                return 1
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+        total_size = sum(file_['size'] for file_ in files.values())
+        print(
+            f'Downloaded {downloaded_size} of {total_size} bytes '
+            f'({total_size - downloaded_size} bytes saved by the delta upgrade).'
         )
+        return 0
+
+    def install_from_registry(self, registry: str, version: str, response: 'requests.Response') -> int:
+        '''
+        Installs a plugin version found on a registry.
+
+        The archive is streamed if the registry serves it, otherwise it is
+        decoded from the plugin version's `response`.
+        '''
+        from dogeek_cli.client import clients, get_sha256
+
+        archive = clients[registry].get_archive(self.plugin_name, version)
+        if archive is None:
+            # Older registries only send the archive base85 encoded in the JSON body
+            return self.install(response.json()['data']['file'], registry)
+        response.close()
+        with archive:
+            archive.raw.decode_content = True
+            return self.install_archive(archive.raw, registry, get_sha256(archive.headers))
+
+    def fetch_archive(self, version: str) -> str | None:
+        '''Downloads the archive of a plugin version to the artifact store, returns its SHA-256.'''
+        from dogeek_cli.client import get_sha256
+
+        entry = store.find(self.plugin_name, version)
+        if entry is not None:
+            return entry['sha256']
+        archive = self.client.get_archive(self.plugin_name, version)
+        if archive is not None:
+            with archive:
+                archive.raw.decode_content = True
+                return store.put(archive.raw, get_sha256(archive.headers))
+
+        response = self.client.get(f'/v1/plugins/{self.plugin_name}/versions/{version}', stream=True)
+        if response.status_code != HTTPStatus.OK:
+            response.close()
+            return None
+        # Older registries only send the archive base85 encoded in the JSON body
+        return store.put(io.BytesIO(b85decode(response.json()['data']['file'])))
+
+    def install_stored(self, version: str) -> int:
+        '''Installs a plugin version from the artifact store, without the network.'''
+        entry = store.find(self.plugin_name, version)
+        if entry is None:
+            print(f'Plugin {self.plugin_name} v{version} is not available locally.')
+            return 1
+        with open(store.archive_path(entry['sha256']), 'rb') as fp:
+            return self.install_archive(fp, entry['registry'], entry['sha256'])
 
     def install(self, encoded_file: str, registry: str) -> int:
-        file_ = io.BytesIO(gzip.decompress(b85decode(encoded_file)))
-        archive = tarfile.TarFile(fileobj=file_)
-        archive.extractall(plugins_path)
-        filename = archive.getnames()[0]
-        archive.close()
-        self.cache_plugin_metadata(
-            plugins_path / filename, installed_from=registry
-        )
+        return self.install_archive(io.BytesIO(b85decode(encoded_file)), registry)
+
+    def install_archive(self, fileobj: BinaryIO, registry: str | None, sha256: str | None = None) -> int:
+        '''
+        Installs a plugin from a gzipped tarball, extracted as it is read.
+
+        The archive is extracted in a staging directory, and only swapped in
+        once its SHA-256 matches `sha256`. It is then kept in the artifact store.
+        '''
+        staging_path = Path(tempfile.mkdtemp(prefix='.install-', dir=plugins_path))
+        archive_path = store.tmp_path()
+        try:
+            with open(archive_path, 'wb') as sink:
+                reader = HashingReader(fileobj, sink)
+                try:
+                    filename = extract_archive(reader, staging_path)
+                except tarfile.TarError as e:
+                    print(f'Invalid archive for plugin {self.plugin_name} : {e}, aborting.')
+                    return 1
+                reader.drain()
+            archive_sha256 = reader.sha256.hexdigest()
+            if sha256 is not None and archive_sha256 != sha256:
+                print(f'Checksum mismatch for the archive of plugin {self.plugin_name}, aborting.')
+                return 1
+            if filename is None:
+                print(f'The archive of plugin {self.plugin_name} is empty, aborting.')
+                return 1
+            backup = self.backup_entry()
+            path = self.swap_in(staging_path / filename, staging_path)
+            # Before the backups of the previous version are removed with the staging directory
+            if not self.cache_swapped_in(path, staging_path, registry, backup):
+                return 1
+            store.add(archive_path, archive_sha256)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            archive_path.unlink(missing_ok=True)
+        store.record(self.plugin_name, self.version_string, archive_sha256, registry)
         return 0
 
+    def swap_in(self, new_path: Path, staging_path: Path) -> Path:
+        '''
+        Replaces the plugin's files with `new_path`, with renames only.
+
+        The current files are moved to `staging_path` first, and restored if
+        the new files can't be moved in.
+        '''
+        path = plugins_path / new_path.name
+        current_paths = {path}
+        if self.plugin_name in plugins_registry:
+            current_paths.add(self.path)
+        self._backups = []
+        for i, current_path in enumerate(current_paths):
+            if current_path.exists():
+                self._backups.append((current_path, staging_path / f'.previous-{i}'))
+                os.replace(*self._backups[-1])
+        try:
+            os.replace(new_path, path)
+        except OSError:
+            self.swap_out(None, staging_path)
+            raise
+        # The module of the previous version must not be reused
+        sys.modules.pop(f'plugins.{self.plugin_name}', None)
+        self._module = None
+        self._description = None
+        return path
+
+    def swap_out(self, path: Path | None, staging_path: Path) -> None:
+        '''Reverts `swap_in`, as long as `staging_path` wasn't removed.'''
+        if path is not None and path.exists():
+            os.replace(path, staging_path / '.reverted')
+        for current_path, backup_path in self._backups:
+            os.replace(backup_path, current_path)
+        self._backups = []
+        return
+
+    def backup_entry(self) -> tuple[dict | None, dict | None]:
+        '''Returns copies of the plugin's registry entry and command metadata, for `restore_entry`.'''
+        if self.plugin_name not in plugins_registry:
+            return None, None
+        entry = json.loads(json.dumps(plugins_registry[self.plugin_name], default=str))
+        return entry, plugins_registry.read_meta(self.plugin_name)
+
+    def restore_entry(self, backup: tuple[dict | None, dict | None]) -> None:
+        entry, meta = backup
+        if entry is None:
+            plugins_registry.pop(self.plugin_name, None)
+            plugins_registry.delete_meta(self.plugin_name)
+        else:
+            plugins_registry[self.plugin_name] = entry
+            if meta is not None:
+                plugins_registry.write_meta(self.plugin_name, meta)
+        sys.modules.pop(f'plugins.{self.plugin_name}', None)
+        self._module = None
+        self._description = None
+        self._path = None
+        return
+
+    def cache_swapped_in(
+        self, path: Path, staging_path: Path, installed_from: str | None, backup: tuple[dict | None, dict | None]
+    ) -> bool:
+        '''
+        Caches the metadata of the files swapped in by `swap_in`.
+
+        If the plugin can't be loaded, the previous version and its registry
+        entry are restored, and False is returned.
+        '''
+        try:
+            self.cache_plugin_metadata(path, installed_from=installed_from)
+        except Exception as e:
+            self.swap_out(path, staging_path)
+            self.restore_entry(backup)
+            print(f'Could not load plugin {self.plugin_name} : {e}, the install was reverted.')
+            return False
+        return True
+
     def remove_files(self) -> None:
         # Remove the current plugin
         if self.is_dir:
@@ -242,21 +638,63 @@ class Plugin:
 
     def uninstall(self) -> None:
         self.remove_files()
+        plugins_registry.delete_meta(self.plugin_name)
         del plugins_registry[self.plugin_name]
         return
 
     def make_meta(self, force_update: bool = False) -> None:
-        path = Path(config.app_path) / f'plugin_meta/{self.plugin_name}.meta'
-        path.parent.mkdir(exist_ok=True, parents=True)
-        if not force_update and path.exists():
+        cached_meta = None if force_update else self.meta
+        if cached_meta is not None and cached_meta.get('fingerprint') == self.fingerprint:
             return
 
-        app: typer.Typer = self.module.app
+        description = self.description
+        app: typer.Typer = description['app'] if description is not None else self.typer_app
         meta = vars(self.metadata)
+        meta.update(make_group(TyperInfo(app, name=meta['name'], help=meta['help'])))
+        meta['fingerprint'] = self.fingerprint
+
+        plugins_registry.write_meta(self.plugin_name, meta)
+
+
+def fetch_latest_versions(plugins: list[Plugin], max_workers: int = 8) -> dict[str, str | None]:
+    '''
+    Fetches the latest version of the plugins installed from a registry.
+
+    Each registry is asked for all of its plugins at once if it supports it,
+    otherwise the plugins are looked up concurrently. The results are cached
+    for `read_latest_versions`.
+    '''
+    from dogeek_cli.client import clients
+
+    plugins_by_registry: dict[str, list[str]] = defaultdict(list)
+    for plugin in plugins:
+        if plugin.installed_from is not None:
+            plugins_by_registry[plugin.installed_from].append(plugin.plugin_name)
+
+    latest_versions = {}
+    lookups = []
+    for registry, plugin_names in plugins_by_registry.items():
+        client = clients[registry]
+        versions = client.get_latest_versions(plugin_names)
+        if versions is not None:
+            latest_versions.update(versions)
+        else:
+            lookups.extend((client, plugin_name) for plugin_name in plugin_names)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        versions = executor.map(lambda lookup: lookup[0].get_latest_version(lookup[1]), lookups)
+        for (_, plugin_name), version in zip(lookups, versions):
+            latest_versions[plugin_name] = version
+
+    cached_versions = read_latest_versions()
+    cached_versions.update({k: v for k, v in latest_versions.items() if v is not None})
+    latest_versions_path.write_text(json.dumps(cached_versions, indent=2))
+    return latest_versions
 
-        meta['commands'] = [
-            make_cmd(command) for command in app.registered_commands
-        ]
-        meta['callback'] = make_callback(app.registered_callback)
 
-        path.write_text(json.dumps(meta, indent=2))
+def read_latest_versions() -> dict[str, str]:
+    '''Returns the latest versions of the plugins, as last fetched by `fetch_latest_versions`.'''
+    try:
+        return json.loads(latest_versions_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
@@ -0,0 +1,292 @@
+'''
+SQLite backend of the plugins registry, used when `app.registry_backend` is `sqlite`.
+
+The plugins' entries and command metadata are rows of indexed tables, so
+that looking a plugin up doesn't load the whole registry, and saving only
+writes the entries which changed. The database is in WAL mode : CLI
+processes can read it while another one writes to it, and concurrent
+writers wait for each other instead of overwriting each other's entries.
+
+The registry is migrated from `registry.json` and the `plugin_meta`
+files when the database is created.
+'''
+from contextlib import contextmanager
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterator
+
+SCHEMA_VERSION = 1
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS plugins (
+        name TEXT PRIMARY KEY,
+        path TEXT,
+        is_dir INTEGER,
+        logger TEXT,
+        version TEXT,
+        installed_from TEXT,
+        fingerprint TEXT,
+        content_hash TEXT,
+        metadata TEXT,
+        extra TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS plugins_installed_from ON plugins (installed_from)',
+    'CREATE TABLE IF NOT EXISTS plugin_meta (name TEXT PRIMARY KEY, meta TEXT NOT NULL)',
+    # Incremented on every write of the plugins table, for the command tree snapshot
+    'CREATE TABLE IF NOT EXISTS revision (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO revision VALUES (0, 0)',
+)
+# Keys of the registry entries stored in their own column
+COLUMNS = ('path', 'is_dir', 'logger', 'version', 'installed_from', 'fingerprint', 'content_hash')
+# Time to wait for another process' write to finish, in seconds
+BUSY_TIMEOUT = 30
+
+
+def to_row(plugin_name: str, entry: dict) -> tuple:
+    extra = {k: v for k, v in entry.items() if k not in COLUMNS and k != 'metadata'}
+    return (
+        plugin_name,
+        *(entry.get(column) for column in COLUMNS),
+        json.dumps(entry['metadata'], default=str) if 'metadata' in entry else None,
+        json.dumps(extra, default=str) if extra else None,
+    )
+
+
+def from_row(row: tuple) -> dict:
+    _, *values, metadata, extra = row
+    entry = dict(zip(COLUMNS, values))
+    if entry['is_dir'] is not None:
+        entry['is_dir'] = bool(entry['is_dir'])
+    if metadata is not None:
+        entry['metadata'] = json.loads(metadata)
+    if extra is not None:
+        entry.update(json.loads(extra))
+    return entry
+
+
+class SqliteRegistry:
+    '''Maps the plugins' names to their registry entries, as `JsonRegistry` does.'''
+
+    def __init__(self, path: Path, json_path: Path, meta_path: Path) -> None:
+        self.config_path = path
+        self.json_path = json_path
+        self.meta_path = meta_path
+        self._autosave = True
+        self._batches = 0
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.RLock()
+        # Entries accessed by this process, and their state when last read or saved
+        self._entries: dict[str, dict] = {}
+        self._saved: dict[str, str] = {}
+        self._deleted: set[str] = set()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.config_path.parent.mkdir(parents=True, exist_ok=True)
+            # Transactions are handled by `transaction`
+            connection = sqlite3.connect(
+                self.config_path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._connection = connection
+            if connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                self.migrate()
+        return self._connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def migrate(self) -> None:
+        '''Creates the schema, and imports the JSON registry and the plugins' metadata files.'''
+        with self.transaction() as connection:
+            if connection.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                # Migrated by another process in the meantime
+                return
+            for statement in SCHEMA:
+                connection.execute(statement)
+            try:
+                entries = json.loads(self.json_path.read_text())
+            except FileNotFoundError:
+                entries = {}
+            connection.executemany(
+                f'INSERT OR REPLACE INTO plugins VALUES ({", ".join("?" * (len(COLUMNS) + 3))})',
+                [to_row(plugin_name, entry) for plugin_name, entry in entries.items()],
+            )
+            for plugin_name in entries:
+                try:
+                    meta = (self.meta_path / f'{plugin_name}.meta').read_text()
+                except FileNotFoundError:
+                    continue
+                connection.execute('INSERT OR REPLACE INTO plugin_meta VALUES (?, ?)', (plugin_name, meta))
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        return
+
+    def _cache(self, plugin_name: str, entry: dict) -> dict:
+        self._entries[plugin_name] = entry
+        self._saved[plugin_name] = json.dumps(entry, sort_keys=True, default=str)
+        return entry
+
+    def _is_stored(self, plugin_name: str) -> bool:
+        if plugin_name in self._deleted:
+            return False
+        return self.connection.execute('SELECT 1 FROM plugins WHERE name = ?', (plugin_name,)).fetchone() is not None
+
+    def __contains__(self, plugin_name: str) -> bool:
+        with self._lock:
+            return plugin_name in self._entries or self._is_stored(plugin_name)
+
+    def __getitem__(self, plugin_name: str) -> dict:
+        with self._lock:
+            if plugin_name in self._entries:
+                return self._entries[plugin_name]
+            row = None
+            if plugin_name not in self._deleted:
+                row = self.connection.execute('SELECT * FROM plugins WHERE name = ?', (plugin_name,)).fetchone()
+            if row is None:
+                raise KeyError(plugin_name)
+            return self._cache(plugin_name, from_row(row))
+
+    def __setitem__(self, plugin_name: str, entry: dict) -> None:
+        with self._lock:
+            # Copied, so that the caller's dict isn't shared with the registry
+            self._entries[plugin_name] = json.loads(json.dumps(entry, default=str))
+            self._deleted.discard(plugin_name)
+        if self._autosave:
+            self.save()
+        return
+
+    def __delitem__(self, plugin_name: str) -> None:
+        with self._lock:
+            if plugin_name not in self:
+                raise KeyError(plugin_name)
+            self._entries.pop(plugin_name, None)
+            self._deleted.add(plugin_name)
+        if self._autosave:
+            self.save()
+        return
+
+    def pop(self, plugin_name: str, *default):
+        with self._lock:
+            if plugin_name not in self:
+                if default:
+                    return default[0]
+                raise KeyError(plugin_name)
+            entry = self[plugin_name]
+            del self[plugin_name]
+        return entry
+
+    def get(self, plugin_name: str, default=None):
+        with self._lock:
+            return self[plugin_name] if plugin_name in self else default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            names = [
+                name for name, in self.connection.execute('SELECT name FROM plugins ORDER BY rowid')
+                if name not in self._deleted
+            ]
+            return names + [name for name in self._entries if name not in names]
+
+    def items(self) -> list[tuple[str, dict]]:
+        with self._lock:
+            # Loaded in a single query
+            for row in self.connection.execute('SELECT * FROM plugins'):
+                if row[0] not in self._entries and row[0] not in self._deleted:
+                    self._cache(row[0], from_row(row))
+            return [(name, self._entries[name]) for name in self.keys()]
+
+    def values(self) -> list[dict]:
+        return [entry for _, entry in self.items()]
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        '''Saves the changes once when leaving the outermost batch.'''
+        self._batches += 1
+        try:
+            yield
+        finally:
+            self._batches -= 1
+            if self._batches == 0 and self._autosave:
+                self.save()
+
+    def save(self) -> None:
+        '''Writes the entries which changed since they were read, and the deletions.'''
+        if self._batches:
+            return
+        with self._lock:
+            changed = {}
+            for plugin_name, entry in self._entries.items():
+                serialized = json.dumps(entry, sort_keys=True, default=str)
+                if serialized != self._saved.get(plugin_name):
+                    changed[plugin_name] = serialized
+            if not changed and not self._deleted:
+                return
+            assignments = ', '.join(f'{column} = excluded.{column}' for column in (*COLUMNS, 'metadata', 'extra'))
+            with self.transaction() as connection:
+                for plugin_name in self._deleted:
+                    connection.execute('DELETE FROM plugins WHERE name = ?', (plugin_name,))
+                    connection.execute('DELETE FROM plugin_meta WHERE name = ?', (plugin_name,))
+                connection.executemany(
+                    f'INSERT INTO plugins VALUES ({", ".join("?" * (len(COLUMNS) + 3))}) '
+                    f'ON CONFLICT (name) DO UPDATE SET {assignments}',
+                    [to_row(plugin_name, self._entries[plugin_name]) for plugin_name in changed],
+                )
+                connection.execute('UPDATE revision SET value = value + 1')
+            self._saved.update(changed)
+            self._deleted.clear()
+        return
+
+    def read_meta(self, plugin_name: str) -> dict | None:
+        with self._lock:
+            row = self.connection.execute('SELECT meta FROM plugin_meta WHERE name = ?', (plugin_name,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def write_meta(self, plugin_name: str, meta: dict) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO plugin_meta VALUES (?, ?)',
+                (plugin_name, json.dumps(meta, default=str)),
+            )
+        return
+
+    def delete_meta(self, plugin_name: str) -> None:
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM plugin_meta WHERE name = ?', (plugin_name,))
+        return
+
+    def installed_from(self, registry: str | None = None) -> list[str]:
+        '''Returns the plugins installed from `registry`, or from any registry.'''
+        with self._lock:
+            if registry is None:
+                rows = self.connection.execute('SELECT name FROM plugins WHERE installed_from IS NOT NULL')
+            else:
+                rows = self.connection.execute('SELECT name FROM plugins WHERE installed_from = ?', (registry,))
+            names = [name for name, in rows if name not in self._deleted and name not in self._entries]
+            return names + [
+                name for name, entry in self._entries.items()
+                if entry.get('installed_from') is not None and registry in (None, entry['installed_from'])
+            ]
+
+    def fingerprint(self) -> str:
+        with self._lock:
+            return str(self.connection.execute('SELECT value FROM revision').fetchone()[0])
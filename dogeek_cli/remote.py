@@ -0,0 +1,108 @@
+'''
+Thin client of the CLI's server, started with `cli system serve`.
+
+Sends its command line, environment, working directory and standard streams
+to the server over a Unix socket. The server runs the command in a process
+forked from its warm application, which writes to the client's streams
+directly, then sends back the command's exit code. The command is run in
+process when no server is listening, so `cli-remote` can replace `cli`.
+
+Only the standard library is imported, the client starts in milliseconds.
+'''
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import struct
+import sys
+
+# Request : the length of the JSON request, sent along with the client's stdin, stdout and stderr
+HEADER = struct.Struct('!I')
+# Responses : the pid of the process running the command, then its exit code
+RESPONSE = struct.Struct('!i')
+# Signals forwarded to the process group of the command, as the terminal would
+FORWARDED_SIGNALS = ('SIGINT', 'SIGTERM', 'SIGHUP', 'SIGQUIT')
+
+
+def socket_path() -> Path:
+    '''Returns the path of the server's socket, `tmp_dir / 'server.sock'`, without importing the configuration.'''
+    return Path(os.getenv('XDG_CONFIG_HOME', '~/.config')).expanduser() / 'cli' / 'tmp' / 'server.sock'
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    '''Receives `size` bytes, raises EOFError if the connection is closed before.'''
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('The connection was closed')
+        data += chunk
+    return bytes(data)
+
+
+def stdio_fds() -> list[int]:
+    '''Returns the file descriptors of the standard streams, closed ones replaced with /dev/null.'''
+    fds = []
+    for fd in (0, 1, 2):
+        try:
+            os.fstat(fd)
+        except OSError:
+            fd = os.open(os.devnull, os.O_RDWR)
+        fds.append(fd)
+    return fds
+
+
+def request(sock: socket.socket) -> int:
+    '''Sends the command to the server, and returns the pid of the process running it.'''
+    payload = json.dumps({'argv': sys.argv[1:], 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode('utf8')
+    socket.send_fds(sock, [HEADER.pack(len(payload))], stdio_fds())
+    sock.sendall(payload)
+    return RESPONSE.unpack(recv_exactly(sock, RESPONSE.size))[0]
+
+
+def forward_signals(pid: int) -> None:
+    def forward(signum: int, frame) -> None:
+        try:
+            os.killpg(pid, signum)
+        except ProcessLookupError:
+            pass
+        return
+
+    for name in FORWARDED_SIGNALS:
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), forward)
+    return
+
+
+def run_locally() -> None:
+    from dogeek_cli.app import main as run
+
+    run()
+    return
+
+
+def main() -> None:
+    if not hasattr(socket, 'send_fds'):
+        # File descriptors can't be sent over sockets on this platform
+        return run_locally()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path()))
+        pid = request(sock)
+    except (OSError, EOFError):
+        # No server is listening, or it didn't start the command
+        sock.close()
+        return run_locally()
+    forward_signals(pid)
+    try:
+        exit_code = RESPONSE.unpack(recv_exactly(sock, RESPONSE.size))[0]
+    except EOFError:
+        print(f'The command was interrupted, the server closed the connection (pid {pid}).', file=sys.stderr)
+        exit_code = 1
+    sock.close()
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+'''
+Incremental scan of the plugins directory.
+
+Plugins are only described again when their files changed : the registry
+keeps a fingerprint of each plugin (modification time and size of its files)
+and a hash of its content, checked when the fingerprint changed. Changed
+plugins are described from their source when possible, and imported
+otherwise, which can be done in subprocesses so that a broken or slow plugin
+can't stall or crash the scan.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from typing import Iterator
+
+from dogeek_cli.config import RESERVED_COMMANDS, config, plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin, plugin_name_from_path
+from dogeek_cli.snapshot import fingerprint_path, hash_path
+
+
+def iter_plugin_paths() -> Iterator[Path]:
+    for module_path in plugins_path.iterdir():
+        if not module_path.is_dir() and not module_path.name.endswith('.py'):
+            continue
+        if module_path.name in RESERVED_COMMANDS:
+            # Do not import plugins named with the same
+            # name as reserved CLI commands
+            continue
+        if module_path.name == '__pycache__' or module_path.name.startswith('.'):
+            continue
+        yield module_path
+
+
+def is_changed(plugin_name: str, module_path: Path) -> bool:
+    if plugin_name not in plugins_registry:
+        return True
+    entry = plugins_registry[plugin_name]
+    if entry.get('path') != str(module_path):
+        return True
+    fingerprint = fingerprint_path(module_path)
+    if entry.get('fingerprint') == fingerprint:
+        return False
+    if entry.get('content_hash') != hash_path(module_path):
+        return True
+    # Touched, but not modified
+    entry['fingerprint'] = fingerprint
+    return False
+
+
+def import_plugin(plugin_name: str, module_path: Path, installed_from: str | None) -> dict:
+    '''Describes a plugin and generates its meta, returns its registry entry.'''
+    plugin = Plugin(plugin_name)
+    plugin.path = module_path
+    entry = plugin.make_entry(module_path, installed_from)
+    plugins_registry[plugin_name] = entry
+    plugin.make_meta(force_update=True)
+    return entry
+
+
+def import_plugin_isolated(plugin_name: str, module_path: Path, installed_from: str | None) -> dict:
+    '''Runs `import_plugin` in a subprocess, raises RuntimeError if it fails or times out.'''
+    with tempfile.NamedTemporaryFile(suffix='.json') as output:
+        try:
+            process = subprocess.run(
+                [
+                    sys.executable, '-c', 'from dogeek_cli.scan import scan_worker; scan_worker()',
+                    plugin_name, str(module_path), installed_from or '', output.name,
+                ],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                timeout=config['app.plugins_scan_timeout'],
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f'import timed out after {config["app.plugins_scan_timeout"]}s')
+        if process.returncode != 0:
+            error = process.stderr.decode('utf8', errors='replace').strip().splitlines()
+            raise RuntimeError(error[-1] if error else f'exit code {process.returncode}')
+        return json.loads(Path(output.name).read_text())
+
+
+def scan_worker() -> None:
+    '''Entry point of the subprocesses of `import_plugin_isolated`.'''
+    plugin_name, module_path, installed_from, output_path = sys.argv[1:]
+    # The registry is written by the parent process
+    plugins_registry._autosave = False
+    entry = import_plugin(plugin_name, Path(module_path), installed_from or None)
+    Path(output_path).write_text(json.dumps(entry, default=str))
+    return
+
+
+def scan_plugins(isolated: bool = False, jobs: int = 4) -> dict[str, str]:
+    '''
+    Caches the metadata of the plugins which changed in the plugins directory.
+
+    Returns the status of each plugin : unchanged, added, updated or failed.
+    '''
+    statuses = {}
+    changed = []
+    for module_path in iter_plugin_paths():
+        plugin_name = plugin_name_from_path(module_path)
+        if is_changed(plugin_name, module_path):
+            changed.append((plugin_name, module_path))
+        else:
+            statuses[plugin_name] = 'unchanged'
+
+    added = {plugin_name for plugin_name, _ in changed if plugin_name not in plugins_registry}
+
+    def scan(plugin_name: str, module_path: Path) -> tuple[str, dict | None]:
+        status = 'added' if plugin_name in added else 'updated'
+        # Plugins installed from a registry are still tied to it
+        installed_from = plugins_registry[plugin_name].get('installed_from') if status == 'updated' else None
+        try:
+            if isolated:
+                return status, import_plugin_isolated(plugin_name, module_path, installed_from)
+            return status, import_plugin(plugin_name, module_path, installed_from)
+        except Exception as e:
+            return f'failed : {e}', None
+
+    with plugins_registry.batch(), config.batch():
+        if isolated:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(lambda change: scan(*change), changed))
+        else:
+            results = [scan(plugin_name, module_path) for plugin_name, module_path in changed]
+
+        for (plugin_name, _), (status, entry) in zip(changed, results):
+            statuses[plugin_name] = status
+            if entry is not None:
+                plugins_registry[plugin_name] = entry
+                if plugin_name in added:
+                    config[f'plugins.{plugin_name}.enabled'] = True
+            elif plugin_name in added:
+                # Partially registered by the failed import
+                plugins_registry.pop(plugin_name, None)
+    return statuses
@@ -0,0 +1,146 @@
+'''Serializers of the output formats, picked among their installed backends.'''
+from dataclasses import dataclass
+import functools
+import importlib.util
+import json
+from typing import Any, Callable
+
+# Key of the array of tables of the streamed TOML documents
+TOML_ROWS_KEY = 'rows'
+
+
+@dataclass
+class Serializer:
+    # Name of the backend
+    backend: str
+    # Module the backend needs, it is skipped when the module isn't installed
+    module: str
+    dumps: Callable[[Any], str | bytes]
+    # Serializes a row of a stream, with its separator, defaults to `dumps`
+    dumps_row: Callable[[Any], str | bytes] | None = None
+    # Pygments lexer highlighting the output on terminals, None for binary formats
+    lexer: str | None = None
+
+    @property
+    def available(self) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+
+def json_dumps(data: Any) -> str:
+    return json.dumps(data, indent=2, ensure_ascii=False, default=str)
+
+
+def json_dumps_row(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+
+
+def orjson_serialize(data: Any, option: int, fallback: Callable[[Any], str]) -> bytes:
+    import orjson
+
+    # Serializes the same types as the json backend, the same way
+    option |= orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    try:
+        return orjson.dumps(data, default=str, option=option)
+    except orjson.JSONEncodeError:
+        # Integers over 64 bits
+        return fallback(data).encode('utf8')
+
+
+def orjson_dumps(data: Any) -> bytes:
+    import orjson
+
+    return orjson_serialize(data, orjson.OPT_INDENT_2, json_dumps)
+
+
+def orjson_dumps_row(data: Any) -> bytes:
+    import orjson
+
+    return orjson_serialize(data, orjson.OPT_APPEND_NEWLINE, json_dumps_row)
+
+
+@functools.cache
+def yaml_dumper(dumper_name: str) -> type:
+    '''Extends a safe dumper of PyYAML to the subclasses of the builtin types, and other objects as strings.'''
+    import yaml
+
+    dumper = type(dumper_name, (getattr(yaml, dumper_name),), {})
+    for convert, representer in (
+        (dict, dumper.represent_dict), (list, dumper.represent_list),
+        # The value of str enums, rather than their name
+        (str.__str__, dumper.represent_str),
+        (int, dumper.represent_int), (float, dumper.represent_float),
+    ):
+        base = convert if isinstance(convert, type) else str
+        # OrderedDict, defaultdict, enums...
+        dumper.add_multi_representer(
+            base, lambda self, data, convert=convert, representer=representer: representer(self, convert(data)),
+        )
+    # As json_dumps does
+    dumper.add_multi_representer(object, lambda self, data: self.represent_str(str(data)))
+    return dumper
+
+
+def make_yaml_dumps(dumper_name: str, explicit_start: bool = False) -> Callable[[Any], str]:
+    def dumps(data: Any) -> str:
+        import yaml
+
+        return yaml.dump(data, Dumper=yaml_dumper(dumper_name), indent=2, explicit_start=explicit_start)
+    return dumps
+
+
+def toml_dumps(data: Any) -> str:
+    import toml
+
+    return toml.dumps(data)
+
+
+def toml_dumps_row(data: Any) -> str:
+    return toml_dumps({TOML_ROWS_KEY: [data]}) + '\n'
+
+
+# The backends of each format, from the preferred one
+serializers: dict[str, list[Serializer]] = {
+    'json': [
+        Serializer('orjson', 'orjson', orjson_dumps, orjson_dumps_row, 'json'),
+        Serializer('json', 'json', json_dumps, json_dumps_row, 'json'),
+    ],
+    'yaml': [
+        # PyYAML only has CSafeDumper when it is built against libyaml
+        Serializer(
+            'libyaml', 'yaml._yaml', make_yaml_dumps('CSafeDumper'), make_yaml_dumps('CSafeDumper', True), 'yaml',
+        ),
+        Serializer('pyyaml', 'yaml', make_yaml_dumps('SafeDumper'), make_yaml_dumps('SafeDumper', True), 'yaml'),
+    ],
+    'toml': [
+        Serializer('toml', 'toml', toml_dumps, toml_dumps_row, 'toml'),
+    ],
+}
+# The backend used for each format, once picked
+_selected: dict[str, Serializer] = {}
+
+
+def register_serializer(format_name: str, serializer: Serializer, preferred: bool = True) -> None:
+    '''Adds a backend to a format, before its other backends unless `preferred` is False.'''
+    backends = serializers.setdefault(format_name, [])
+    if preferred:
+        backends.insert(0, serializer)
+    else:
+        backends.append(serializer)
+    _selected.pop(format_name, None)
+    return
+
+
+def get_serializer(format_name: str) -> Serializer:
+    '''Returns the preferred installed backend of a format, raises LookupError if there isn't any.'''
+    if format_name in _selected:
+        return _selected[format_name]
+    if format_name not in serializers:
+        raise LookupError(f'Unknown format {format_name!r}, the formats are {", ".join(serializers)}.')
+    for serializer in serializers[format_name]:
+        if serializer.available:
+            _selected[format_name] = serializer
+            return serializer
+    raise LookupError(
+        f'No backend of the {format_name} format is installed : '
+        f'{", ".join(serializer.module for serializer in serializers[format_name])}.'
+    )
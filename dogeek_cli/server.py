@@ -0,0 +1,267 @@
+'''
+Resident server of the CLI, started with `cli system serve`.
+
+The server imports the application, its subcommands and the enabled plugins
+once, then forks a process for each command sent by `cli-remote` (see
+`dogeek_cli.remote`). The forked process takes over the client's argv,
+environment, working directory and standard streams, so concurrent commands
+don't share the `State` singleton, nor any other global of the CLI.
+
+The server re-executes itself when the sources of the command tree change :
+the CLI, its plugins, the configuration or the environment store. The
+listening socket is inherited, the pending connections aren't dropped.
+'''
+import atexit
+import errno
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import traceback
+from typing import NoReturn
+
+import click
+import rich
+from rich.console import Console
+
+from dogeek_cli import snapshot
+from dogeek_cli.config import env, tmp_dir
+from dogeek_cli.lazy import LazyCommand, LazyGroup
+from dogeek_cli.logging import Logger
+from dogeek_cli.remote import HEADER, RESPONSE, recv_exactly
+
+logger = Logger('cli.server')
+socket_path = tmp_dir / 'server.sock'
+# File descriptor of the listening socket, inherited when the server re-executes itself
+LISTENING_FD_VARIABLE = 'DOGEEK_CLI_SERVER_FD'
+# Imported by the commands when they run, imported once by the server instead
+WARM_MODULES = ('dogeek_cli.formatter', 'dogeek_cli.utils', 'dogeek_cli.client')
+# Time allowed to a client to send its request, in seconds
+REQUEST_TIMEOUT = 5
+
+
+def fingerprint() -> str:
+    '''Fingerprints what the server loaded : the sources of the command tree, and the environment store.'''
+    return snapshot.fingerprint() + snapshot.fingerprint_content(env.config_path)
+
+
+def is_listening() -> bool:
+    '''Returns whether a server is listening on the socket.'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def listen() -> socket.socket:
+    '''Binds the server's socket, or adopts the one inherited from the server it replaced.'''
+    inherited_fd = os.environ.pop(LISTENING_FD_VARIABLE, None)
+    if inherited_fd is not None:
+        listener = socket.socket(fileno=int(inherited_fd))
+        os.set_inheritable(listener.fileno(), False)
+        listener.setblocking(False)
+        return listener
+    if is_listening():
+        raise FileExistsError(errno.EADDRINUSE, 'A server is already listening', str(socket_path))
+    # Left behind by a server which was killed
+    socket_path.unlink(missing_ok=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the user can connect to the socket
+    umask = os.umask(0o077)
+    try:
+        listener.bind(str(socket_path))
+    finally:
+        os.umask(umask)
+    listener.listen(socket.SOMAXCONN)
+    # Connections closed before they are accepted don't block the server
+    listener.setblocking(False)
+    return listener
+
+
+def warm_up(group: click.Group, ctx: click.Context) -> None:
+    '''Builds the click commands of the whole tree, which imports the subcommands and the plugins.'''
+    for name in group.list_commands(ctx):
+        try:
+            command = group.get_command(ctx, name)
+            if isinstance(command, LazyGroup):
+                command.load()
+                warm_up(command, ctx)
+            elif isinstance(command, LazyCommand):
+                command.load()
+        except Exception as e:
+            # The command fails the same way when it is run
+            logger.error('Could not load the command %s : %s', name, e)
+    return
+
+
+def reap(signum: int, frame) -> None:
+    '''Collects the exit status of the finished commands.'''
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def terminate(signum: int, frame) -> None:
+    sys.exit(0)
+
+
+def run_exit_handlers() -> None:
+    # The process exits without unwinding the server's stack, the handlers write the pending log records
+    atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return
+
+
+def reexec(listener: socket.socket) -> NoReturn:
+    '''Replaces the server with a new one, which loads the changed sources.'''
+    logger.info('The sources of the CLI changed, reloading the server')
+    os.set_inheritable(listener.fileno(), True)
+    os.environ[LISTENING_FD_VARIABLE] = str(listener.fileno())
+    run_exit_handlers()
+    os.execv(sys.executable, [sys.executable, *sys.orig_argv[1:]])
+
+
+def is_authorized(conn: socket.socket) -> bool:
+    '''Only serves the server's user, the socket's permissions already restrict it.'''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    credentials = struct.Struct('3i')
+    _, uid, _ = credentials.unpack(conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+    return uid == os.getuid()
+
+
+def refresh_consoles() -> None:
+    '''Recreates the consoles of the CLI and its plugins, which detected the server's terminal when imported.'''
+    rich._console = None
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith(('dogeek_cli', 'plugins')):
+            continue
+        for name, value in list(getattr(module, '__dict__', {}).items()):
+            # Consoles writing to a file of their own are left as they are
+            if isinstance(value, Console) and value.file in (sys.stdout, sys.stderr):
+                setattr(module, name, Console(stderr=value.file is sys.stderr))
+    if 'dogeek_cli.formatter' in sys.modules:
+        sys.modules['dogeek_cli.formatter'].formatter.console = Console()
+    return
+
+
+def run_command(command: click.Command, argv: list[str]) -> int:
+    '''Runs the command as `cli` does, and returns its exit code.'''
+    try:
+        command.main(args=argv, prog_name='cli')
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+
+def serve_client(
+    command: click.Command, listener: socket.socket, conn: socket.socket, request: dict, fds: list[int]
+) -> NoReturn:
+    '''Runs the command of a client, in the process forked for it.'''
+    exit_code = 1
+    try:
+        listener.close()
+        # A session of its own, without the server's controlling terminal, the client forwards its signals
+        # to the process group. Pagers read the client's terminal from stderr.
+        os.setsid()
+        for signum in (signal.SIGCHLD, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        sys.stdout.reconfigure(line_buffering=sys.stdout.isatty())
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = ['cli', *request['argv']]
+        refresh_consoles()
+        conn.settimeout(None)
+        conn.sendall(RESPONSE.pack(os.getpid()))
+        exit_code = run_command(command, request['argv'])
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        run_exit_handlers()
+        try:
+            conn.sendall(RESPONSE.pack(exit_code))
+        except OSError:
+            # The client is gone
+            pass
+        os._exit(exit_code)
+
+
+def handle(command: click.Command, listener: socket.socket, conn: socket.socket) -> None:
+    '''Reads the request of a client, and forks the process running its command.'''
+    if not is_authorized(conn):
+        logger.warning('Refused a connection from another user')
+        return
+    conn.settimeout(REQUEST_TIMEOUT)
+    fds = []
+    try:
+        header, fds, _, _ = socket.recv_fds(conn, HEADER.size, 3)
+        if not header:
+            # Closed without a request, by `is_listening`
+            return
+        if len(header) != HEADER.size or len(fds) != 3:
+            logger.warning('Dropped a malformed request')
+            return
+        request = json.loads(recv_exactly(conn, HEADER.unpack(header)[0]))
+        # Nothing buffered by the server is written by the forked process
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork() == 0:
+            serve_client(command, listener, conn, request, fds)
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning('Dropped a request : %s', e)
+    finally:
+        for fd in fds:
+            os.close(fd)
+    return
+
+
+def serve() -> None:
+    '''Serves the commands of the clients until the server is interrupted.'''
+    listener = listen()
+    # Circular import : the application imports the subcommand running the server
+    from dogeek_cli.app import typer_click_object
+
+    loaded_fingerprint = fingerprint()
+    warm_up(typer_click_object, click.Context(typer_click_object))
+    for module_name in WARM_MODULES:
+        importlib.import_module(module_name)
+    signal.signal(signal.SIGCHLD, reap)
+    signal.signal(signal.SIGTERM, terminate)
+    # Finished while the server re-executed itself
+    reap(signal.SIGCHLD, None)
+    logger.info('Serving the CLI on %s', socket_path)
+    try:
+        while True:
+            # The connection is only accepted once the sources are checked, the server re-executing
+            # itself leaves it pending
+            select.select([listener], [], [])
+            if fingerprint() != loaded_fingerprint:
+                reexec(listener)
+            try:
+                conn, _ = listener.accept()
+            except BlockingIOError:
+                continue
+            with conn:
+                handle(typer_click_object, listener, conn)
+    finally:
+        socket_path.unlink(missing_ok=True)
+        listener.close()
@@ -0,0 +1,97 @@
+'''
+Persistent snapshot of the CLI's command tree.
+
+The snapshot is keyed by a fingerprint of everything the command tree is
+built from, and is discarded as soon as that fingerprint changes.
+'''
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+from dogeek_cli import __version__
+from dogeek_cli.config import config, plugins_path, plugins_registry, root_path, tmp_dir
+
+
+snapshot_path: Path = tmp_dir / 'command_tree.json'
+
+
+def iter_files(path: Path) -> Iterator[Path]:
+    if not path.is_dir():
+        yield path
+        return
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if d != '__pycache__']
+        for filename in filenames:
+            yield Path(dirpath) / filename
+
+
+def fingerprint_path(path: Path) -> str:
+    '''Fingerprints a file or directory from the size and modification time of its files.'''
+    digest = hashlib.sha256()
+    for filepath in sorted(iter_files(path)):
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            continue
+        digest.update(
+            f'{filepath.relative_to(path.parent)}:{stat.st_mtime_ns}:{stat.st_size};'.encode('utf8')
+        )
+    return digest.hexdigest()
+
+
+def hash_path(path: Path) -> str:
+    '''Hashes the content of a file or directory, slower than `fingerprint_path` but immune to touched files.'''
+    digest = hashlib.sha256()
+    for filepath in sorted(iter_files(path)):
+        try:
+            content = filepath.read_bytes()
+        except FileNotFoundError:
+            continue
+        digest.update(f'{filepath.relative_to(path.parent)}:{len(content)};'.encode('utf8'))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def fingerprint_content(path: Path) -> str:
+    '''Fingerprints a file from its content.'''
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ''
+
+
+def fingerprint() -> str:
+    '''Fingerprints the sources of the command tree : the CLI, its plugins and its configuration.'''
+    digest = hashlib.sha256(__version__.encode('utf8'))
+    digest.update(fingerprint_path(root_path).encode('utf8'))
+    digest.update(fingerprint_path(plugins_path).encode('utf8'))
+    digest.update(plugins_registry.fingerprint().encode('utf8'))
+    digest.update(fingerprint_content(config.config_path).encode('utf8'))
+    return digest.hexdigest()
+
+
+def load(expected_fingerprint: str) -> dict | None:
+    '''Loads the command tree snapshot, if it is still valid.'''
+    try:
+        snapshot = json.loads(snapshot_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if snapshot.get('fingerprint') != expected_fingerprint:
+        return None
+    return snapshot['tree']
+
+
+def dump(tree: dict, tree_fingerprint: str) -> None:
+    '''Saves the command tree snapshot.'''
+    tmp_path = snapshot_path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps({'fingerprint': tree_fingerprint, 'tree': tree}, default=str))
+    os.replace(tmp_path, snapshot_path)
+    return
+
+
+def invalidate() -> None:
+    '''Discards the command tree snapshot, so that it is rebuilt on the next run.'''
+    snapshot_path.unlink(missing_ok=True)
+    return
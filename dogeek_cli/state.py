@@ -7,8 +7,11 @@ from dogeek_cli.utils import Singleton
 
 @dataclass
 class State(metaclass=Singleton):
-    format: OutputFormat = OutputFormat.DEFAULT
+    # The formats registered by plugins are strings
+    format: OutputFormat | str = OutputFormat.DEFAULT
     verbosity: int = config['app.default_verbosity']
+    # Output without colors nor highlighting
+    raw: bool = False
 
 
 state = State()
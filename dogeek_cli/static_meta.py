@@ -0,0 +1,420 @@
+'''
+Description of plugins from their source code, without executing it.
+
+The plugin's modules are walked statement by statement, following relative
+imports, to find its docstring, `__version__`, `metadata`, `Logger` and the
+`typer.Typer` instances with their commands. Only a safe subset of Python is
+evaluated : literals, and calls to `typer.Option`, `typer.Argument`,
+`typer.Typer` and a few types. The commands are registered on real
+`typer.Typer` instances with stub functions carrying the signatures found in
+the source, so that they are described by `dogeek_cli.meta` exactly as
+imported ones.
+
+`StaticAnalysisError` is raised when anything needed can't be resolved
+statically, the plugin must then be imported.
+'''
+import ast
+import datetime
+import enum
+import inspect
+import pathlib
+from pathlib import Path
+import types
+import typing
+import uuid
+
+import typer
+
+from dogeek_cli.utils import clean_help_string
+
+
+class StaticAnalysisError(Exception):
+    '''Raised when a plugin can't be described without importing it.'''
+
+
+SAFE_MODULES = {
+    'typer': typer, 'typing': typing, 'pathlib': pathlib,
+    'datetime': datetime, 'uuid': uuid, 'enum': enum,
+}
+SAFE_BUILTINS = {
+    'int': int, 'str': str, 'float': float, 'bool': bool, 'bytes': bytes,
+    'list': list, 'dict': dict, 'tuple': tuple, 'set': set,
+}
+# The only functions called while evaluating the source
+SAFE_CALLABLES = (typer.Option, typer.Argument, typer.Typer, Path)
+LOGGER_MODULES = ('dogeek_cli', 'dogeek_cli.logging')
+SAFE_NODES = (
+    ast.Expression, ast.Constant, ast.Name, ast.Attribute, ast.Call, ast.keyword, ast.Load,
+    ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Subscript, ast.Slice,
+    ast.BinOp, ast.BitOr, ast.Add, ast.Sub, ast.UnaryOp, ast.USub, ast.UAdd,
+    ast.JoinedStr, ast.FormattedValue,
+)
+
+
+class LoggerCall:
+    '''Stands for a `dogeek_cli.Logger` instance.'''
+
+    def __init__(self, logger_name: str) -> None:
+        self.logger_name = logger_name
+
+
+LOGGER = object()
+UNKNOWN = object()
+
+
+class ModuleAnalyzer:
+    '''Evaluates the top level statements of a module which are safe to.'''
+
+    def __init__(self, path: Path, analyzers: dict[Path, 'ModuleAnalyzer | None'], in_package: bool) -> None:
+        self.path = path
+        self.in_package = in_package
+        try:
+            self.tree = ast.parse(path.read_text(), str(path))
+        except (OSError, SyntaxError, ValueError) as e:
+            raise StaticAnalysisError(f'{path} cannot be parsed : {e}')
+        # Values of the names bound at the top level, UNKNOWN if they can't be evaluated
+        self.values: dict[str, typing.Any] = {}
+        self.analyzers = analyzers
+        self.analyzers[path] = None
+        for statement in self.tree.body:
+            self.visit(statement)
+        self.analyzers[path] = self
+
+    @property
+    def docstring(self) -> str | None:
+        return ast.get_docstring(self.tree, clean=False)
+
+    def known_values(self) -> dict[str, typing.Any]:
+        return {name: value for name, value in self.values.items() if value is not UNKNOWN}
+
+    def is_typer(self, node: ast.AST) -> bool:
+        return any(
+            isinstance(self.values.get(name.id), typer.Typer)
+            for name in ast.walk(node) if isinstance(name, ast.Name)
+        )
+
+    def bind_unknown(self, node: ast.AST) -> None:
+        '''Marks the names bound anywhere in `node` as unknown.'''
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                self.values[child.id] = UNKNOWN
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.values[child.name] = UNKNOWN
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                for alias in child.names:
+                    self.values[(alias.asname or alias.name).split('.')[0]] = UNKNOWN
+        return
+
+    def visit(self, node: ast.stmt) -> None:
+        if isinstance(node, ast.Import):
+            self.visit_import(node)
+        elif isinstance(node, ast.ImportFrom):
+            self.visit_import_from(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            self.visit_assign(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            self.visit_function(node)
+        elif isinstance(node, ast.ClassDef):
+            self.values[node.name] = self.make_enum(node)
+        elif isinstance(node, ast.Expr):
+            self.visit_expression(node.value)
+        elif isinstance(node, ast.If) and is_main_guard(node.test):
+            # Not run when the plugin is imported
+            return
+        elif isinstance(node, ast.Pass):
+            return
+        else:
+            if self.is_typer(node):
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} uses a typer app in a {type(node).__name__}')
+            self.bind_unknown(node)
+        return
+
+    def visit_import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            if alias.name.startswith('plugins.'):
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} imports a plugin')
+            if alias.asname is None:
+                # `import a.b` binds `a`
+                name = alias.name.split('.')[0]
+                self.values[name] = SAFE_MODULES.get(name, UNKNOWN)
+            else:
+                self.values[alias.asname] = SAFE_MODULES.get(alias.name, UNKNOWN)
+        return
+
+    def visit_import_from(self, node: ast.ImportFrom) -> None:
+        if any(alias.name == '*' for alias in node.names):
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} uses a star import')
+        if node.module == '__future__':
+            return
+        if node.level > 0:
+            self.visit_relative_import(node)
+            return
+        if (node.module or '').startswith('plugins.'):
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} imports a plugin')
+        for alias in node.names:
+            name = alias.asname or alias.name
+            if node.module in LOGGER_MODULES and alias.name == 'Logger':
+                self.values[name] = LOGGER
+            elif node.module in SAFE_MODULES and not alias.name.startswith('_'):
+                self.values[name] = getattr(SAFE_MODULES[node.module], alias.name, UNKNOWN)
+            else:
+                self.values[name] = UNKNOWN
+        return
+
+    def visit_relative_import(self, node: ast.ImportFrom) -> None:
+        if not self.in_package:
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} relative import outside of a package')
+        package_path = self.path.parent
+        for _ in range(node.level - 1):
+            package_path = package_path.parent
+        if node.module is None:
+            # `from . import module` : the modules are imported, for their side effects
+            for alias in node.names:
+                self.analyze(package_path / alias.name, node)
+                self.values[alias.asname or alias.name] = UNKNOWN
+            return
+
+        analyzer = self.analyze(package_path.joinpath(*node.module.split('.')), node)
+        for alias in node.names:
+            self.values[alias.asname or alias.name] = analyzer.values.get(alias.name, UNKNOWN)
+        return
+
+    def analyze(self, module_path: Path, node: ast.ImportFrom) -> 'ModuleAnalyzer':
+        if module_path.is_dir():
+            module_path = module_path / '__init__.py'
+        else:
+            module_path = module_path.with_name(f'{module_path.name}.py')
+        if module_path in self.analyzers:
+            if self.analyzers[module_path] is None:
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} circular import')
+            return self.analyzers[module_path]
+        return ModuleAnalyzer(module_path, self.analyzers, in_package=True)
+
+    def visit_assign(self, node: ast.Assign | ast.AnnAssign) -> None:
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        if node.value is None:
+            return
+        if not all(isinstance(target, ast.Name) for target in targets):
+            if any(self.is_typer(target) for target in targets):
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} modifies a typer app')
+            self.bind_unknown(node)
+            return
+
+        value = self.evaluate_assigned(node.value)
+        for target in targets:
+            self.values[target.id] = value
+        return
+
+    def evaluate_assigned(self, node: ast.expr) -> typing.Any:
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and self.values.get(node.func.id) is LOGGER
+        ):
+            try:
+                return LoggerCall(ast.literal_eval(node.args[0]))
+            except (IndexError, ValueError):
+                return UNKNOWN
+        try:
+            return self.evaluate(node)
+        except StaticAnalysisError:
+            if self.is_typer(node):
+                raise
+            return UNKNOWN
+
+    def visit_expression(self, node: ast.expr) -> None:
+        if not self.is_typer(node):
+            # Calls which don't involve a typer app can't change the plugin's metadata
+            return
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == 'add_typer' and isinstance(node.func.value, ast.Name)
+        ):
+            app = self.values.get(node.func.value.id)
+            args, kwargs = self.evaluate_arguments(node)
+            if isinstance(app, typer.Typer) and args and isinstance(args[0], typer.Typer):
+                app.add_typer(*args, **kwargs)
+                return
+        raise StaticAnalysisError(f'{self.path}:{node.lineno} uses a typer app in an expression')
+
+    def visit_function(self, node: ast.FunctionDef | ast.AsyncFunctionDef) -> None:
+        registrations = []
+        for decorator in node.decorator_list:
+            if (
+                isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute)
+                and decorator.func.attr in ('command', 'callback')
+                and isinstance(decorator.func.value, ast.Name)
+                and isinstance(self.values.get(decorator.func.value.id), typer.Typer)
+            ):
+                registrations.append(decorator)
+            elif self.is_typer(decorator) or registrations:
+                # Other decorators could change the function typer registers
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} has an unsupported decorator')
+
+        if node.decorator_list and not registrations:
+            self.values[node.name] = UNKNOWN
+            return
+        try:
+            function = self.make_function(node)
+        except StaticAnalysisError:
+            if registrations:
+                raise
+            self.values[node.name] = UNKNOWN
+            return
+        # Decorators apply from the innermost one
+        for decorator in reversed(registrations):
+            app = self.values[decorator.func.value.id]
+            args, kwargs = self.evaluate_arguments(decorator)
+            function = getattr(app, decorator.func.attr)(*args, **kwargs)(function)
+        self.values[node.name] = function
+        return
+
+    def make_function(self, node: ast.FunctionDef | ast.AsyncFunctionDef) -> types.FunctionType:
+        '''Makes a function with the signature and docstring of `node`, which can't be called.'''
+        arguments = node.args
+        if arguments.vararg or arguments.kwarg or arguments.posonlyargs:
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} has variadic or positional only arguments')
+        defaults = [None] * (len(arguments.args) - len(arguments.defaults)) + arguments.defaults
+        parameters = []
+        for kind, args, args_defaults in (
+            (inspect.Parameter.POSITIONAL_OR_KEYWORD, arguments.args, defaults),
+            (inspect.Parameter.KEYWORD_ONLY, arguments.kwonlyargs, arguments.kw_defaults),
+        ):
+            for arg, default in zip(args, args_defaults):
+                parameters.append(inspect.Parameter(
+                    arg.arg, kind,
+                    default=inspect.Parameter.empty if default is None else self.evaluate(default),
+                    annotation=self.evaluate_annotation(arg.annotation),
+                ))
+
+        def function(*args, **kwargs):
+            raise RuntimeError(f'{node.name} was described statically, it cannot be called.')
+
+        function.__name__ = function.__qualname__ = node.name
+        function.__doc__ = ast.get_docstring(node, clean=False)
+        function.__signature__ = inspect.Signature(parameters)
+        function.__annotations__ = {
+            parameter.name: parameter.annotation
+            for parameter in parameters if parameter.annotation is not inspect.Parameter.empty
+        }
+        return function
+
+    def make_enum(self, node: ast.ClassDef) -> typing.Any:
+        '''Rebuilds enums of constants, used for choices.'''
+        if node.decorator_list or node.keywords:
+            return UNKNOWN
+        try:
+            bases = [self.evaluate(base) for base in node.bases]
+        except StaticAnalysisError:
+            return UNKNOWN
+        if not bases or not issubclass(bases[-1], enum.Enum) or any(
+            base not in (str, int, enum.Enum, enum.IntEnum) for base in bases
+        ):
+            return UNKNOWN
+        members = {}
+        for statement in node.body:
+            if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+                continue
+            if not (
+                isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name) and isinstance(statement.value, ast.Constant)
+            ):
+                return UNKNOWN
+            members[statement.targets[0].id] = statement.value.value
+        return bases[-1](node.name, members, type=bases[0] if len(bases) > 1 else None)
+
+    def evaluate_arguments(self, node: ast.Call) -> tuple[list, dict]:
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords):
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} unpacks arguments')
+        return (
+            [self.evaluate(arg) for arg in node.args],
+            {keyword.arg: self.evaluate(keyword.value) for keyword in node.keywords},
+        )
+
+    def evaluate_annotation(self, node: ast.expr | None) -> typing.Any:
+        if node is None:
+            return inspect.Parameter.empty
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # String annotation, or `from __future__ import annotations`
+            try:
+                node = ast.parse(node.value, mode='eval').body
+            except SyntaxError:
+                raise StaticAnalysisError(f'{self.path} has an invalid annotation {node.value!r}')
+        return self.evaluate(node)
+
+    def evaluate(self, node: ast.expr) -> typing.Any:
+        '''Evaluates an expression, if it only uses known values and safe calls.'''
+        self.check(node)
+        namespace = {**SAFE_BUILTINS, **self.known_values()}
+        try:
+            return eval(compile(ast.Expression(node), str(self.path), 'eval'), {'__builtins__': {}}, namespace)
+        except Exception as e:
+            raise StaticAnalysisError(f'{self.path}:{node.lineno} cannot be evaluated : {e}')
+
+    def check(self, node: ast.AST) -> None:
+        for child in ast.walk(node):
+            if not isinstance(child, SAFE_NODES):
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} {type(child).__name__} cannot be evaluated')
+            if isinstance(child, ast.Name) and child.id not in SAFE_BUILTINS and (
+                self.values.get(child.id, UNKNOWN) is UNKNOWN
+            ):
+                raise StaticAnalysisError(f'{self.path}:{node.lineno} {child.id} is unknown')
+            if isinstance(child, ast.Attribute):
+                if child.attr.startswith('_'):
+                    raise StaticAnalysisError(f'{self.path}:{node.lineno} accesses a private attribute')
+                if not isinstance(child.value, (ast.Name, ast.Attribute)):
+                    raise StaticAnalysisError(f'{self.path}:{node.lineno} accesses an attribute of an expression')
+            if isinstance(child, ast.Call):
+                function = self.evaluate(child.func)
+                if function not in SAFE_CALLABLES:
+                    raise StaticAnalysisError(f'{self.path}:{node.lineno} calls {ast.unparse(child.func)}')
+        for child in ast.walk(node):
+            if isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name):
+                value = self.values.get(child.value.id, SAFE_BUILTINS.get(child.value.id))
+                if not (value in SAFE_MODULES.values() or isinstance(value, enum.EnumMeta)):
+                    raise StaticAnalysisError(f'{self.path}:{node.lineno} accesses an attribute of {child.value.id}')
+        return
+
+
+def is_main_guard(node: ast.expr) -> bool:
+    return (
+        isinstance(node, ast.Compare) and isinstance(node.left, ast.Name) and node.left.id == '__name__'
+        and len(node.comparators) == 1 and isinstance(node.comparators[0], ast.Constant)
+        and node.comparators[0].value == '__main__'
+    )
+
+
+def describe(path: Path) -> dict:
+    '''
+    Describes a plugin from its source : its help, version, metadata, logger
+    name and typer.Typer instance, as they would be found by importing it.
+    '''
+    entry_path = path / '__init__.py' if path.is_dir() else path
+    analyzer = ModuleAnalyzer(entry_path, {}, in_package=path.is_dir())
+    values = analyzer.values
+
+    for name, default in (('__version__', '1.0.0'), ('metadata', {})):
+        if values.get(name) is UNKNOWN:
+            raise StaticAnalysisError(f'{name} of {path} cannot be evaluated')
+    version = values.get('__version__', '1.0.0')
+    metadata = values.get('metadata', {})
+    if not isinstance(version, str) or not isinstance(metadata, dict):
+        raise StaticAnalysisError(f'__version__ or metadata of {path} have unexpected types')
+
+    # Same lookups as Plugin.cache_plugin_metadata and Plugin.typer_app, which go through dir(module)
+    names = sorted(values)
+    logger = next((values[name].logger_name for name in names if isinstance(values[name], LoggerCall)), None)
+    app = values.get('app')
+    if not isinstance(app, typer.Typer):
+        if app is UNKNOWN:
+            raise StaticAnalysisError(f'app of {path} cannot be evaluated')
+        app = next((values[name] for name in names if isinstance(values[name], typer.Typer)), None)
+        if app is None:
+            raise StaticAnalysisError(f'No typer.Typer instance found in {path}')
+
+    return {
+        'help': clean_help_string(analyzer.docstring),
+        'version': version,
+        'metadata': dict(metadata),
+        'logger': logger,
+        'app': app,
+    }
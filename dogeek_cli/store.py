@@ -0,0 +1,125 @@
+'''
+Content-addressed store of the plugin archives downloaded from registries.
+
+Archives are kept by SHA-256, and indexed by plugin name and version, so
+that reinstalls, downgrades and rollbacks don't need the network. The store
+is bounded in size, the least recently used archives being evicted first.
+'''
+import hashlib
+import json
+import os
+from pathlib import Path
+import secrets
+import threading
+from typing import BinaryIO
+
+from dogeek_cli.config import config
+
+# Size of the chunks copied into the store
+CHUNK_SIZE = 64 * 1024
+
+
+class ArtifactStore:
+    def __init__(self, path: Path, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.index_path = path / 'index.json'
+        self._lock = threading.Lock()
+
+    def archive_path(self, sha256: str) -> Path:
+        return self.path / f'{sha256}.tar.gz'
+
+    def tmp_path(self) -> Path:
+        '''Returns a path to download an archive to, before it is added to the store.'''
+        self.path.mkdir(parents=True, exist_ok=True)
+        return self.path / f'{secrets.token_hex(8)}.tmp'
+
+    def read_index(self) -> dict[str, dict]:
+        try:
+            return json.loads(self.index_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self, index: dict[str, dict]) -> None:
+        tmp_path = self.index_path.with_suffix(f'.{os.getpid()}-{threading.get_ident()}.tmp')
+        tmp_path.write_text(json.dumps(index, indent=2))
+        os.replace(tmp_path, self.index_path)
+        return
+
+    def find(self, plugin_name: str, version: str) -> dict | None:
+        '''Returns the stored archive of a plugin version (sha256, registry), if any.'''
+        entry = self.read_index().get(plugin_name, {}).get('versions', {}).get(version)
+        if entry is None:
+            return None
+        try:
+            # Keeps track of the last use of the archive for the LRU eviction
+            os.utime(self.archive_path(entry['sha256']))
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def put(self, fileobj: BinaryIO, sha256: str | None = None) -> str | None:
+        '''Copies an archive into the store, returns its SHA-256 or None if it isn't `sha256`.'''
+        tmp_path = self.tmp_path()
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as fp:
+                while chunk := fileobj.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    fp.write(chunk)
+            if sha256 is not None and digest.hexdigest() != sha256:
+                return None
+            self.add(tmp_path, digest.hexdigest())
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return digest.hexdigest()
+
+    def add(self, tmp_path: Path, sha256: str) -> Path:
+        '''Moves a downloaded archive into the store.'''
+        path = self.archive_path(sha256)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def record(self, plugin_name: str, version: str, sha256: str, registry: str | None) -> None:
+        '''Records that a plugin version was installed from an archive.'''
+        with self._lock:
+            index = self.read_index()
+            plugin = index.setdefault(plugin_name, {'versions': {}, 'history': []})
+            plugin['versions'][version] = {'sha256': sha256, 'registry': registry}
+            if version in plugin['history']:
+                plugin['history'].remove(version)
+            plugin['history'].append(version)
+            self._write_index(index)
+        return
+
+    def previous_version(self, plugin_name: str, current_version: str) -> str | None:
+        '''Returns the version installed before `current_version` which is still stored.'''
+        plugin = self.read_index().get(plugin_name, {'versions': {}, 'history': []})
+        for version in reversed(plugin['history']):
+            if version == current_version:
+                continue
+            if self.archive_path(plugin['versions'][version]['sha256']).exists():
+                return version
+        return None
+
+    def evict(self) -> None:
+        '''Removes the least recently used archives until the store fits in its maximum size.'''
+        archives = []
+        for archive_path in self.path.glob('*.tar.gz'):
+            try:
+                stat = archive_path.stat()
+            except FileNotFoundError:
+                continue
+            archives.append((stat.st_mtime, stat.st_size, archive_path))
+        total_size = sum(size for _, size, _ in archives)
+        # The most recent archive is always kept, it was just installed
+        for _, size, archive_path in sorted(archives)[:-1]:
+            if total_size <= self.max_size:
+                break
+            archive_path.unlink(missing_ok=True)
+            total_size -= size
+        return
+
+
+store = ArtifactStore(config.app_path / 'store', config['app.store.max_size'])
@@ -4,26 +4,21 @@ Convenient way to set application-wide configuration values.
 
 import errno
 
-from rich.console import Console
-from rich.table import Table
 import typer
 
 from dogeek_cli.config import config, DefaultConfig
+from dogeek_cli.formatter import formatter
 
 
 app = typer.Typer()
-console = Console()
 
 
 @app.command('ls')
 def ls() -> int:
     '''Lists configuration keys and values'''
-    table = Table()
-    table.add_column('KEY')
-    table.add_column('VALUE')
-    for key, value in config.flat().items():
-        table.add_row(str(key), str(value))
-    console.print(table)
+    formatter.print_paged_table(
+        ({'KEY': str(key), 'VALUE': str(value)} for key, value in config.flat().items()), ('KEY', 'VALUE'),
+    )
     return 0
 
 
@@ -47,5 +42,6 @@ def set(key: str, value: str) -> int:
 @app.command()
 def reset() -> int:
     '''Resets the configuration file to its default state.'''
-    for key, value in DefaultConfig._DEFAULTS.items():
-        config[key] = value
+    with config.batch():
+        for key, value in DefaultConfig._DEFAULTS.items():
+            config[key] = value
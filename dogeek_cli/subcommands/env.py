@@ -9,10 +9,10 @@ from typing import Optional
 from rich import print
 from rich.console import Console
 from rich.syntax import Syntax
-from rich.table import Table
 import typer
 
 from dogeek_cli.config import config, env
+from dogeek_cli.formatter import formatter
 from dogeek_cli.state import state
 
 
@@ -24,9 +24,11 @@ console = Console()
 def add(name: str, environment: str) -> int:
     '''Add a new environment to the CLI.'''
     environ = json.loads(environment)
-    if name in env:
-        environ = env[name].update(environ)
-    env[name] = environ
+    with env.batch():
+        if name in env:
+            env[name].update(environ)
+        else:
+            env[name] = environ
     return 0
 
 
@@ -35,9 +37,8 @@ def mv(original_name: str, new_name: str) -> int:
     '''Rename an existing environment.'''
     if original_name not in env:
         raise typer.Exit(errno.ENODATA)
-    environ = env[original_name].copy()
-    del env[original_name]
-    env[new_name] = environ
+    with env.batch():
+        env[new_name] = env.pop(original_name)
     return 0
 
 
@@ -53,11 +54,10 @@ def ls(
         for k, v in sorted(env.items(), key=lambda x: x[0])
         if filter is None or filter in k
     }
-    columns = set([v.keys() for v in the_env.values()])
-    table = Table('name', *columns)
-    for name, environ in the_env.items():
-        table.add_row(name, *[str(e) for e in environ.values()])
-    console.print(table)
+    columns = dict.fromkeys(key for environ in the_env.values() for key in environ)
+    formatter.print_paged_table(
+        ({'name': name, **environ} for name, environ in the_env.items()), ('name', *columns),
+    )
     return 0
 
 
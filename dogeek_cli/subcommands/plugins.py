@@ -1,28 +1,30 @@
 '''Manages CLI plugins.'''
 import errno
-from http import HTTPStatus
+import gzip
+import logging
+import os
 from pathlib import Path
+import sys
 import textwrap
 from typing import Optional
 
-from cryptography.hazmat.primitives import serialization as crypto_serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.backends import default_backend as crypto_default_backend
-from mako.lookup import TemplateLookup
-from mako.template import Template
 from rich.console import Console
 from rich.table import Table
 import typer
 
-from dogeek_cli.client import Client
+from dogeek_cli import log_search, snapshot
 from dogeek_cli.config import (
-    config, plugins_path, plugins_registry, RESERVED_COMMANDS, logs_path,
-    root_path,
+    config, plugins_path, plugins_registry,
+    root_path, tmp_dir,
 )
-from dogeek_cli.logging import Logger
+from dogeek_cli.enums import LogLevel
+from dogeek_cli.logging import LEVELS, Logger, latest_log
 from dogeek_cli.utils import open_editor, open_pager
 from dogeek_cli.subcommands.registry import app as registry_app
-from dogeek_cli.plugin import Plugin
+from dogeek_cli.plugin import Plugin, fetch_latest_versions, read_latest_versions
+from dogeek_cli.scan import scan_plugins
+from dogeek_cli.store import store
+from dogeek_cli.upgrades import upgrade_plugins
 
 app = typer.Typer()
 app.add_typer(registry_app, name='registry')
@@ -36,6 +38,10 @@ def callback():
         # Public / Private key pairs are already generated
         return
 
+    from cryptography.hazmat.primitives import serialization as crypto_serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.backends import default_backend as crypto_default_backend
+
     key = rsa.generate_private_key(
         backend=crypto_default_backend(),
         public_exponent=65537,
@@ -60,20 +66,20 @@ def callback():
 
 
 @app.command()
-def update() -> int:
+def update(
+    isolated: bool = typer.Option(
+        False, '--isolated', help='Import the changed plugins in subprocesses, so that they cannot crash the update.'
+    ),
+    jobs: int = typer.Option(4, '--jobs', '-j', help='Number of plugins imported in parallel with --isolated.'),
+) -> int:
     '''Updates the plugins cache with new plugins in the plugins directory.'''
-    for module_path in plugins_path.iterdir():
-        if module_path.is_dir() or module_path.name.endswith('.py'):
-            if module_path.name in RESERVED_COMMANDS:
-                # Do not import plugins named with the same
-                # name as reserved CLI commands
-                continue
-            if module_path.name == '__pycache__':
-                continue
-            if module_path.name.startswith('.'):
-                continue
-            plugin = Plugin(module_path.name)
-            plugin.cache_plugin_metadata(module_path, None)
+    statuses = scan_plugins(isolated=isolated, jobs=jobs)
+    for plugin_name, status in sorted(statuses.items()):
+        if status != 'unchanged':
+            print(f'{plugin_name} : {status}')
+    unchanged = sum(status == 'unchanged' for status in statuses.values())
+    print(f'{unchanged} plugins unchanged.')
+    snapshot.invalidate()
     return 0
 
 
@@ -82,6 +88,9 @@ def edit(plugin_name: str):
     '''Edits a plugin in your favorite text editor'''
     plugin = Plugin(plugin_name)
     if not plugin.exists:
+        from mako.lookup import TemplateLookup
+        from mako.template import Template
+
         path = plugins_path / plugin_name
         path.mkdir(exist_ok=True, parents=True)
         lookup = TemplateLookup([str(root_path / 'templates')])
@@ -112,18 +121,53 @@ def edit(plugin_name: str):
 
 
 @app.command()
-def logs(plugin_name: str) -> int:
-    '''Pages on the latest log for provided plugin name.'''
+def logs(
+    plugin_name: str,
+    grep: Optional[str] = typer.Option(None, '--grep', '-g', help='Regular expression the records must match.'),
+    since: Optional[str] = typer.Option(
+        None, '--since', help='ISO date, or duration before now (30m, 2h, 7d), of the oldest records.'
+    ),
+    until: Optional[str] = typer.Option(
+        None, '--until', help='ISO date, or duration before now, of the newest records.'
+    ),
+    level: Optional[LogLevel] = typer.Option(None, '--level', '-l', help='Minimum level of the records.'),
+    follow: bool = typer.Option(False, '--follow', '-F', help='Prints the records as they are logged.'),
+) -> int:
+    '''Pages on the latest log for provided plugin name, or searches its logs.'''
     if plugin_name not in plugins_registry:
         raise typer.Exit(errno.ENODATA)
     plugin = Plugin(plugin_name)
-    path: Path = logs_path / plugin.logger
-    filepath: Path = None
+    if grep is None and since is None and until is None and level is None and not follow:
+        filepath: Path = latest_log(plugin.logger)
+        if filepath is None:
+            # Nothing was logged yet
+            raise typer.Exit(errno.ENOENT)
+        if filepath.suffix == '.gz':
+            path = tmp_dir / filepath.stem
+            path.write_bytes(gzip.decompress(filepath.read_bytes()))
+            filepath = path
+        open_pager(filepath)
+        return 0
+
+    try:
+        query = log_search.make_query(grep, since, until, LEVELS[level.value] if level is not None else logging.DEBUG)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    output = sys.stdout.buffer
     try:
-        filepath = next(sorted(path.iterdir(), reverse=True))
-    except StopIteration:
-        raise typer.Exit(errno.ENOENT)
-    open_pager(filepath)
+        for record in log_search.search(plugin.logger, query):
+            output.write(record)
+        output.flush()
+        if follow:
+            for record in log_search.follow(plugin.logger, query):
+                output.write(record)
+                output.flush()
+    except KeyboardInterrupt:
+        return 0
+    except BrokenPipeError:
+        # The output was piped to a command which exited, such as head
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
     return 0
 
 
@@ -131,6 +175,7 @@ def logs(plugin_name: str) -> int:
 def enable(plugin_name: str) -> int:
     '''Enables the specified plugin.'''
     Plugin(plugin_name).enabled = True
+    snapshot.invalidate()
     return 0
 
 
@@ -138,21 +183,31 @@ def enable(plugin_name: str) -> int:
 def disable(plugin_name: str) -> int:
     '''Disables the specified plugin.'''
     Plugin(plugin_name).enabled = False
+    snapshot.invalidate()
     return 0
 
 
 @app.command()
-def ls():
+def ls(
+    no_remote: bool = typer.Option(
+        False, '--no-remote', help='Use the last known versions of the plugins instead of querying registries.'
+    ),
+):
     '''Lists available plugins.'''
+    plugins = [Plugin(plugin_name) for plugin_name in plugins_registry]
+    if no_remote:
+        latest_versions = read_latest_versions()
+    else:
+        latest_versions = fetch_latest_versions(plugins)
+
     table = Table('plugin_name', 'enabled', 'description', 'upgrade_avail')
-    for plugin_name in plugins_registry:
-        plugin = Plugin(plugin_name)
+    for plugin in plugins:
         enabled = '✅' if plugin.enabled else '❌'
         table.add_row(
-            textwrap.shorten(plugin_name, 10),
+            textwrap.shorten(plugin.plugin_name, 10),
             enabled,
             plugin.short_help,
-            plugin.upgrade_available,
+            plugin.upgrade_status(latest_versions.get(plugin.plugin_name)),
         )
     console.print(table)
     return 0
@@ -164,24 +219,29 @@ def install(
     version: str = typer.Option('latest', '--version', '-v'),
 ) -> int:
     '''Installs a plugin from the CLI plugin registry.'''
+    from dogeek_cli.client import find_plugin_version
+
     logger.info('Installing plugin %s v%s', plugin_name, version)
     plugin = Plugin(plugin_name)
-    registries = config['app.registries'] or []
-    registries.append('cli.dogeek.me')
-    for registry in registries:
-        client = Client(registry)
-        response = client.get(
-            f'/v1/plugins/{plugin_name}/versions/{version}'
-        )
-        if response.status_code == HTTPStatus.OK:
-            break
-    else:
-        logger.error(
-            'No plugin %s v%s found in registries %s : %s',
-            plugin_name, version, registries, response.json()['message']
-        )
-        raise typer.Exit()
-    plugin.install(response.json()['data']['file'], registry)
+    if version != 'latest' and store.find(plugin_name, version) is not None:
+        # Already downloaded, installed without the network
+        return_code = plugin.install_stored(version)
+        snapshot.invalidate()
+        if return_code != 0:
+            raise typer.Exit(return_code)
+        print(f'Plugin {plugin_name} v{version} has been installed.')
+        return 0
+
+    registries = list(dict.fromkeys([*(config['app.registries'] or []), 'cli.dogeek.me']))
+    registry, response = find_plugin_version(plugin_name, version, registries)
+    if response is None:
+        logger.error('No plugin %s v%s found in registries %s', plugin_name, version, registries)
+        print(f'Plugin {plugin_name} v{version} was not found in registries {", ".join(registries)}.')
+        raise typer.Exit(errno.ENODATA)
+    return_code = plugin.install_from_registry(registry, version, response)
+    snapshot.invalidate()
+    if return_code != 0:
+        raise typer.Exit(return_code)
     print(f'Plugin {plugin_name} v{version} has been installed.')
     return 0
 
@@ -193,6 +253,26 @@ def uninstall(plugin_name: str):
         raise typer.Exit(errno.ENODATA)
     plugin = Plugin(plugin_name)
     plugin.uninstall()
+    snapshot.invalidate()
+    return 0
+
+
+@app.command()
+def rollback(plugin_name: str) -> int:
+    '''Reinstalls the previously installed version of a plugin.'''
+    if plugin_name not in plugins_registry:
+        raise typer.Exit(errno.ENODATA)
+
+    plugin = Plugin(plugin_name)
+    version = store.previous_version(plugin_name, plugin.version_string)
+    if version is None:
+        print(f'No previous version of plugin {plugin_name} is available locally.')
+        raise typer.Exit(errno.ENODATA)
+    return_code = plugin.install_stored(version)
+    snapshot.invalidate()
+    if return_code != 0:
+        raise typer.Exit(return_code)
+    print(f'Plugin {plugin_name} has been rolled back to v{version}.')
     return 0
 
 
@@ -207,9 +287,24 @@ def upgrade(
         if version != 'latest':
             print('Cannot upgrade all plugins with a specific version.')
             raise typer.Exit(1)
-        for plugin_name in plugins_registry:
-            plugin = Plugin(plugin_name)
-            plugin.upgrade('latest')
+        upgrades, timings = upgrade_plugins([Plugin(plugin_name) for plugin_name in plugins_registry.installed_from()])
+        snapshot.invalidate()
+        if not upgrades:
+            print('All plugins are up to date.')
+            return 0
+        table = Table('plugin_name', 'from', 'to', 'status', 'download', 'extract', 'commit')
+        for upgrade in upgrades:
+            table.add_row(
+                upgrade.plugin.plugin_name, upgrade.current_version, upgrade.version, upgrade.status,
+                *(
+                    f'{upgrade.timings[step]:.2f}s' if step in upgrade.timings else '-'
+                    for step in ('download', 'extract', 'commit')
+                ),
+            )
+        console.print(table)
+        console.print(', '.join(f'{step} {duration:.2f}s' for step, duration in timings.items()))
+        if any(upgrade.status != 'upgraded' for upgrade in upgrades):
+            raise typer.Exit(1)
         return 0
 
     if plugin_name not in plugins_registry:
@@ -217,6 +312,7 @@ def upgrade(
 
     plugin = Plugin(plugin_name)
     return_code = plugin.upgrade(version)
+    snapshot.invalidate()
     if return_code == 0:
         return 0
     raise typer.Exit(return_code)
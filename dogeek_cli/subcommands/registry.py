@@ -1,6 +1,8 @@
 from http import HTTPStatus
 from typing import Optional
 
+import requests
+from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn, TransferSpeedColumn
 import typer
 
 from dogeek_cli import Logger
@@ -34,12 +36,35 @@ def publish(
         logger.error('Plugin %s version %s already exists', plugin_name, version)
         raise typer.Exit(1)
 
-    response = plugin.client.post(
-        f'/v1/plugins/{plugin_name}/versions/{version}',
-        do_sign=True, json={"tarball": plugin.tarball},
-    )
-    if response.status_code == HTTPStatus.FORBIDDEN:
-        print(response.json()['detail'])
+    archive_path, sha256 = plugin.build_archive()
+    with Progress(
+        TextColumn('{task.description}'), BarColumn(), DownloadColumn(), TransferSpeedColumn(),
+    ) as progress:
+        task = progress.add_task(f'Uploading {plugin_name} v{version}', total=archive_path.stat().st_size)
+        try:
+            response = plugin.client.upload_archive(
+                plugin_name, version, archive_path, sha256,
+                on_progress=lambda sent: progress.update(task, completed=sent),
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error('Upload of plugin %s version %s interrupted : %s', plugin_name, version, e)
+            print('The upload was interrupted, publish the plugin again to resume it.')
+            raise typer.Exit(1)
+
+    if response is None:
+        # Older registries only accept the archive base85 encoded in a JSON body
+        response = plugin.client.post(
+            f'/v1/plugins/{plugin_name}/versions/{version}',
+            do_sign=True, json={"tarball": plugin.tarball},
+        )
+    if not 200 <= response.status_code < 300:
+        # The archive is kept, for the upload to be resumed
+        try:
+            print(response.json()['detail'])
+        except (ValueError, KeyError, TypeError):
+            print(f'The registry answered {response.status_code} {response.reason}.')
+        raise typer.Exit(1)
+    archive_path.unlink(missing_ok=True)
     return 0
 
 
@@ -1,10 +1,15 @@
 '''Subcommand that handles system cleanups and such.'''
+import errno
+import os
 import shutil
+import socket
 
 import typer
 
+from dogeek_cli import server
 from dogeek_cli.enums import PurgeWhat
-from dogeek_cli.config import logs_path, tmp_dir
+from dogeek_cli.config import logs_path, plugins_registry, tmp_dir
+from dogeek_cli.plugin import Plugin
 from dogeek_cli.state import State
 
 app = typer.Typer()
@@ -18,8 +23,37 @@ def purge(what: PurgeWhat):
         print('Deleting %s ' % what.value)
     match what:
         case PurgeWhat.LOGS:
-            shutil.rmtree(logs_path)
-            logs_path.mkdir(exist_ok=True, parents=True)
+            shutil.rmtree(logs_path, ignore_errors=True)
         case PurgeWhat.TMP:
             shutil.rmtree(tmp_dir)
             tmp_dir.mkdir(exist_ok=True, parents=True)
+
+
+@app.command()
+def rebuild_cache() -> int:
+    '''Rebuilds the plugins metadata and the command tree snapshot.'''
+    # Circular import : dogeek_cli.app imports this module while building the command tree
+    from dogeek_cli.app import make_command_tree
+
+    for plugin_name in plugins_registry:
+        plugin = Plugin(plugin_name)
+        if plugin.enabled:
+            plugin.make_meta(force_update=True)
+    make_command_tree(force_rebuild=True)
+    return 0
+
+
+@app.command()
+def serve() -> int:
+    '''Serves the commands of `cli-remote` from a warm process, until interrupted.'''
+    if not hasattr(os, 'fork') or not hasattr(socket, 'recv_fds'):
+        print('The server needs fork() and Unix sockets, which this platform does not have.')
+        raise typer.Exit(errno.ENOTSUP)
+    try:
+        server.serve()
+    except FileExistsError as e:
+        print(f'{e.strerror} on {e.filename}.')
+        raise typer.Exit(errno.EADDRINUSE)
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -0,0 +1,153 @@
+'''
+Bulk upgrade of the plugins installed from registries.
+
+The upgrades are planned with a single concurrent round of version lookups,
+the archives are downloaded in parallel to the artifact store and extracted
+in worker processes. The new versions are then swapped in together, and the
+registry is written once at the end.
+'''
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from dogeek_cli.config import config, plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin, extract_stored_archive, fetch_latest_versions
+from dogeek_cli.store import store
+
+
+@dataclass
+class Upgrade:
+    plugin: Plugin
+    current_version: str
+    version: str
+    status: str = 'planned'
+    sha256: str | None = None
+    staging_path: Path | None = None
+    path: Path | None = None
+    # Registry entry and metadata of the current version, restored if the new one can't be loaded
+    backup: tuple[dict | None, dict | None] = (None, None)
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def parse_version(version: str) -> tuple[int]:
+    return tuple(int(c) for c in version.split('.'))
+
+
+def plan(plugins: list[Plugin]) -> list[Upgrade]:
+    '''Returns the upgrades of the plugins which have a newer version on their registry.'''
+    latest_versions = fetch_latest_versions(plugins)
+    upgrades = []
+    for plugin in plugins:
+        latest_version = latest_versions.get(plugin.plugin_name)
+        if latest_version is None or parse_version(latest_version) <= plugin.version:
+            continue
+        upgrades.append(Upgrade(plugin, plugin.version_string, latest_version))
+    return upgrades
+
+
+def download(upgrade: Upgrade) -> Upgrade:
+    start = time.perf_counter()
+    try:
+        upgrade.sha256 = upgrade.plugin.fetch_archive(upgrade.version)
+    except Exception as e:
+        upgrade.status = f'download failed : {e}'
+    else:
+        if upgrade.sha256 is None:
+            upgrade.status = 'download failed'
+    upgrade.timings['download'] = time.perf_counter() - start
+    return upgrade
+
+
+def extract(upgrades: list[Upgrade], executor: ProcessPoolExecutor) -> None:
+    for upgrade in upgrades:
+        upgrade.staging_path = Path(tempfile.mkdtemp(prefix='.install-', dir=plugins_path))
+    futures = [
+        (upgrade, time.perf_counter(), executor.submit(extract_stored_archive, upgrade.sha256, upgrade.staging_path))
+        for upgrade in upgrades
+    ]
+    for upgrade, start, future in futures:
+        try:
+            filename = future.result()
+        except Exception as e:
+            upgrade.status = f'extraction failed : {e}'
+        else:
+            if filename is None:
+                upgrade.status = 'empty archive'
+            else:
+                upgrade.path = upgrade.staging_path / filename
+        upgrade.timings['extract'] = time.perf_counter() - start
+    return
+
+
+def commit(upgrades: list[Upgrade]) -> None:
+    '''
+    Swaps all the extracted upgrades in, or none of them.
+
+    The plugins' metadata is then cached, and the registry written once. The
+    upgrades which can't be loaded are reverted to their current version.
+    '''
+    swapped: list[Upgrade] = []
+    try:
+        for upgrade in upgrades:
+            upgrade.backup = upgrade.plugin.backup_entry()
+            upgrade.path = upgrade.plugin.swap_in(upgrade.path, upgrade.staging_path)
+            swapped.append(upgrade)
+    except OSError as e:
+        for upgrade in reversed(swapped):
+            upgrade.plugin.swap_out(upgrade.path, upgrade.staging_path)
+        for upgrade in upgrades:
+            upgrade.status = f'rolled back : {e}'
+        return
+
+    with plugins_registry.batch(), config.batch():
+        for upgrade in upgrades:
+            start = time.perf_counter()
+            registry = upgrade.plugin.installed_from
+            try:
+                upgrade.plugin.cache_plugin_metadata(upgrade.path, installed_from=registry)
+            except Exception as e:
+                upgrade.plugin.swap_out(upgrade.path, upgrade.staging_path)
+                upgrade.plugin.restore_entry(upgrade.backup)
+                upgrade.status = f'reverted : {e}'
+            else:
+                store.record(upgrade.plugin.plugin_name, upgrade.version, upgrade.sha256, registry)
+                upgrade.status = 'upgraded'
+            upgrade.timings['commit'] = time.perf_counter() - start
+    return
+
+
+def upgrade_plugins(plugins: list[Plugin], max_workers: int = 8) -> tuple[list[Upgrade], dict[str, float]]:
+    '''
+    Upgrades the plugins to their latest version.
+
+    Returns the upgrades, and the time taken by each step.
+    '''
+    timings = {}
+    start = time.perf_counter()
+    upgrades = plan([plugin for plugin in plugins if plugin.installed_from is not None])
+    timings['plan'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(download, upgrades))
+    timings['download'] = time.perf_counter() - start
+
+    pending = [upgrade for upgrade in upgrades if upgrade.status == 'planned']
+    try:
+        start = time.perf_counter()
+        if pending:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                extract(pending, executor)
+        timings['extract'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        commit([upgrade for upgrade in pending if upgrade.status == 'planned'])
+        timings['commit'] = time.perf_counter() - start
+    finally:
+        for upgrade in pending:
+            if upgrade.staging_path is not None:
+                shutil.rmtree(upgrade.staging_path, ignore_errors=True)
+    return upgrades, timings
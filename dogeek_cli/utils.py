@@ -1,19 +1,24 @@
 import os
 import os.path
 import contextlib
+import json
 from pathlib import Path
+import shutil
+import sys
 import tarfile
 import textwrap
+import time
 import subprocess
-from typing import Callable
+from typing import Callable, Iterable
 from http import HTTPStatus
 import packaging.version
 
-import requests
-from rich.console import Console
-
 from dogeek_cli.config import config
 
+version_cache_path: Path = config.app_path / 'version.json'
+# Timeout of the request to pypi, in seconds
+VERSION_CHECK_TIMEOUT = 5
+
 
 def clean_help_string(help_string: str | None) -> str:
     if help_string is None:
@@ -49,10 +54,45 @@ def open_editor(path: Path) -> None:
     return
 
 
-def open_pager(path: Path) -> None:
+def open_pager(content: Path | Iterable[str]) -> None:
+    '''
+    Pages on a file, or on text written to the pager as it is produced.
+
+    The content is printed as it is when the pager can't be started.
+    '''
     pager = config['app.pager.name'] or os.getenv('PAGER', 'less')
     pager_flags = config['app.pager.flags'] or []
-    subprocess.call([pager] + pager_flags + [str(path.resolve())])
+    if isinstance(content, Path):
+        try:
+            subprocess.call([pager] + pager_flags + [str(content.resolve())])
+        except OSError:
+            sys.stdout.flush()
+            with open(content, 'rb') as fp:
+                shutil.copyfileobj(fp, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        return
+
+    # As git does : colors, and no paging when the text fits on the screen
+    environ = {'LESS': 'FRX', **os.environ}
+    try:
+        process = subprocess.Popen([pager] + pager_flags, stdin=subprocess.PIPE, env=environ, encoding='utf8')
+    except OSError:
+        # The pager isn't installed
+        for chunk in content:
+            sys.stdout.write(chunk)
+        sys.stdout.flush()
+        return
+    try:
+        for chunk in content:
+            # The pager blocks the writes when it is full, the rest is produced as the user scrolls
+            process.stdin.write(chunk)
+            process.stdin.flush()
+    except BrokenPipeError:
+        # The pager was quit before the end
+        pass
+    with contextlib.suppress(BrokenPipeError):
+        process.stdin.close()
+    process.wait()
     return
 
 
@@ -66,19 +106,25 @@ class Singleton(type):
 
 
 def get_pypi_version(
-    package: str, url_pattern: str | None = None
+    package: str, url_pattern: str | None = None, timeout: float | None = None
 ) -> packaging.version.Version | None:
     '''Returns version of package on pypi.python.org using json.'''
+    import requests
+
     if url_pattern is None:
         url_pattern = 'https://pypi.python.org/pypi/{package}/json'
 
-    with contextlib.suppress(requests.exceptions.ConnectionError):
-        response = requests.get(url_pattern.format(package=package))
+    with contextlib.suppress(requests.exceptions.RequestException):
+        response = requests.get(url_pattern.format(package=package), timeout=timeout)
         if response.status_code != HTTPStatus.OK:
             return
 
-        latest = packaging.version.parse('0')
         data = response.json()
+        latest = packaging.version.parse(data.get('info', {}).get('version', '0'))
+        if not latest.is_prerelease:
+            return latest
+
+        latest = packaging.version.parse('0')
         releases = data.get('releases', [])
         for release in releases:
             release_version = packaging.version.parse(release)
@@ -88,12 +134,51 @@ def get_pypi_version(
     return None
 
 
-def check_version(current_version: str) -> None:
-    '''Checks if a new version of the package is available.'''
-    latest_version = get_pypi_version('dogeek_cli')
+def write_version_cache(latest_version: str | None) -> None:
+    cache = {'checked_at': time.time(), 'latest_version': latest_version}
+    tmp_path = version_cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(cache))
+    os.replace(tmp_path, version_cache_path)
+    return
+
+
+def read_version_cache() -> dict:
+    try:
+        return json.loads(version_cache_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def refresh_version_cache(package: str = 'dogeek_cli') -> None:
+    '''Fetches the latest version of the package from pypi, and caches it.'''
+    latest_version = get_pypi_version(package, timeout=VERSION_CHECK_TIMEOUT)
     if latest_version is None:
+        # Keep the previously known version when pypi can't be reached.
+        latest_version = read_version_cache().get('latest_version')
+    write_version_cache(str(latest_version) if latest_version is not None else None)
+    return
+
+
+def check_version(current_version: str) -> None:
+    '''
+    Checks if a new version of the package is available.
+
+    Only the cached latest version is checked, the cache being refreshed in
+    a background process once it is older than `app.version_check_ttl` seconds.
+    '''
+    cache = read_version_cache()
+    if time.time() - cache.get('checked_at', 0) > config['app.version_check_ttl']:
+        # Marks the cache as checked first, so that concurrent runs don't refresh it as well.
+        write_version_cache(cache.get('latest_version'))
+        subprocess.Popen(
+            [sys.executable, '-c', 'from dogeek_cli.utils import refresh_version_cache; refresh_version_cache()'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    if cache.get('latest_version') is None:
         return
 
+    latest_version = packaging.version.parse(cache['latest_version'])
     current_version: packaging.version.Version = packaging.version.parse(current_version)
     color = None
     if current_version < latest_version:
@@ -106,6 +191,8 @@ def check_version(current_version: str) -> None:
 
     if color is not None:
         # Color is only defined if the current version of the package is outdated.
+        from rich.console import Console
+
         err_console = Console(stderr=True)
         err_console.print(f'[{color} bold]dogeek_cli v{str(latest_version)} is out![/]')
         # TODO: Make the command a clickable link that paste into the terminal
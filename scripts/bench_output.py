@@ -0,0 +1,53 @@
+'''
+Benchmarks the formatter's output of a large JSON document.
+
+Compares the highlighted output printed to terminals with the plain output
+written when stdout is piped, on a synthetic document of 50MB. Both are
+written to /dev/null. Highlighting a document that large takes several
+minutes and GBs of memory, smaller sizes give the ratio faster. Usage :
+
+    python -m scripts.bench_output [size_in_mb]
+'''
+import os
+import sys
+import tempfile
+import time
+
+# The CLI's configuration is isolated from the user's
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='dogeek_cli-bench-')
+
+from rich.console import Console  # noqa: E402
+
+from dogeek_cli.enums import OutputFormat  # noqa: E402
+from dogeek_cli.formatter import formatter  # noqa: E402
+from dogeek_cli.state import state  # noqa: E402
+
+
+def make_document(size: int) -> list[dict]:
+    '''Returns a list of rows weighing about `size` bytes once serialized.'''
+    row = {'id': 0, 'name': 'plugin', 'enabled': True, 'version': '1.0.0', 'tags': ['alpha', 'beta']}
+    # Serialized with an indent of 2, a row weighs about 140 bytes
+    return [{**row, 'id': i} for i in range(size // 140)]
+
+
+def measure(document: list[dict], terminal: bool) -> float:
+    '''Returns the duration (s) of the output of `document`.'''
+    with open(os.devnull, 'w') as output:
+        formatter.console = Console(file=output, force_terminal=terminal)
+        start = time.perf_counter()
+        formatter(document)
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 50 * 1024 * 1024
+    document = make_document(size)
+    state.format = OutputFormat.JSON
+    print(f'Synthetic JSON document of {size / 1024 / 1024:.0f}MB')
+    for name, terminal in (('plain', False), ('highlighted', True)):
+        print(f'{name:>12} : {measure(document, terminal):6.2f}s')
+    return
+
+
+if __name__ == '__main__':
+    main()
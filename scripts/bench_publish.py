@@ -0,0 +1,75 @@
+'''
+Benchmarks the upload payload of `cli plugins registry publish`.
+
+Compares the base85 JSON body sent to older registries with the streamed
+binary body, on a synthetic plugin of a few MB. Usage :
+
+    python -m scripts.bench_publish [size_in_mb]
+'''
+import json
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The CLI's configuration is isolated from the user's
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='dogeek_cli-bench-')
+
+from dogeek_cli.client import iter_file  # noqa: E402
+from dogeek_cli.config import plugins_path, plugins_registry  # noqa: E402
+from dogeek_cli.plugin import Plugin, archives_path  # noqa: E402
+
+
+def make_plugin(size: int) -> Plugin:
+    '''Creates a directory plugin bundling `size` bytes of data, half of it compressible.'''
+    path: Path = plugins_path / 'bench'
+    path.mkdir(parents=True, exist_ok=True)
+    (path / '__init__.py').write_text("'''Benchmark plugin.'''\nimport typer\n\napp = typer.Typer()\n")
+    (path / 'data.bin').write_bytes(os.urandom(size // 2))
+    words = ('alpha', 'beta', 'gamma', 'delta')
+    (path / 'words.txt').write_text(' '.join(random.choice(words) for _ in range(size // 12)))
+    plugins_registry['bench'] = {
+        'path': str(path), 'is_dir': True, 'logger': 'bench',
+        'metadata': {'name': 'bench', 'help': ''}, 'version': '1.0.0', 'installed_from': None,
+    }
+    return Plugin('bench')
+
+
+def measure(function) -> tuple[float, float, int]:
+    '''Returns the duration (s), peak memory (MB) and payload size (bytes) of `function`.'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    payload_size = function()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak / 1024 / 1024, payload_size
+
+
+def json_body(plugin: Plugin) -> int:
+    return len(json.dumps({'tarball': plugin.tarball}).encode('utf8'))
+
+
+def streamed_body(plugin: Plugin) -> int:
+    archive_path, _ = plugin.build_archive()
+    return sum(len(chunk) for chunk in iter_file(archive_path, 0, None))
+
+
+def main() -> None:
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 16 * 1024 * 1024
+    plugin = make_plugin(size)
+    print(f'Synthetic plugin of {size / 1024 / 1024:.0f}MB')
+    for name, function in (('base85 JSON', json_body), ('streamed', streamed_body)):
+        for archive_path in archives_path.glob('*'):
+            # Both measures include building the archive
+            archive_path.unlink()
+        duration, peak, payload_size = measure(lambda: function(plugin))
+        print(f'{name:>12} : {duration:6.2f}s, peak memory {peak:7.1f}MB, payload {payload_size / 1024 / 1024:6.1f}MB')
+    return
+
+
+if __name__ == '__main__':
+    main()
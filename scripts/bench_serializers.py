@@ -0,0 +1,57 @@
+'''
+Benchmarks the installed backends of each serialized output format.
+
+Serializes a document of plugin entries, and streams its rows one at a
+time, with every installed backend. Usage :
+
+    python -m scripts.bench_serializers [rows]
+'''
+import os
+import sys
+import tempfile
+import timeit
+
+# The CLI's configuration is isolated from the user's
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='dogeek_cli-bench-')
+
+from dogeek_cli.serializers import TOML_ROWS_KEY, serializers  # noqa: E402
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            'name': f'plugin-{i}', 'version': '1.2.0', 'enabled': i % 3 != 0, 'size': i * 1024,
+            'tags': ['alpha', 'beta'], 'metadata': {'help': 'Says hello to people. ✓', 'ratio': i / 7},
+        }
+        for i in range(count)
+    ]
+
+
+def best_of(function, repeat: int = 5) -> float:
+    '''Returns the shortest duration of `function`, in seconds.'''
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(count)
+    print(f'{count} rows')
+    for format_name, backends in serializers.items():
+        # TOML documents are tables
+        document = {TOML_ROWS_KEY: rows} if format_name == 'toml' else rows
+        for serializer in backends:
+            if not serializer.available:
+                print(f'{format_name:>6} {serializer.backend:>8} : not installed')
+                continue
+            dumps_row = serializer.dumps_row or serializer.dumps
+            document_duration = best_of(lambda: serializer.dumps(document))
+            rows_duration = best_of(lambda: [dumps_row(row) for row in rows])
+            print(
+                f'{format_name:>6} {serializer.backend:>8} : '
+                f'document {document_duration * 1000:8.1f}ms, rows {rows_duration * 1000:8.1f}ms'
+            )
+    return
+
+
+if __name__ == '__main__':
+    main()
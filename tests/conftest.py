@@ -0,0 +1,45 @@
+import io
+import os
+import re
+import tarfile
+import tempfile
+
+import pytest
+
+
+# The CLI creates its files in the user's config directory as soon as it is imported.
+os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='dogeek_cli-tests-')
+
+PLUGIN_SOURCE = '''"""Says hello."""
+import typer
+
+__version__ = '{version}'
+app = typer.Typer()
+
+
+@app.command()
+def say() -> None:
+    print('hello')
+'''
+
+
+def make_archive(members: dict[str, bytes], links: dict[str, str] | None = None) -> bytes:
+    '''Returns a gzipped tarball of `members`, and of symbolic `links` to their target.'''
+    output = io.BytesIO()
+    with tarfile.open(fileobj=output, mode='w:gz') as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+        for name, target in (links or {}).items():
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            archive.addfile(info)
+    return output.getvalue()
+
+
+@pytest.fixture
+def plugin_name(request) -> str:
+    '''Name of the plugins of a test, as a valid module name.'''
+    return re.sub(r'\W', '_', request.node.name)
@@ -0,0 +1,176 @@
+'''A local stand-in registry, serving and receiving plugin versions.'''
+from base64 import b85decode, b85encode
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from tests.conftest import make_archive
+
+
+class StandInRegistry(ThreadingHTTPServer):
+    '''
+    Serves the versions of the plugins in `versions`, by plugin name and version.
+
+    Older registries are stood in for by turning `manifests`, `archives`,
+    `batch_lookups` or `uploads` off. The paths of the requests are kept in
+    `requests`, and the published archives in `published`.
+    '''
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), RegistryHandler)
+        self.versions: dict[str, dict[str, dict[str, bytes]]] = {}
+        self.manifests = True
+        self.archives = True
+        self.batch_lookups = True
+        self.uploads = True
+        self.requests: list[str] = []
+        self.published: dict[tuple[str, str], bytes] = {}
+        # The uploads in progress, by id, and their plugin name, version and size
+        self.upload_data: dict[str, bytearray] = {}
+        self.upload_info: dict[str, tuple[str, str, int]] = {}
+        # Uploads are interrupted once they received that many bytes
+        self.interrupt_after: int | None = None
+        # Status of the uploads once they are complete
+        self.upload_status = 204
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+    def add(self, plugin_name: str, version: str, files: dict[str, bytes]) -> bytes:
+        '''Adds a plugin version, from its files by path, and returns its archive.'''
+        self.versions.setdefault(plugin_name, {})[version] = files
+        return make_archive(files)
+
+    def latest(self, plugin_name: str) -> str | None:
+        versions = self.versions.get(plugin_name)
+        if not versions:
+            return None
+        return max(versions, key=lambda version: tuple(int(c) for c in version.split('.')))
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+        return
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: StandInRegistry
+
+    def log_message(self, *args) -> None:
+        return
+
+    def send(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def send_json(self, data, status: int = 200) -> None:
+        self.send(status, json.dumps({'data': data, 'detail': 'Not found'}).encode('utf8'))
+        return
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        self.server.requests.append(url.path)
+        parts = url.path.strip('/').split('/', 6)
+        if parts[:4] == ['v1', 'plugins', 'versions', 'latest']:
+            if not self.server.batch_lookups:
+                return self.send_json(None, 404)
+            plugin_names = parse_qs(url.query).get('plugins', [])
+            return self.send_json([
+                {'name': plugin_name, 'version': self.server.latest(plugin_name)} for plugin_name in plugin_names
+            ])
+
+        if len(parts) == 4 and parts[3] == 'versions':
+            if parts[2] not in self.server.versions:
+                return self.send_json(None, 404)
+            return self.send_json([{'version': version} for version in self.server.versions[parts[2]]])
+        _, _, plugin_name, _, version, *rest = parts + [None] * (5 - len(parts))
+        if version == 'latest':
+            version = self.server.latest(plugin_name)
+        files = self.server.versions.get(plugin_name, {}).get(version)
+        if files is None:
+            return self.send_json(None, 404)
+        if not rest:
+            return self.send_json({'version': version, 'file': b85encode(make_archive(files)).decode('utf8')})
+        if rest[0] == 'manifest' and self.server.manifests:
+            return self.send_json({'version': version, 'files': {
+                path: {'sha256': hashlib.sha256(content).hexdigest(), 'size': len(content)}
+                for path, content in files.items()
+            }})
+        if rest[0] == 'files' and self.server.manifests and rest[1] in files:
+            return self.send(200, files[rest[1]], 'application/octet-stream')
+        if rest[0] == 'archive' and self.server.archives:
+            return self.send(200, make_archive(files), 'application/gzip')
+        return self.send_json(None, 404)
+
+    def read_chunked(self, upload: bytearray) -> bool:
+        '''Appends a chunked body to `upload`, returns False if the upload is interrupted.'''
+        while size := int(self.rfile.readline().strip(), 16):
+            upload += self.rfile.read(size)
+            self.rfile.readline()
+            if self.server.interrupt_after is not None and len(upload) >= self.server.interrupt_after:
+                self.server.interrupt_after = None
+                return False
+        self.rfile.readline()
+        return True
+
+    def do_HEAD(self) -> None:
+        self.server.requests.append(self.path)
+        upload = self.server.upload_data.get(self.path.rsplit('/', 1)[1])
+        if upload is None:
+            return self.send_json(None, 404)
+        self.send_response(200)
+        self.send_header('Upload-Offset', str(len(upload)))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+
+    def do_POST(self) -> None:
+        self.server.requests.append(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or 'null')
+        parts = self.path.strip('/').split('/')
+        if parts == ['v1', 'plugins']:
+            self.server.versions.setdefault(body['name'], {})
+            return self.send_json({'name': body['name']}, 201)
+        plugin_name, version = parts[2], parts[4]
+        if parts[5:] == ['uploads']:
+            if not self.server.uploads:
+                return self.send_json(None, 404)
+            upload_id = f'upload-{len(self.server.upload_data)}'
+            self.server.upload_data[upload_id] = bytearray()
+            self.server.upload_info[upload_id] = (plugin_name, version, body['size'])
+            return self.send_json({'id': upload_id}, 201)
+        self.server.published[plugin_name, version] = b85decode(body['tarball'])
+        return self.send_json({'version': version}, 201)
+
+    def do_PATCH(self) -> None:
+        self.server.requests.append(self.path)
+        upload_id = self.path.rsplit('/', 1)[1]
+        upload = self.server.upload_data[upload_id]
+        if int(self.headers['Upload-Offset']) != len(upload):
+            return self.send_json(None, 409)
+        if not self.read_chunked(upload):
+            # As if the connection was lost
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        plugin_name, version, size = self.server.upload_info[upload_id]
+        if len(upload) == size and self.server.upload_status < 300:
+            self.server.published[plugin_name, version] = bytes(upload)
+        if self.server.upload_status == 204:
+            return self.send(204, b'')
+        detail = f'The upload ended with status {self.server.upload_status}'
+        self.send(self.server.upload_status, json.dumps({'detail': detail}).encode('utf8'))
+        return
@@ -0,0 +1,64 @@
+'''Tests of the process-wide registry clients, and of the loading of the keys.'''
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import pytest
+
+from dogeek_cli import client as client_module
+from dogeek_cli.client import ClientPool, clients
+from dogeek_cli.config import config
+
+from tests.stand_in_registry import StandInRegistry
+
+
+@pytest.fixture
+def registry() -> Iterator[StandInRegistry]:
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    (config.app_path / 'key').unlink(missing_ok=True)
+    client_module.load_public_key.cache_clear()
+    client_module.load_private_key.cache_clear()
+    registry = StandInRegistry()
+    yield registry
+    registry.close()
+    client_module.load_private_key.cache_clear()
+
+
+def test_clients_are_reused(registry: StandInRegistry) -> None:
+    assert ClientPool() is clients
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        pooled = set(map(id, executor.map(lambda _: clients[registry.url], range(32))))
+    assert pooled == {id(clients[registry.url])}
+    assert clients['registry.example.com'] is not clients[registry.url]
+
+    client = clients[registry.url]
+    for _ in range(3):
+        assert client.get('/v1/plugins/unknown/versions/latest').status_code == 404
+    # The connection to the registry is kept alive between requests
+    pools = client.get_adapter(registry.url).poolmanager.pools
+    assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+
+def test_keys_are_read_once(registry: StandInRegistry) -> None:
+    first, second = clients[registry.url + '/first'], clients[registry.url + '/second']
+    assert first.headers['Authorization'] == second.headers['Authorization'] == 'ssh-rsa AAAA test'
+    assert client_module.load_public_key.cache_info().misses == 1
+
+
+def test_private_key_is_only_read_to_sign(registry: StandInRegistry) -> None:
+    client = clients[registry.url]
+    # No private key is needed for unsigned requests
+    response = client.get('/v1/plugins/unknown/versions/latest')
+    assert 'X-Signature' not in response.request.headers
+    assert client_module.load_private_key.cache_info().currsize == 0
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    (config.app_path / 'key').write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    for _ in range(2):
+        response = client.post('/v1/plugins', do_sign=True, json={'name': 'signed'})
+        assert response.status_code == 201
+        assert response.request.headers['X-Signature']
+    assert client_module.load_private_key.cache_info().misses == 1
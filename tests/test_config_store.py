@@ -0,0 +1,74 @@
+'''Tests of the batched and atomic writes of the JSON stores.'''
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from dogeek_cli.config import JsonRegistry, JsonStore
+
+
+@pytest.fixture
+def store(request) -> JsonStore:
+    store = JsonStore('cli-tests', f'{request.node.name}.json')
+    store.config_path.unlink(missing_ok=True)
+    store.clear()
+    return store
+
+
+@pytest.fixture
+def writes(monkeypatch) -> list[Path]:
+    writes = []
+    os_replace = os.replace
+
+    def replace(src, dst):
+        writes.append(Path(dst))
+        return os_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', replace)
+    return writes
+
+
+def read(store: JsonStore) -> dict:
+    return json.loads(store.config_path.read_text())
+
+
+def test_batch_writes_once(store: JsonStore, writes: list[Path]) -> None:
+    with store.batch():
+        for i in range(10):
+            store[f'key{i}'] = i
+        with store.batch():
+            store['nested'] = {'a': 1}
+        assert writes == []
+    assert writes == [store.config_path]
+    assert read(store)['key9'] == 9
+
+
+def test_batch_saves_nested_changes(store: JsonStore) -> None:
+    store['plugin'] = {'path': '/old'}
+    with store.batch():
+        store['plugin']['path'] = '/new'
+    assert read(store)['plugin']['path'] == '/new'
+
+
+def test_deletions_are_saved(store: JsonStore) -> None:
+    store['a'] = 1
+    store['b'] = 2
+    del store['a']
+    assert store.pop('b') == 2
+    assert read(store) == {}
+
+
+def test_failed_save_keeps_the_file(store: JsonStore) -> None:
+    store['a'] = 1
+    with pytest.raises(TypeError):
+        store['b'] = object()
+    assert read(store) == {'a': 1}
+
+
+def test_registry_missing_entries_are_not_created(request) -> None:
+    registry = JsonRegistry('cli-tests', f'{request.node.name}.json')
+    registry.clear()
+    with pytest.raises(KeyError):
+        registry['missing']
+    assert 'missing' not in registry
@@ -0,0 +1,83 @@
+'''Tests of the delta upgrades of directory plugins, against a local stand-in registry.'''
+import io
+from typing import Iterator
+
+import pytest
+
+from dogeek_cli.config import config, plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin
+
+from tests.conftest import PLUGIN_SOURCE
+from tests.stand_in_registry import StandInRegistry
+
+
+@pytest.fixture
+def registry() -> Iterator[StandInRegistry]:
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    registry = StandInRegistry()
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def plugin(plugin_name: str, registry: StandInRegistry) -> Iterator[Plugin]:
+    '''A directory plugin installed from the stand-in registry, whose version 2.0.0 changes some files.'''
+    archive = registry.add(plugin_name, '1.0.0', {
+        f'{plugin_name}/__init__.py': PLUGIN_SOURCE.format(version='1.0.0').encode('utf8'),
+        f'{plugin_name}/data.txt': b'unchanged' * 1000,
+        f'{plugin_name}/removed.txt': b'removed',
+    })
+    registry.add(plugin_name, '2.0.0', {
+        f'{plugin_name}/__init__.py': PLUGIN_SOURCE.format(version='2.0.0').encode('utf8'),
+        f'{plugin_name}/data.txt': b'unchanged' * 1000,
+        f'{plugin_name}/added.txt': b'added',
+    })
+    plugin = Plugin(plugin_name)
+    assert plugin.install_archive(io.BytesIO(archive), registry.url) == 0
+    registry.requests.clear()
+    yield plugin
+    if plugin_name in plugins_registry:
+        plugin.uninstall()
+
+
+def test_only_changed_files_are_downloaded(
+    registry: StandInRegistry, plugin: Plugin, capsys: pytest.CaptureFixture
+) -> None:
+    name = plugin.plugin_name
+    assert plugin.upgrade('2.0.0') == 0
+    downloaded = {path.split('/files/', 1)[1] for path in registry.requests if '/files/' in path}
+    assert downloaded == {f'{name}/__init__.py', f'{name}/added.txt'}
+    assert not any(path.endswith('/archive') for path in registry.requests)
+    assert 'bytes saved by the delta upgrade' in capsys.readouterr().out
+
+    upgraded = Plugin(name)
+    assert upgraded.version_string == '2.0.0'
+    assert sorted(path.name for path in (plugins_path / name).iterdir() if path.is_file()) == [
+        '__init__.py', 'added.txt', 'data.txt',
+    ]
+    assert not list(plugins_path.glob('.install-*'))
+
+
+@pytest.mark.parametrize('archives', [True, False], ids=['archive', 'base85'])
+def test_registries_without_manifests(registry: StandInRegistry, plugin: Plugin, archives: bool) -> None:
+    registry.manifests = False
+    registry.archives = archives
+    assert plugin.upgrade('2.0.0') == 0
+    assert any(path.endswith('/archive') for path in registry.requests)
+    assert Plugin(plugin.plugin_name).version_string == '2.0.0'
+    assert not (plugins_path / plugin.plugin_name / 'removed.txt').exists()
+
+
+def test_corrupted_files_abort_the_upgrade(
+    registry: StandInRegistry, plugin: Plugin, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+) -> None:
+    name = plugin.plugin_name
+    manifest = plugin.client.get_manifest(name, '2.0.0')
+    # The registry serves files which don't match its manifest
+    manifest['files'][f'{name}/added.txt']['sha256'] = '0' * 64
+    monkeypatch.setattr(plugin.client, 'get_manifest', lambda *args: manifest)
+    assert plugin.upgrade('2.0.0') == 1
+    assert 'Checksum mismatch' in capsys.readouterr().out
+    assert Plugin(name).version_string == '1.0.0'
+    assert (plugins_path / name / 'removed.txt').exists()
+    assert not list(plugins_path.glob('.install-*'))
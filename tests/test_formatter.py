@@ -0,0 +1,203 @@
+'''Tests of the output formats, and of the streaming of iterables.'''
+import importlib
+import io
+import json
+import re
+import weakref
+from typing import Iterator
+
+import pytest
+from rich.console import Console
+import yaml
+
+from dogeek_cli.enums import OutputFormat
+from dogeek_cli.formatter import formatter
+from dogeek_cli.serializers import TOML_ROWS_KEY
+from dogeek_cli.state import state
+
+# The package's `formatter` attribute is the Formatter instance
+formatter_module = importlib.import_module('dogeek_cli.formatter')
+utils_module = importlib.import_module('dogeek_cli.utils')
+CHUNK_SIZE = 10
+
+
+@pytest.fixture(autouse=True)
+def reset_format(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    # Highlighting is slow, the tests print few rows
+    monkeypatch.setattr(formatter_module, 'CHUNK_SIZE', CHUNK_SIZE)
+    monkeypatch.setattr(formatter_module, 'PAGE_SIZE', CHUNK_SIZE)
+    monkeypatch.setattr(formatter_module, 'SAMPLE_SIZE', CHUNK_SIZE)
+    yield
+    state.format = OutputFormat.DEFAULT
+
+
+def rows(count: int) -> Iterator[dict]:
+    for i in range(count):
+        yield {'id': i, 'name': f'row {i}'}
+    return
+
+
+def output(capsys: pytest.CaptureFixture) -> str:
+    # The console pads the lines to its width
+    return '\n'.join(line.rstrip() for line in capsys.readouterr().out.splitlines()) + '\n'
+
+
+def test_json_lines(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.JSON
+    formatter(rows(3))
+    assert [json.loads(line) for line in output(capsys).splitlines()] == list(rows(3))
+
+
+def test_yaml_documents(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.YAML
+    formatter(rows(3))
+    assert list(yaml.safe_load_all(output(capsys))) == list(rows(3))
+
+
+def test_toml_array_of_tables(capsys: pytest.CaptureFixture) -> None:
+    import toml
+
+    state.format = OutputFormat.TOML
+    formatter(rows(3))
+    assert toml.loads(output(capsys)) == {TOML_ROWS_KEY: list(rows(3))}
+
+
+def test_csv_headers(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.CSV
+    formatter(rows(2))
+    assert output(capsys) == 'id,name\n0,row 0\n1,row 1\n'
+    formatter(rows(1), fieldnames=('name', 'missing'))
+    assert output(capsys) == 'name,missing\nrow 0,N/A\n'
+    # The fields of all the rows of a list
+    formatter([{'id': 0}, {'name': 'row 1'}])
+    assert output(capsys) == 'id,name\n0,N/A\nN/A,row 1\n'
+
+
+def test_rows_are_printed_as_they_are_produced(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.JSON
+
+    def produce() -> Iterator[dict]:
+        yield from rows(CHUNK_SIZE)
+        # The first chunk was printed before the next rows are produced
+        assert len(capsys.readouterr().out.splitlines()) == CHUNK_SIZE
+        yield from rows(1)
+
+    formatter(produce())
+    assert len(output(capsys).splitlines()) == 1
+
+
+class Row(dict):
+    '''A row which can be weakly referenced.'''
+
+
+@pytest.mark.parametrize('output_format', list(OutputFormat))
+def test_rows_are_not_held(output_format: OutputFormat, capsys: pytest.CaptureFixture) -> None:
+    state.format = output_format
+    alive, peak = 0, 0
+
+    def collected() -> None:
+        nonlocal alive
+        alive -= 1
+
+    def produce() -> Iterator[dict]:
+        nonlocal alive, peak
+        for row in rows(20 * CHUNK_SIZE):
+            row = Row(row)
+            weakref.finalize(row, collected)
+            alive += 1
+            peak = max(peak, alive)
+            yield row
+
+    formatter(produce())
+    capsys.readouterr()
+    # The rows don't accumulate, at most the printed chunk and the next one are in memory
+    assert 0 < peak <= 2 * CHUNK_SIZE
+
+
+@pytest.fixture
+def terminal(monkeypatch: pytest.MonkeyPatch) -> Iterator[io.StringIO]:
+    '''Prints to a terminal, as seen by rich.'''
+    output = io.StringIO()
+    monkeypatch.setattr(formatter, 'console', Console(file=output, force_terminal=True, color_system='truecolor'))
+    yield output
+    state.raw = False
+
+
+def test_terminal_output_is_highlighted(terminal: io.StringIO) -> None:
+    state.format = OutputFormat.JSON
+    formatter({'id': 0})
+    assert '\x1b[' in terminal.getvalue()
+
+
+def test_raw_output(terminal: io.StringIO) -> None:
+    state.format = OutputFormat.JSON
+    state.raw = True
+    formatter({'id': 0})
+    assert terminal.getvalue() == '{\n  "id": 0\n}\n'
+    # Later commands of the same process are still highlighted
+    state.raw = False
+    formatter({'id': 1})
+    assert '\x1b[' in terminal.getvalue()
+
+
+def test_piped_output_is_written_as_is(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.JSON
+    formatter([{'id': 0, 'name': 'é' * 200}])
+    # Without the padding of the lines to the console's width
+    assert capsys.readouterr().out == json.dumps([{'id': 0, 'name': 'é' * 200}], indent=2, ensure_ascii=False) + '\n'
+
+
+def table_rows(count: int) -> Iterator[dict]:
+    '''Rows as wide as the sampled ones.'''
+    for i in range(count):
+        yield {'id': f'{i:03d}', 'name': f'row {i:03d}'}
+    return
+
+
+def test_table_pages(capsys: pytest.CaptureFixture) -> None:
+    state.format = OutputFormat.TABLE
+    formatter(iter([*table_rows(3 * CHUNK_SIZE), {'id': 'wider than the sampled rows', 'name': 'last'}]))
+    lines = capsys.readouterr().out.splitlines()
+    # A header, its underline, then a line per row
+    assert lines[0].split() == ['id', 'name']
+    assert [line.split()[0] for line in lines[2:2 + 3 * CHUNK_SIZE]] == [f'{i:03d}' for i in range(3 * CHUNK_SIZE)]
+    # The columns are as wide on every page, wider cells are wrapped
+    assert len({line.index('row') for line in lines[2:2 + 3 * CHUNK_SIZE]}) == 1
+    assert lines[2 + 3 * CHUNK_SIZE].index('last') == lines[2].index('row')
+    name_column = lines[2].index('row')
+    assert ''.join(line[:name_column].strip() for line in lines[2 + 3 * CHUNK_SIZE:]) == 'widerthanthesampledrows'
+
+
+def test_tables_are_paged_on_terminals(terminal: io.StringIO, monkeypatch: pytest.MonkeyPatch) -> None:
+    state.format = OutputFormat.TABLE
+    produced = []
+
+    def produce() -> Iterator[dict]:
+        for row in table_rows(5 * CHUNK_SIZE):
+            produced.append(row)
+            yield row
+
+    def open_pager(pages: Iterator[str]) -> None:
+        assert 'row 000' in next(pages)
+        # The next pages are rendered when the pager reads them
+        assert len(produced) < 5 * CHUNK_SIZE
+        assert 'row 049' in ''.join(pages)
+
+    monkeypatch.setattr(formatter_module, 'open_pager', open_pager)
+    formatter(produce())
+    assert terminal.getvalue() == ''
+
+
+def test_tables_are_printed_without_pager(
+    terminal: io.StringIO, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture, tmp_path,
+) -> None:
+    monkeypatch.setattr(utils_module, 'config', {'app.pager.name': 'dogeek-cli-missing-pager', 'app.pager.flags': []})
+    state.format = OutputFormat.TABLE
+    formatter(table_rows(3 * CHUNK_SIZE))
+    # Rendered for the terminal, with its escape codes
+    lines = re.sub(r'\x1b\[[0-9;]*m', '', output(capsys)).splitlines()
+    assert lines[0].split() == ['id', 'name']
+    assert lines[-1].split() == ['029', 'row', '029']
+    (tmp_path / 'latest.log').write_text('logged\n')
+    utils_module.open_pager(tmp_path / 'latest.log')
+    assert capsys.readouterr().out == 'logged\n'
@@ -0,0 +1,89 @@
+'''Tests of the HTTP cache of registry requests, against a local stand-in registry.'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+
+from dogeek_cli.client import Client
+from dogeek_cli.config import config
+from dogeek_cli.http_cache import HTTPCache
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    etag = '"v1"'
+    cache_control = 'no-cache'
+    requests = []
+
+    def log_message(self, *args) -> None:
+        return
+
+    def do_GET(self) -> None:
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'data': {'version': '1.2.0'}}).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Cache-Control', self.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def registry():
+    RegistryHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RegistryHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(registry, tmp_path):
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    host, port = registry.server_address
+    return Client(f'http://{host}:{port}', cache=HTTPCache(tmp_path / 'http_cache', 1024 * 1024))
+
+
+def test_revalidates_stale_responses(client):
+    assert client.get_latest_version('plugin') == '1.2.0'
+    response = client.get('/v1/plugins/plugin/versions/latest')
+    assert response.json()['data']['version'] == '1.2.0'
+    assert getattr(response, 'from_cache', False)
+    assert RegistryHandler.requests[-1]['If-None-Match'] == '"v1"'
+
+
+def test_serves_fresh_responses_from_cache(client, monkeypatch):
+    monkeypatch.setattr(RegistryHandler, 'cache_control', 'max-age=60')
+    client.get('/v1/plugins/plugin/versions/latest')
+    client.get('/v1/plugins/plugin/versions/latest')
+    assert len(RegistryHandler.requests) == 1
+
+
+def test_serves_stale_responses_offline(client, registry):
+    client.get('/v1/plugins/plugin/versions/latest')
+    registry.shutdown()
+    registry.server_close()
+    # Drops the kept-alive connection to the registry
+    client.close()
+    response = client.get('/v1/plugins/plugin/versions/latest', timeout=1)
+    assert response.json()['data']['version'] == '1.2.0'
+    assert 'Warning' in response.headers
+
+
+def test_evicts_least_recently_used_entries(client):
+    client.cache.max_size = 100
+    for i in range(5):
+        client.get(f'/v1/plugins/plugin{i}/versions/latest')
+    assert len(list(client.cache.path.glob('*.body'))) < 5
+    assert client.cache.get(client.registry + '/v1/plugins/plugin4/versions/latest') is not None
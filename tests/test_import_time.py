@@ -0,0 +1,60 @@
+'''Regression tests of the CLI's startup time.'''
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+
+# Cumulated import time of the CLI's modules allowed for `cli --help`, in milliseconds.
+BUDGET_MS = float(os.getenv('CLI_IMPORT_TIME_BUDGET_MS', '400'))
+# Modules which must only be imported on the code paths that need them.
+DEFERRED_MODULES = (
+    'cryptography', 'requests', 'mako', 'gitignore_parser', 'sqlite3',
+    'dogeek_cli.client', 'dogeek_cli.formatter', 'dogeek_cli.subcommands',
+)
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+\d+ \|\s+(?P<cumulative>\d+) \|(?P<indent> +)(?P<module>\S+)$')
+
+
+@pytest.fixture
+def environ(tmp_path) -> dict[str, str]:
+    app_path = tmp_path / 'cli'
+    app_path.mkdir()
+    (app_path / 'config.json').write_text(json.dumps({
+        'app': {'default_verbosity': 0, 'notify_new_version': False, 'logger': {'level': 'info'}}
+    }))
+    environ = {**os.environ, 'XDG_CONFIG_HOME': str(tmp_path)}
+    # The first run builds the command tree snapshot
+    subprocess.run([sys.executable, '-m', 'dogeek_cli', '--help'], env=environ, capture_output=True, check=True)
+    return environ
+
+
+def import_times(environ: dict[str, str]) -> dict[str, int]:
+    '''Runs `cli --help`, and returns the cumulated import time of every module, in microseconds.'''
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'dogeek_cli', '--help'],
+        env=environ, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match is not None:
+            times[match['module']] = (int(match['cumulative']), len(match['indent']))
+    return times
+
+
+def test_help_import_time(environ):
+    times = import_times(environ)
+    total = sum(
+        cumulative for module, (cumulative, indent) in times.items()
+        if module.startswith('dogeek_cli') and indent == 1
+    )
+    assert total / 1000 < BUDGET_MS, f'Importing the CLI took {total / 1000:.0f}ms'
+
+
+def test_help_defers_imports(environ):
+    times = import_times(environ)
+    for module in times:
+        assert not module.startswith(DEFERRED_MODULES), f'{module} is imported by `cli --help`'
@@ -0,0 +1,85 @@
+'''Tests of the lookups of the latest versions of the plugins, against a local stand-in registry.'''
+import io
+from pathlib import Path
+from typing import Callable, Iterator
+
+import pytest
+from typer.testing import CliRunner
+
+from dogeek_cli import plugin as plugin_module
+from dogeek_cli.config import config, plugins_registry
+from dogeek_cli.plugin import Plugin, fetch_latest_versions, read_latest_versions
+from dogeek_cli.subcommands.plugins import app as plugins_app
+
+from tests.conftest import PLUGIN_SOURCE, make_archive
+from tests.stand_in_registry import StandInRegistry
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def registry(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[StandInRegistry]:
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    monkeypatch.setattr(plugin_module, 'latest_versions_path', tmp_path / 'latest_versions.json')
+    registry = StandInRegistry()
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def install(plugin_name: str, registry: StandInRegistry) -> Iterator[Callable[..., Plugin]]:
+    '''Installs version 1.0.0 of a single file plugin, and puts `versions` on the stand-in registry.'''
+    plugins = []
+
+    def install(suffix: str, *versions: str) -> Plugin:
+        name = f'{plugin_name}_{suffix}'
+        for version in versions:
+            registry.add(name, version, {f'{name}.py': PLUGIN_SOURCE.format(version=version).encode('utf8')})
+        plugins.append(Plugin(name))
+        archive = make_archive({f'{name}.py': PLUGIN_SOURCE.format(version='1.0.0').encode('utf8')})
+        assert plugins[-1].install_archive(io.BytesIO(archive), registry.url) == 0
+        return plugins[-1]
+
+    yield install
+    for plugin in plugins:
+        if plugin.plugin_name in plugins_registry:
+            plugin.uninstall()
+
+
+def test_latest_versions_are_batched(registry: StandInRegistry, install) -> None:
+    plugins = [install('first', '1.0.0', '1.1.0'), install('second', '1.0.0', '2.0.0'), install('unknown')]
+    registry.requests.clear()
+    assert fetch_latest_versions(plugins) == {
+        plugins[0].plugin_name: '1.1.0', plugins[1].plugin_name: '2.0.0', plugins[2].plugin_name: None,
+    }
+    assert registry.requests == ['/v1/plugins/versions/latest']
+    # Unknown versions aren't cached
+    assert read_latest_versions() == {plugins[0].plugin_name: '1.1.0', plugins[1].plugin_name: '2.0.0'}
+
+
+def test_latest_versions_are_looked_up_without_batches(registry: StandInRegistry, install) -> None:
+    registry.batch_lookups = False
+    plugins = [install('first', '1.0.0', '1.1.0'), install('second', '1.0.0', '2.0.0'), install('unknown')]
+    registry.requests.clear()
+    assert fetch_latest_versions(plugins) == {
+        plugins[0].plugin_name: '1.1.0', plugins[1].plugin_name: '2.0.0', plugins[2].plugin_name: None,
+    }
+    assert registry.requests[0] == '/v1/plugins/versions/latest'
+    assert sorted(registry.requests[1:]) == sorted(
+        f'/v1/plugins/{plugin.plugin_name}/versions/latest' for plugin in plugins
+    )
+    assert read_latest_versions() == {plugins[0].plugin_name: '1.1.0', plugins[1].plugin_name: '2.0.0'}
+
+
+def test_ls_without_remote(registry: StandInRegistry, install) -> None:
+    install('first', '1.0.0', '1.1.0')
+    result = runner.invoke(plugins_app, ['ls'])
+    assert result.exit_code == 0, result.output
+    assert registry.requests[-1] == '/v1/plugins/versions/latest'
+    registry.requests.clear()
+
+    result = runner.invoke(plugins_app, ['ls', '--no-remote'])
+    assert result.exit_code == 0, result.output
+    assert registry.requests == []
+    # The last known version is still told apart
+    assert '🟠' in result.output
@@ -0,0 +1,92 @@
+'''Tests of the lazy command tree : modules are only imported when their commands are dispatched.'''
+import importlib
+from pathlib import Path
+import sys
+
+from click.shell_completion import ShellComplete
+from click.testing import CliRunner
+import pytest
+from typer.models import TyperInfo
+
+from dogeek_cli.lazy import LazyGroup
+from dogeek_cli.meta import make_group
+
+ROOT = '''
+"""Root of the tree."""
+import typer
+
+app = typer.Typer()
+
+
+@app.callback()
+def callback(verbose: bool = False) -> None:
+    return
+'''
+
+SUBCOMMAND = '''
+"""Greets."""
+import typer
+
+app = typer.Typer()
+
+
+@app.callback()
+def callback(loud: bool = False) -> None:
+    return
+
+
+@app.command()
+def say(name: str, times: int = typer.Option(1, '--times', '-t', min=1)) -> None:
+    """Says hello."""
+    print(' '.join(['hello', name] * times))
+
+
+@app.command()
+def other() -> None:
+    return
+'''
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def tree(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, request) -> tuple[LazyGroup, str]:
+    '''Describes a root group and its subcommand group, then forgets their modules.'''
+    root_name, sub_name = f'{request.node.name}_root', f'{request.node.name}_sub'
+    (tmp_path / f'{root_name}.py').write_text(ROOT)
+    (tmp_path / f'{sub_name}.py').write_text(SUBCOMMAND)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    description = make_group(TyperInfo(importlib.import_module(root_name).app))
+    sub_info = TyperInfo(importlib.import_module(sub_name).app, name='greet', help='Greets.')
+    description['groups'].append({**make_group(sub_info), 'module': sub_name, 'attr': 'app'})
+    for module_name in (root_name, sub_name):
+        monkeypatch.delitem(sys.modules, module_name)
+    return LazyGroup(description, {'module': root_name, 'attr': 'app'}, [], is_root=True), sub_name
+
+
+def test_help_doesnt_import_subcommands(tree: tuple[LazyGroup, str]) -> None:
+    tree, sub_name = tree
+    result = runner.invoke(tree, ['--help'])
+    assert result.exit_code == 0, result.output
+    assert 'greet' in result.output and 'Greets.' in result.output
+    assert sub_name not in sys.modules
+    result = runner.invoke(tree, ['greet', '--help'])
+    assert result.exit_code == 0, result.output
+    assert 'say' in result.output and 'Says hello.' in result.output and '--loud' in result.output
+    assert sub_name not in sys.modules
+
+
+def test_completion_doesnt_import_subcommands(tree: tuple[LazyGroup, str]) -> None:
+    tree, sub_name = tree
+    completions = ShellComplete(tree, {}, 'cli', '_CLI_COMPLETE').get_completions(['greet'], '')
+    assert [item.value for item in completions] == ['other', 'say']
+    assert sub_name not in sys.modules
+
+
+def test_commands_are_imported_on_dispatch(tree: tuple[LazyGroup, str]) -> None:
+    tree, sub_name = tree
+    result = runner.invoke(tree, ['--verbose', 'greet', 'say', 'world', '-t', '2'])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'hello world hello world\n'
+    assert sub_name in sys.modules
+
@@ -0,0 +1,104 @@
+'''Tests of the search of the log files.'''
+import gzip
+import json
+import logging
+import shutil
+
+import pytest
+
+from dogeek_cli import log_search
+from dogeek_cli.config import logs_path
+from dogeek_cli.log_search import make_query, search
+from dogeek_cli.logging import INDEX_NAME, search_index_path
+
+
+def record(day: int, hour: int, level: str, message: str) -> str:
+    return f'2024-01-{day:02d} {hour:02d}:00:00,000 -- {level} : module::function -- {message}\n'
+
+
+@pytest.fixture
+def logger_name() -> str:
+    '''A logger with an archive for the 1st of January, and a log file for the 2nd.'''
+    directory = logs_path / 'searched'
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    (directory / '2024-01-01-searched.log.gz').write_bytes(gzip.compress(''.join((
+        record(1, 8, 'INFO', 'started'),
+        record(1, 9, 'ERROR', 'failed'),
+        'Traceback (most recent call last):\n',
+        '  ValueError: oops\n',
+        record(1, 10, 'DEBUG', 'stopped'),
+    )).encode()))
+    (directory / '2024-01-02-searched.log').write_text(''.join((
+        record(2, 8, 'INFO', 'started again'),
+        record(2, 9, 'WARNING', 'slow'),
+    )))
+    (directory / INDEX_NAME).write_text(json.dumps(['2024-01-01-searched.log.gz', '2024-01-02-searched.log']))
+    return 'searched'
+
+
+def messages(logger_name: str, **kwargs) -> list[str]:
+    return [
+        line.split(' -- ')[-1] for found in search(logger_name, make_query(**kwargs))
+        for line in found.decode().splitlines()[:1]
+    ]
+
+
+def test_search_all_files(logger_name: str) -> None:
+    assert messages(logger_name) == ['started', 'failed', 'stopped', 'started again', 'slow']
+    assert messages(logger_name, pattern='start') == ['started', 'started again']
+
+
+def test_multiline_records(logger_name: str) -> None:
+    found = list(search(logger_name, make_query(pattern='ValueError')))
+    assert len(found) == 1
+    assert found[0].decode().splitlines() == [
+        record(1, 9, 'ERROR', 'failed').strip(), 'Traceback (most recent call last):', '  ValueError: oops',
+    ]
+
+
+def test_time_and_level_filters(logger_name: str) -> None:
+    assert messages(logger_name, since='2024-01-01T09:30') == ['stopped', 'started again', 'slow']
+    assert messages(logger_name, until='2024-01-02T08:00') == ['started', 'failed', 'stopped', 'started again']
+    assert messages(logger_name, level=logging.WARNING) == ['failed', 'slow']
+    assert messages(logger_name, pattern='start', since='2024-01-02') == ['started again']
+
+
+def test_invalid_queries() -> None:
+    with pytest.raises(ValueError):
+        make_query(pattern='(')
+    with pytest.raises(ValueError):
+        make_query(since='yesterday')
+
+
+def test_files_out_of_range_are_skipped(logger_name: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Builds the search indexes
+    messages(logger_name)
+    assert search_index_path(logs_path / logger_name / '2024-01-01-searched.log.gz').exists()
+
+    def decompress(data: bytes) -> bytes:
+        raise AssertionError('The archive should have been skipped')
+
+    monkeypatch.setattr(gzip, 'decompress', decompress)
+    assert messages(logger_name, since='2024-01-02') == ['started again', 'slow']
+    assert messages(logger_name, level=logging.CRITICAL, until='2024-01-01T23:00') == []
+
+
+def test_index_follows_appended_records(logger_name: str) -> None:
+    assert messages(logger_name, level=logging.ERROR) == ['failed']
+    with open(logs_path / logger_name / '2024-01-02-searched.log', 'a') as fp:
+        fp.write(record(2, 10, 'CRITICAL', 'crashed'))
+    assert messages(logger_name, level=logging.ERROR) == ['failed', 'crashed']
+    assert messages(logger_name, since='2024-01-02T09:30') == ['crashed']
+
+
+def test_byte_ranges(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(log_search, 'MARK_INTERVAL', 100)
+    buffer = ''.join(record(1, hour, 'INFO', f'{hour:02d} ' + 'x' * 60) for hour in range(24)).encode()
+    index = log_search.update_index(buffer, None)
+    assert len(index['marks']) > 10
+    query = make_query(since='2024-01-01T12:00', until='2024-01-01T14:00')
+    start, end = log_search.byte_range(index, query)
+    assert 0 < start and end < len(buffer)
+    found = [r.decode().split(' -- ')[-1][:2] for r in log_search.iter_records(buffer, start, end, query)]
+    assert found == ['12', '13', '14']
@@ -0,0 +1,84 @@
+'''Tests of the queued logging to the log files, and of their rotation.'''
+import gzip
+import logging
+import os
+import shutil
+import time
+
+from dogeek_cli.config import logs_path
+from dogeek_cli.logging import LogFilesHandler, Logger, latest_log, queue_handler, read_index
+
+
+def flush() -> None:
+    '''Waits for the listener thread to write the queued records.'''
+    listener = queue_handler.listener
+    listener.stop()
+    listener.start()
+
+
+def test_no_files_until_a_record_is_logged() -> None:
+    shutil.rmtree(logs_path / 'quiet', ignore_errors=True)
+    logger = Logger('quiet')
+    logger.debug('filtered out by the default level')
+    assert not (logs_path / 'quiet').exists()
+
+
+def test_records_are_written_to_the_logger_file() -> None:
+    first, second = Logger('shared'), Logger('shared')
+    first.info('first')
+    second.warning('second')
+    flush()
+    lines = latest_log('shared').read_text().splitlines()
+    assert lines[-2].endswith('INFO : test_logging::test_records_are_written_to_the_logger_file -- first')
+    assert lines[-1].endswith('WARNING : test_logging::test_records_are_written_to_the_logger_file -- second')
+
+
+def make_record(logger_name: str, message: str, created: float | None = None) -> logging.LogRecord:
+    record = logging.LogRecord(logger_name, logging.INFO, __file__, 1, message, None, None)
+    if created is not None:
+        record.created = created
+    return record
+
+
+def test_rotation() -> None:
+    shutil.rmtree(logs_path / 'rotated', ignore_errors=True)
+    handler = LogFilesHandler()
+    handler.max_file_size = 1024
+    handler.max_total_size = 4 * 1024
+    for i in range(200):
+        handler.handle(make_record('rotated', f'{i:04d} ' + 'x' * 100))
+    handler.close()
+
+    files = read_index(logs_path / 'rotated')
+    assert files == sorted(
+        fp.name for fp in (logs_path / 'rotated').iterdir() if fp.name.endswith(('.log', '.log.gz'))
+    )
+    assert files[-1].endswith('-rotated.log')
+    assert all(filename.endswith('.log.gz') for filename in files[:-1])
+    total_size = sum((logs_path / 'rotated' / filename).stat().st_size for filename in files)
+    assert total_size <= 4 * 1024
+    # The newest records are kept, in order
+    lines = [
+        line for filename in files[:-1]
+        for line in gzip.decompress((logs_path / 'rotated' / filename).read_bytes()).decode().splitlines()
+    ] + (logs_path / 'rotated' / files[-1]).read_text().splitlines()
+    assert lines[-1].endswith('0199 ' + 'x' * 100)
+    assert [line.split(' -- ')[-1][:4] for line in lines] == [f'{i:04d}' for i in range(200 - len(lines), 200)]
+
+
+def test_previous_days_are_compressed_and_expire() -> None:
+    shutil.rmtree(logs_path / 'daily', ignore_errors=True)
+    handler = LogFilesHandler()
+    handler.max_age = 2 * 86400
+    now = time.time()
+    for days_ago in (4, 3, 1, 0):
+        handler.handle(make_record('daily', f'{days_ago} days ago', now - days_ago * 86400))
+        path = logs_path / 'daily' / read_index(logs_path / 'daily')[-1]
+        os.utime(path, (now - days_ago * 86400, now - days_ago * 86400))
+    handler.close()
+
+    files = read_index(logs_path / 'daily')
+    assert len(files) == 2
+    assert files[0].endswith('-daily.log.gz')
+    assert gzip.decompress((logs_path / 'daily' / files[0]).read_bytes()).decode().endswith('1 days ago\n')
+    assert latest_log('daily').read_text().endswith('0 days ago\n')
@@ -0,0 +1,115 @@
+'''Tests of the installation of plugins from their archives.'''
+import hashlib
+import io
+import os
+from pathlib import Path
+
+import pytest
+
+from dogeek_cli.config import plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin
+from dogeek_cli.store import store
+
+from tests.conftest import PLUGIN_SOURCE, make_archive
+
+
+def plugin_archive(name: str, version: str = '1.0.0') -> bytes:
+    return make_archive({f'{name}.py': PLUGIN_SOURCE.format(version=version).encode('utf8')})
+
+
+class Stream:
+    '''A stream which can't seek, as the body of a response.'''
+
+    def __init__(self, data: bytes) -> None:
+        self.fileobj = io.BytesIO(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.fileobj.read(size)
+
+
+@pytest.fixture
+def plugin(plugin_name: str) -> Plugin:
+    plugin = Plugin(plugin_name)
+    yield plugin
+    if plugin.plugin_name in plugins_registry:
+        plugin.uninstall()
+
+
+def test_streamed_install(plugin: Plugin) -> None:
+    archive = plugin_archive(plugin.plugin_name)
+    assert plugin.install_archive(Stream(archive), None, hashlib.sha256(archive).hexdigest()) == 0
+    assert plugin.path == plugins_path / f'{plugin.plugin_name}.py'
+    assert plugin.version_string == '1.0.0'
+    assert plugins_registry.read_meta(plugin.plugin_name)['commands'][0]['name'] == 'say'
+    # No staging directory is left behind
+    assert not list(plugins_path.glob('.install-*'))
+
+
+def test_checksum_mismatch(plugin: Plugin, capsys: pytest.CaptureFixture) -> None:
+    assert plugin.install_archive(Stream(plugin_archive(plugin.plugin_name)), None, '0' * 64) == 1
+    assert 'Checksum mismatch' in capsys.readouterr().out
+    assert plugin.plugin_name not in plugins_registry
+    assert not (plugins_path / f'{plugin.plugin_name}.py').exists()
+    assert not list(plugins_path.glob('.install-*'))
+
+
+@pytest.mark.parametrize('archive', [
+    make_archive({'../escaped.py': b'print("escaped")'}),
+    make_archive({'/tmp/dogeek_cli_escaped.py': b'print("escaped")'}),
+    make_archive({'unsafe/__init__.py': b''}, links={'unsafe/link': '/etc/passwd'}),
+    make_archive({'unsafe/__init__.py': b''}, links={'unsafe/../../escaped.py': '__init__.py'}),
+], ids=['parent', 'absolute', 'symlink', 'symlink-outside'])
+def test_unsafe_archives_are_rejected(plugin: Plugin, archive: bytes, capsys: pytest.CaptureFixture) -> None:
+    assert plugin.install_archive(Stream(archive), None) == 1
+    assert 'Unsafe member' in capsys.readouterr().out
+    assert not (plugins_path.parent / 'escaped.py').exists()
+    assert not Path('/tmp/dogeek_cli_escaped.py').exists()
+    assert not (plugins_path / 'unsafe').exists()
+
+
+def test_install_from_the_store(plugin: Plugin) -> None:
+    archive = plugin_archive(plugin.plugin_name, '1.1.0')
+    assert plugin.install_archive(Stream(archive), 'registry') == 0
+    assert store.find(plugin.plugin_name, '1.1.0')['sha256'] == hashlib.sha256(archive).hexdigest()
+    plugin.uninstall()
+    assert plugin.install_stored('1.1.0') == 0
+    assert plugin.version_string == '1.1.0'
+    assert plugin.installed_from == 'registry'
+
+
+def test_broken_versions_are_reverted(plugin: Plugin, capsys: pytest.CaptureFixture) -> None:
+    assert plugin.install_archive(Stream(plugin_archive(plugin.plugin_name)), None) == 0
+    meta = plugins_registry.read_meta(plugin.plugin_name)
+    broken = make_archive({f'{plugin.plugin_name}.py': b'import missing_module_of_a_broken_plugin\n'})
+    assert plugin.install_archive(Stream(broken), None) == 1
+    assert 'the install was reverted' in capsys.readouterr().out
+    # The previous version is still installed, with its registry entry
+    reloaded = Plugin(plugin.plugin_name)
+    assert reloaded.version_string == '1.0.0'
+    assert '__version__' in reloaded.path.read_text()
+    assert plugins_registry.read_meta(plugin.plugin_name) == meta
+    assert not list(plugins_path.glob('.install-*'))
+
+
+def test_broken_new_plugins_are_not_installed(plugin: Plugin) -> None:
+    broken = make_archive({f'{plugin.plugin_name}.py': b'import missing_module_of_a_broken_plugin\n'})
+    assert plugin.install_archive(Stream(broken), None) == 1
+    assert plugin.plugin_name not in plugins_registry
+    assert not (plugins_path / f'{plugin.plugin_name}.py').exists()
+
+
+def test_failed_swaps_are_rolled_back(plugin: Plugin, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert plugin.install_archive(Stream(plugin_archive(plugin.plugin_name)), None) == 0
+    replace = os.replace
+
+    def failing_replace(source, destination) -> None:
+        if Path(source).name == f'{plugin.plugin_name}.py' and '.install-' in str(source):
+            raise OSError('Disk full')
+        replace(source, destination)
+        return
+
+    monkeypatch.setattr(os, 'replace', failing_replace)
+    with pytest.raises(OSError):
+        plugin.install_archive(Stream(plugin_archive(plugin.plugin_name, '2.0.0')), None)
+    assert "__version__ = '1.0.0'" in (plugins_path / f'{plugin.plugin_name}.py').read_text()
+    assert Plugin(plugin.plugin_name).version_string == '1.0.0'
@@ -0,0 +1,103 @@
+'''Tests of the publication of plugins, against a local stand-in registry.'''
+import hashlib
+import io
+import os
+from pathlib import Path
+import tarfile
+from typing import Iterator
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import pytest
+import requests
+from typer.testing import CliRunner
+
+from dogeek_cli import client as client_module
+from dogeek_cli.client import clients, read_uploads
+from dogeek_cli.config import config, plugins_registry
+from dogeek_cli.plugin import Plugin, archives_path
+from dogeek_cli.subcommands.registry import app as registry_app
+
+from tests.conftest import PLUGIN_SOURCE, make_archive
+from tests.stand_in_registry import StandInRegistry
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def registry(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[StandInRegistry]:
+    '''A stand-in registry, and a key pair to sign the requests to it.'''
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    (config.app_path / 'key').write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    client_module.load_private_key.cache_clear()
+    monkeypatch.setattr(client_module, 'uploads_path', tmp_path / 'uploads.json')
+    monkeypatch.setattr(client_module, 'UPLOAD_CHUNK_SIZE', 1024)
+    registry = StandInRegistry()
+    yield registry
+    registry.close()
+    client_module.load_private_key.cache_clear()
+
+
+@pytest.fixture
+def plugin(plugin_name: str) -> Iterator[Plugin]:
+    '''A local plugin, with enough data to be uploaded in several chunks.'''
+    plugin = Plugin(plugin_name)
+    archive = make_archive({
+        f'{plugin_name}/__init__.py': PLUGIN_SOURCE.format(version='1.0.0').encode('utf8'),
+        f'{plugin_name}/data.bin': os.urandom(16 * 1024),
+    })
+    assert plugin.install_archive(io.BytesIO(archive), None) == 0
+    yield plugin
+    if plugin_name in plugins_registry:
+        plugin.uninstall()
+
+
+def test_interrupted_uploads_are_resumed(registry: StandInRegistry, plugin: Plugin, tmp_path: Path) -> None:
+    path = tmp_path / 'archive.tar.gz'
+    path.write_bytes(os.urandom(10 * 1024))
+    sha256 = hashlib.sha256(path.read_bytes()).hexdigest()
+    client = clients[registry.url]
+    registry.interrupt_after = 4096
+    with pytest.raises(requests.exceptions.RequestException):
+        client.upload_archive(plugin.plugin_name, '1.0.0', path, sha256)
+    assert sha256 in read_uploads()
+
+    progress = []
+    response = client.upload_archive(plugin.plugin_name, '1.0.0', path, sha256, on_progress=progress.append)
+    assert response.status_code == 204
+    assert registry.published[plugin.plugin_name, '1.0.0'] == path.read_bytes()
+    # Only the rest of the archive was sent again
+    assert progress[0] == 4096 and progress[-1] == path.stat().st_size
+    assert sum(request.endswith('/uploads') for request in registry.requests) == 1
+    assert read_uploads() == {}
+
+
+def test_older_registries_get_base85(registry: StandInRegistry, plugin: Plugin) -> None:
+    registry.uploads = False
+    path, sha256 = plugin.build_archive()
+    assert clients[registry.url].upload_archive(plugin.plugin_name, '1.0.0', path, sha256) is None
+
+    result = runner.invoke(registry_app, ['publish', plugin.plugin_name, '--registry', registry.url])
+    assert result.exit_code == 0, result.output
+    with tarfile.open(fileobj=io.BytesIO(registry.published[plugin.plugin_name, '1.0.0'])) as archive:
+        assert f'{plugin.plugin_name}/data.bin' in archive.getnames()
+
+
+def test_publish(registry: StandInRegistry, plugin: Plugin) -> None:
+    result = runner.invoke(registry_app, ['publish', plugin.plugin_name, '--registry', registry.url])
+    assert result.exit_code == 0, result.output
+    assert (plugin.plugin_name, '1.0.0') in registry.published
+    assert not list(archives_path.glob(f'{plugin.plugin_name}-*'))
+
+
+@pytest.mark.parametrize('status', [409, 413, 500])
+def test_failed_uploads_keep_the_archive(registry: StandInRegistry, plugin: Plugin, status: int) -> None:
+    registry.upload_status = status
+    result = runner.invoke(registry_app, ['publish', plugin.plugin_name, '--registry', registry.url])
+    assert result.exit_code == 1
+    assert f'The upload ended with status {status}' in result.output
+    # Kept for the upload to be resumed
+    assert list(archives_path.glob(f'{plugin.plugin_name}-*'))
@@ -0,0 +1,113 @@
+'''Tests of the lookup of plugin versions in several registries, against local stand-in registries.'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from dogeek_cli import client as client_module
+from dogeek_cli.client import RegistriesHealth, find_plugin_version
+from dogeek_cli.config import config
+
+
+class Server(ThreadingHTTPServer):
+    # Slow requests don't delay the end of the tests
+    daemon_threads = True
+    block_on_close = False
+
+    def handle_error(self, request, client_address) -> None:
+        # The responses which aren't chosen are closed by the client
+        return
+
+
+def make_registry(status: int = 200, delay: float = 0) -> Server:
+    class RegistryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args) -> None:
+            return
+
+        def do_GET(self) -> None:
+            server.requests.append(self.path)
+            time.sleep(delay)
+            body = json.dumps({'data': {'version': '1.0.0'}, 'message': 'OK'}).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = Server(('127.0.0.1', 0), RegistryHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url(server: Server) -> str:
+    host, port = server.server_address
+    return f'http://{host}:{port}'
+
+
+@pytest.fixture
+def registries(tmp_path, monkeypatch):
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    monkeypatch.setattr(client_module, 'registries_health_path', tmp_path / 'registries_health.json')
+    monkeypatch.setattr(client_module, 'HEDGE_DELAY', 0.1)
+    servers = []
+
+    def make(status: int = 200, delay: float = 0) -> str:
+        servers.append(make_registry(status, delay))
+        return url(servers[-1])
+
+    make.servers = servers
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def dead_registry() -> str:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        host, port = sock.getsockname()
+    return f'http://{host}:{port}'
+
+
+def test_lower_priority_registries_are_not_queried(registries) -> None:
+    fast, slow = registries(), registries(delay=5)
+    start = time.monotonic()
+    registry, response = find_plugin_version('hello', '1.0.0', [fast, slow])
+    assert registry == fast and response.json()['data']['version'] == '1.0.0'
+    assert time.monotonic() - start < 1
+    assert registries.servers[1].requests == []
+
+
+def test_missing_versions_fall_back(registries) -> None:
+    missing, found = registries(status=404), registries()
+    registry, _ = find_plugin_version('hello', '1.0.0', [missing, found])
+    assert registry == found
+    assert find_plugin_version('hello', '1.0.0', [missing]) == (None, None)
+
+
+def test_slow_registries_are_hedged(registries) -> None:
+    slow, hedged = registries(delay=0.5), registries(delay=5)
+    start = time.monotonic()
+    registry, _ = find_plugin_version('hello', '1.0.0', [slow, hedged])
+    # The next registry was queried while waiting, but the priority is kept, without waiting for it
+    assert registry == slow
+    assert len(registries.servers[1].requests) == 1
+    assert time.monotonic() - start < 2
+
+
+def test_failed_registries_are_demoted(registries) -> None:
+    dead, found = dead_registry(), registries()
+    registry, _ = find_plugin_version('hello', '1.0.0', [dead, found])
+    assert registry == found
+    health = RegistriesHealth()
+    assert not health.is_healthy(dead)
+    assert health.order([dead, found]) == [found, dead]
+    # The dead registry isn't queried anymore while the next one has the plugin
+    assert find_plugin_version('hello', '1.0.0', [dead, found])[0] == found
+    assert RegistriesHealth().stats[dead]['failures'] == 1
@@ -0,0 +1,84 @@
+'''Tests of the SQLite backend of the plugins registry.'''
+import json
+from pathlib import Path
+
+import pytest
+
+from dogeek_cli.registry_db import SqliteRegistry
+
+ENTRY = {
+    'path': '/plugins/hello', 'is_dir': True, 'logger': 'hello',
+    'metadata': {'name': 'hello', 'help': 'Says hello.'}, 'version': '1.2.0',
+    'installed_from': 'localhost', 'fingerprint': 'abc', 'content_hash': 'def',
+}
+
+
+def open_registry(tmp_path: Path) -> SqliteRegistry:
+    return SqliteRegistry(tmp_path / 'registry.db', tmp_path / 'registry.json', tmp_path / 'plugin_meta')
+
+
+@pytest.fixture
+def registry(tmp_path: Path) -> SqliteRegistry:
+    return open_registry(tmp_path)
+
+
+def test_migration(tmp_path: Path) -> None:
+    (tmp_path / 'registry.json').write_text(json.dumps({'hello': ENTRY, 'local': {**ENTRY, 'installed_from': None}}))
+    (tmp_path / 'plugin_meta').mkdir()
+    (tmp_path / 'plugin_meta' / 'hello.meta').write_text(json.dumps({'name': 'hello', 'commands': []}))
+    registry = open_registry(tmp_path)
+    assert list(registry) == ['hello', 'local']
+    assert registry['hello'] == ENTRY
+    assert registry['local']['installed_from'] is None
+    assert registry.read_meta('hello') == {'name': 'hello', 'commands': []}
+    assert registry.read_meta('local') is None
+    assert registry.installed_from() == ['hello']
+    assert registry.installed_from('elsewhere') == []
+
+
+def test_changes_are_shared(tmp_path: Path, registry: SqliteRegistry) -> None:
+    registry['hello'] = ENTRY
+    registry['other'] = {**ENTRY, 'path': '/plugins/other'}
+    with registry.batch():
+        registry['hello']['version'] = '1.3.0'
+    del registry['other']
+
+    other_process = open_registry(tmp_path)
+    assert 'other' not in other_process
+    assert other_process['hello'] == {**ENTRY, 'version': '1.3.0'}
+
+
+def test_writers_keep_each_other_entries(tmp_path: Path, registry: SqliteRegistry) -> None:
+    other_process = open_registry(tmp_path)
+    registry['hello'] = ENTRY
+    other_process['other'] = ENTRY
+    assert sorted(open_registry(tmp_path)) == ['hello', 'other']
+
+
+def test_fingerprint_changes_on_writes(registry: SqliteRegistry) -> None:
+    fingerprint = registry.fingerprint()
+    registry['hello'] = ENTRY
+    assert registry.fingerprint() != fingerprint
+    fingerprint = registry.fingerprint()
+    # Unchanged entries aren't written again
+    registry.save()
+    registry.write_meta('hello', {'name': 'hello'})
+    assert registry.fingerprint() == fingerprint
+
+
+def test_pop_and_meta_removal(registry: SqliteRegistry) -> None:
+    registry['hello'] = ENTRY
+    registry.write_meta('hello', {'name': 'hello'})
+    assert registry.pop('hello') == ENTRY
+    assert registry.pop('hello', None) is None
+    assert registry.read_meta('hello') is None
+    with pytest.raises(KeyError):
+        del registry['hello']
+
+
+def test_missing_entries_are_not_created(tmp_path: Path, registry: SqliteRegistry) -> None:
+    with pytest.raises(KeyError):
+        registry['missing']
+    assert 'missing' not in registry
+    registry['hello'] = ENTRY
+    assert list(open_registry(tmp_path)) == ['hello']
@@ -0,0 +1,89 @@
+'''Tests of the incremental scan of the plugins directory.'''
+import importlib
+import os
+from pathlib import Path
+from typing import Callable, Iterator
+
+import pytest
+
+from dogeek_cli.config import plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin
+from dogeek_cli.snapshot import fingerprint_path
+
+from tests.conftest import PLUGIN_SOURCE
+
+scan_module = importlib.import_module('dogeek_cli.scan')
+
+
+@pytest.fixture
+def write_plugin(plugin_name: str) -> Iterator[Callable[..., Path]]:
+    '''Writes single file plugins to the plugins directory, removed after the test.'''
+    paths = []
+
+    def write_plugin(suffix: str, source: str) -> Path:
+        path = plugins_path / f'{plugin_name}_{suffix}.py'
+        path.write_text(source)
+        paths.append(path)
+        return path
+
+    yield write_plugin
+    for path in paths:
+        path.unlink(missing_ok=True)
+        plugins_registry.pop(path.stem, None)
+        plugins_registry.delete_meta(path.stem)
+
+
+@pytest.fixture
+def imports(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    '''Records the plugins described by the scan.'''
+    imports = []
+    import_plugin = scan_module.import_plugin
+
+    def record(plugin_name: str, *args) -> dict:
+        imports.append(plugin_name)
+        return import_plugin(plugin_name, *args)
+
+    monkeypatch.setattr(scan_module, 'import_plugin', record)
+    return imports
+
+
+def test_only_changed_plugins_are_described(write_plugin, imports: list[str]) -> None:
+    path = write_plugin('hello', PLUGIN_SOURCE.format(version='1.0.0'))
+    name = path.stem
+    assert scan_module.scan_plugins()[name] == 'added'
+    assert Plugin(name).version_string == '1.0.0'
+    assert scan_module.scan_plugins()[name] == 'unchanged'
+    assert imports == [name]
+
+    # Touched, but not modified : the content hash is checked, and the fingerprint updated
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert scan_module.scan_plugins()[name] == 'unchanged'
+    assert plugins_registry[name]['fingerprint'] == fingerprint_path(path)
+    assert imports == [name]
+
+    path.write_text(PLUGIN_SOURCE.format(version='1.1.0'))
+    assert scan_module.scan_plugins()[name] == 'updated'
+    assert Plugin(name).version_string == '1.1.0'
+    assert imports == [name, name]
+
+
+def test_moved_plugins_are_described(write_plugin, imports: list[str]) -> None:
+    path = write_plugin('hello', PLUGIN_SOURCE.format(version='1.0.0'))
+    scan_module.scan_plugins()
+    plugins_registry[path.stem] = {**plugins_registry[path.stem], 'path': str(path.with_name('elsewhere.py'))}
+    assert scan_module.scan_plugins()[path.stem] == 'updated'
+    assert plugins_registry[path.stem]['path'] == str(path)
+
+
+@pytest.mark.parametrize('isolated', [False, True], ids=['in-process', 'isolated'])
+def test_broken_plugins_fail(write_plugin, isolated: bool) -> None:
+    working = write_plugin('working', PLUGIN_SOURCE.format(version='1.0.0'))
+    broken = write_plugin('broken', 'import missing_module_of_a_broken_plugin\n')
+    statuses = scan_module.scan_plugins(isolated=isolated)
+    assert statuses[working.stem] == 'added'
+    assert statuses[broken.stem].startswith('failed')
+    assert 'missing_module_of_a_broken_plugin' in statuses[broken.stem]
+    # Broken plugins aren't registered, and are described again by the next scan
+    assert broken.stem not in plugins_registry
+    assert scan_module.scan_plugins(isolated=isolated)[broken.stem].startswith('failed')
@@ -0,0 +1,158 @@
+'''Conformance of the serializers' backends : all the installed backends of a format write the same output.'''
+from collections import OrderedDict, defaultdict
+import datetime
+import json
+import math
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import Iterator
+
+import pytest
+
+from dogeek_cli import serializers as serializers_module
+from dogeek_cli.enums import OutputFormat
+from dogeek_cli.formatter import formatter
+from dogeek_cli.serializers import Serializer, get_serializer, register_serializer, serializers
+from dogeek_cli.state import state
+
+DOCUMENTS = [
+    {},
+    [],
+    {'name': 'hello', 'version': '1.2.0', 'enabled': True, 'logger': None, 'size': 1024},
+    [{'id': i, 'tags': ['a', 'b'], 'metadata': {}, 'ratio': i / 4} for i in range(5)],
+    {'nested': {'deeper': {'deepest': [1, [2, [3, []]]]}}},
+    {'unicode': 'héllo wörld ✓ 日本', 'emoji': '🐍', 'escapes': 'tab\there "quoted" back\\slash'},
+    {'multiline': 'first line\nsecond line\n', 'long': ' '.join(['word'] * 50), 'colon': 'key: value # comment'},
+    {'ints': [0, -1, 2**53, -2**63, 2**64 + 1], 'floats': [0.0, 0.1, -2.5, 123456.789, 1e-3]},
+    {'leading': '  spaces', 'empty': '', 'yes': 'yes', 'null': 'null', 'number': '42'},
+    {1: 'int key', 'enum': OutputFormat.JSON},
+    {'ordered': OrderedDict(b=1, a=2), 'default': defaultdict(list, {'k': [1]})},
+    {'path': Path('/plugins/hello'), 'date': datetime.datetime(2024, 1, 2, 3, 4, 5)},
+]
+PLUGIN = '''
+"""Counts."""
+import typer
+
+from dogeek_cli import formatter, register_serializer, Serializer
+
+register_serializer('lines', Serializer('lines', 'json', lambda data: '\\n'.join(map(str, data)).encode()))
+app = typer.Typer()
+
+
+@app.command()
+def count() -> None:
+    formatter([1, 2])
+'''
+# Written differently, but read back the same
+SEMANTIC_DOCUMENTS = [
+    {'exponents': [1e16, 1e-5, 6.02e23]},
+]
+
+
+def backends(format_name: str) -> list[Serializer]:
+    return [serializer for serializer in serializers[format_name] if serializer.available]
+
+
+def as_bytes(output: str | bytes) -> bytes:
+    return output.encode('utf8') if isinstance(output, str) else output
+
+
+@pytest.fixture
+def registry(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    '''Isolates the serializers registered by the test.'''
+    monkeypatch.setattr(serializers_module, 'serializers', {name: list(b) for name, b in serializers.items()})
+    monkeypatch.setattr(serializers_module, '_selected', {})
+    yield
+    state.format = OutputFormat.DEFAULT
+
+
+@pytest.mark.parametrize('format_name', ['json', 'yaml'])
+@pytest.mark.parametrize('document', DOCUMENTS, ids=range(len(DOCUMENTS)))
+def test_backends_write_the_same_output(format_name: str, document) -> None:
+    reference, *others = reversed(backends(format_name))
+    if not others:
+        pytest.skip(f'A single backend of {format_name} is installed')
+    for serializer in others:
+        assert as_bytes(serializer.dumps(document)) == as_bytes(reference.dumps(document)), serializer.backend
+        assert as_bytes(serializer.dumps_row(document)) == as_bytes(reference.dumps_row(document)), serializer.backend
+
+
+@pytest.mark.parametrize('document', SEMANTIC_DOCUMENTS + DOCUMENTS[:9], ids=range(len(SEMANTIC_DOCUMENTS) + 9))
+def test_json_backends_are_read_back_the_same(document) -> None:
+    for serializer in backends('json'):
+        assert json.loads(serializer.dumps(document)) == document, serializer.backend
+        assert json.loads(serializer.dumps_row(document)) == document, serializer.backend
+
+
+def test_yaml_backends_are_read_back_the_same() -> None:
+    import yaml
+
+    for serializer in backends('yaml'):
+        for document in DOCUMENTS[:9]:
+            assert yaml.safe_load(serializer.dumps(document)) == document, serializer.backend
+        assert yaml.safe_load(serializer.dumps(DOCUMENTS[9])) == {1: 'int key', 'enum': 'json'}
+
+
+def test_toml_backends_are_read_back_the_same() -> None:
+    import toml
+
+    document = {'name': 'hello', 'plugin': {'version': '1.2.0', 'tags': ['a', 'b'], 'ratio': 0.5}}
+    for serializer in backends('toml'):
+        assert toml.loads(serializer.dumps(document)) == document, serializer.backend
+
+
+def test_non_finite_floats() -> None:
+    # The json module writes NaN, which isn't JSON, orjson writes null
+    for serializer in backends('json'):
+        assert json.loads(serializer.dumps({'ratio': math.inf}))['ratio'] in (math.inf, None)
+
+
+def test_plugin_formats(registry: None, capsysbinary: pytest.CaptureFixture) -> None:
+    register_serializer('lines', Serializer('lines', 'json', lambda data: '\n'.join(map(str, data)).encode()))
+    state.format = 'lines'
+    formatter([1, 2])
+    # Binary formats are written as they are, without a final newline
+    assert capsysbinary.readouterr().out == b'1\n2'
+
+
+def test_preferred_backends_fall_back(registry: None) -> None:
+    missing = Serializer('missing', 'dogeek_cli_missing_module', lambda data: '')
+    register_serializer('json', missing)
+    assert get_serializer('json') is not missing
+    fastest = Serializer('fastest', 'json', lambda data: '')
+    register_serializer('json', fastest)
+    assert get_serializer('json') is fastest
+    register_serializer('json', Serializer('slowest', 'json', lambda data: ''), preferred=False)
+    assert get_serializer('json') is fastest
+
+
+def test_unknown_formats(registry: None) -> None:
+    with pytest.raises(LookupError):
+        get_serializer('unknown')
+    register_serializer('uninstalled', Serializer('missing', 'dogeek_cli_missing_module', lambda data: ''))
+    with pytest.raises(LookupError):
+        get_serializer('uninstalled')
+
+
+def test_format_option(tmp_path: Path) -> None:
+    app_path = tmp_path / 'cli'
+    (app_path / 'plugins').mkdir(parents=True)
+    (app_path / 'config.json').write_text(json.dumps({'app': {'notify_new_version': False}}))
+    (app_path / 'plugins' / 'counter.py').write_text(PLUGIN)
+    environ = {**os.environ, 'XDG_CONFIG_HOME': str(tmp_path)}
+    subprocess.run([sys.executable, '-m', 'dogeek_cli', 'plugins', 'update'], env=environ, check=True)
+
+    def run(output_format: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, '-m', 'dogeek_cli', '--format', output_format, 'counter', 'count'],
+            env=environ, capture_output=True, text=True,
+        )
+
+    assert json.loads(run('json').stdout) == [1, 2]
+    # Formats registered by plugins are known once the plugin is imported
+    assert run('lines').stdout == '1\n2'
+    result = run('unknown')
+    assert result.returncode == 2
+    assert 'Unknown format' in result.stderr
@@ -0,0 +1,129 @@
+'''Tests of the CLI's server, and of its thin client.'''
+import errno
+import json
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+from typing import Iterator
+
+import pytest
+
+from dogeek_cli import remote, server
+
+PLUGIN = '''
+"""Says hello."""
+import os
+
+import typer
+
+from dogeek_cli import state
+
+app = typer.Typer()
+
+
+@app.command()
+def say(name: str) -> None:
+    print(GREETING, name, state.format, os.environ.get('GREETED_BY'), os.getcwd(), os.getppid())
+'''
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'send_fds'), reason='File descriptors are sent over Unix sockets')
+
+
+def write_plugin(app_path: Path, greeting: str) -> None:
+    (app_path / 'plugins' / 'hello.py').write_text(f'GREETING = {greeting!r}\n{PLUGIN}')
+    return
+
+
+@pytest.fixture
+def environ(tmp_path: Path) -> dict[str, str]:
+    app_path = tmp_path / 'cli'
+    (app_path / 'plugins').mkdir(parents=True)
+    (app_path / 'config.json').write_text(json.dumps({'app': {'notify_new_version': False}}))
+    write_plugin(app_path, 'hello')
+    environ = {**os.environ, 'XDG_CONFIG_HOME': str(tmp_path)}
+    subprocess.run([sys.executable, '-m', 'dogeek_cli', 'plugins', 'update'], env=environ, check=True)
+    return environ
+
+
+@pytest.fixture
+def serving(environ: dict[str, str]) -> Iterator[subprocess.Popen]:
+    process = subprocess.Popen([sys.executable, '-m', 'dogeek_cli', 'system', 'serve'], env=environ)
+    path = str(Path(environ['XDG_CONFIG_HOME']) / 'cli' / 'tmp' / 'server.sock')
+    deadline = time.monotonic() + 30
+    while True:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+                break
+            except OSError:
+                assert process.poll() is None and time.monotonic() < deadline, 'The server did not start'
+                time.sleep(0.05)
+    yield process
+    process.terminate()
+    process.wait(10)
+    assert not Path(path).exists()
+
+
+def run_client(environ: dict[str, str], *args: str, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, '-m', 'dogeek_cli.remote', *args], env=environ, capture_output=True, text=True, **kwargs,
+    )
+
+
+def test_socket_path() -> None:
+    assert remote.socket_path() == server.socket_path
+
+
+def test_commands_are_served(environ: dict[str, str], serving: subprocess.Popen) -> None:
+    result = run_client(environ, 'hello', 'say', 'world')
+    assert result.returncode == 0, result.stderr
+    greeting, name, _, _, _, parent_pid = result.stdout.split()
+    # Run in a process forked by the server
+    assert (greeting, name, int(parent_pid)) == ('hello', 'world', serving.pid)
+    assert run_client(environ, 'unknown').returncode == 2
+
+
+def test_concurrent_clients(environ: dict[str, str], serving: subprocess.Popen, tmp_path: Path) -> None:
+    clients = []
+    for i, output_format in enumerate(['json', 'yaml', 'csv'] * 3):
+        (tmp_path / str(i)).mkdir()
+        clients.append(subprocess.Popen(
+            [sys.executable, '-m', 'dogeek_cli.remote', '--format', output_format, 'hello', 'say', str(i)],
+            env={**environ, 'GREETED_BY': f'client {i}', 'PYTHONPATH': os.getcwd()},
+            cwd=tmp_path / str(i), stdout=subprocess.PIPE, text=True,
+        ))
+    for i, (client, output_format) in enumerate(zip(clients, ['json', 'yaml', 'csv'] * 3)):
+        output, _ = client.communicate(timeout=30)
+        assert client.returncode == 0
+        # Every command has its own state, environment and working directory
+        assert output.split()[1:6] == [
+            str(i), f'OutputFormat.{output_format.upper()}', 'client', str(i), str(tmp_path / str(i)),
+        ]
+
+
+def test_changed_plugins_are_reloaded(environ: dict[str, str], serving: subprocess.Popen) -> None:
+    assert run_client(environ, 'hello', 'say', 'world').stdout.startswith('hello world')
+    write_plugin(Path(environ['XDG_CONFIG_HOME']) / 'cli', 'good morning')
+    result = run_client(environ, 'hello', 'say', 'world')
+    assert result.stdout.startswith('good morning world')
+    # The server re-executed itself
+    assert int(result.stdout.split()[-1]) == serving.pid
+
+
+def test_commands_run_locally_without_server(environ: dict[str, str]) -> None:
+    result = run_client(environ, 'hello', 'say', 'world')
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith('hello world')
+    # Run by the client itself
+    assert int(result.stdout.split()[-1]) == os.getpid()
+
+
+def test_single_server(environ: dict[str, str], serving: subprocess.Popen) -> None:
+    result = subprocess.run(
+        [sys.executable, '-m', 'dogeek_cli', 'system', 'serve'], env=environ, capture_output=True, text=True,
+    )
+    assert result.returncode == errno.EADDRINUSE
+    assert 'already listening' in result.stdout
@@ -0,0 +1,75 @@
+'''Tests of the snapshot of the command tree, and of its invalidation.'''
+import importlib
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from dogeek_cli import snapshot
+from dogeek_cli.config import config, plugins_path, plugins_registry
+
+# The package's `app` attribute is the typer application
+app_module = importlib.import_module('dogeek_cli.app')
+
+
+@pytest.fixture
+def builds(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[dict]]:
+    '''Records the rebuilds of the command tree.'''
+    builds = []
+    add_subcommands_hook = app_module.add_subcommands_hook
+
+    def hook(tree: dict) -> dict:
+        builds.append(tree)
+        return add_subcommands_hook(tree)
+
+    monkeypatch.setattr(app_module, 'add_subcommands_hook', hook)
+    snapshot.invalidate()
+    yield builds
+    snapshot.invalidate()
+
+
+def test_snapshot_is_reused(builds: list[dict]) -> None:
+    tree = app_module.make_command_tree()
+    assert len(builds) == 1
+    assert snapshot.load(snapshot.fingerprint()) is not None
+    assert sorted(app_module.make_command_tree().list_commands(None)) == sorted(tree.list_commands(None))
+    assert len(builds) == 1
+    app_module.make_command_tree(force_rebuild=True)
+    assert len(builds) == 2
+
+
+def test_changed_plugins_invalidate_the_snapshot(builds: list[dict], plugin_name: str) -> None:
+    app_module.make_command_tree()
+    plugin_path: Path = plugins_path / f'{plugin_name}.py'
+    plugin_path.write_text('')
+    try:
+        app_module.make_command_tree()
+        assert len(builds) == 2
+    finally:
+        plugin_path.unlink()
+    app_module.make_command_tree()
+    assert len(builds) == 3
+
+
+def test_fingerprint_changes(request) -> None:
+    fingerprint = snapshot.fingerprint()
+    theme = config['app.theme']
+    config['app.theme'] = 'other'
+    try:
+        assert snapshot.fingerprint() != fingerprint
+    finally:
+        config['app.theme'] = theme
+    fingerprint = snapshot.fingerprint()
+    plugins_registry[request.node.name] = {'path': '/plugins/hello', 'enabled': True}
+    try:
+        assert snapshot.fingerprint() != fingerprint
+    finally:
+        del plugins_registry[request.node.name]
+
+
+def test_outdated_snapshots_arent_loaded() -> None:
+    snapshot.dump({'name': None, 'commands': [], 'groups': []}, 'outdated')
+    assert snapshot.load('outdated') == {'name': None, 'commands': [], 'groups': []}
+    assert snapshot.load(snapshot.fingerprint()) is None
+    snapshot.invalidate()
+    assert snapshot.load('outdated') is None
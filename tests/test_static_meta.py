@@ -0,0 +1,129 @@
+'''Tests of the description of plugins from their source, against importing them.'''
+import importlib.util
+import json
+from pathlib import Path
+import sys
+import textwrap
+
+import pytest
+import typer
+from typer.models import TyperInfo
+
+from dogeek_cli.meta import make_group
+from dogeek_cli.static_meta import StaticAnalysisError, describe
+
+INIT = """
+'''Rich plugin, with subcommands.'''
+from enum import Enum
+from pathlib import Path
+
+import typer
+
+from dogeek_cli import Logger
+from .commands import app, Color
+
+__version__ = '2.3.1'
+metadata = {'help': 'Custom help', 'tags': ['a', 'b']}
+logger = Logger('richlog')
+
+Path(__file__).with_name('marker').write_text('executed')
+
+
+@app.callback()
+def main(verbose: bool = typer.Option(False, '--verbose', '-v', help='Verbose output')):
+    '''The plugin callback.'''
+
+
+@app.command()
+def paint(
+    color: Color = typer.Argument(Color.red, help='Color to paint with'),
+    times: int = typer.Option(1, min=1, max=10),
+    output: Path = typer.Option(None, exists=False),
+    *, dry_run: bool = False,
+) -> None:
+    '''
+    Paints things.
+
+    With a color.
+    '''
+    raise SystemExit
+
+
+if __name__ == '__main__':
+    app()
+"""
+
+COMMANDS = """
+from enum import Enum
+from typing import Optional
+import typer
+
+app = typer.Typer()
+sub = typer.Typer(help='Sub commands')
+
+
+class Color(str, Enum):
+    red = 'red'
+    blue = 'blue'
+
+
+@sub.command('list')
+def list_things(limit: 'int' = 10, name: Optional[str] = None):
+    '''Lists things.'''
+
+
+app.add_typer(sub, name='things')
+"""
+
+
+def import_plugin(path: Path):
+    spec = importlib.util.spec_from_file_location(f'plugins.{path.name}', str(path / '__init__.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.modules.pop(spec.name)
+    return module
+
+
+def dump_group(app: typer.Typer) -> str:
+    return json.dumps(make_group(TyperInfo(app, name='rich', help='help')), indent=2, default=str)
+
+
+@pytest.fixture
+def plugin_path(tmp_path: Path) -> Path:
+    path = tmp_path / 'rich'
+    path.mkdir()
+    (path / '__init__.py').write_text(textwrap.dedent(INIT))
+    (path / 'commands.py').write_text(textwrap.dedent(COMMANDS))
+    return path
+
+
+def test_describe_does_not_execute(plugin_path: Path) -> None:
+    describe(plugin_path)
+    assert not (plugin_path / 'marker').exists()
+
+
+def test_describe_matches_import(plugin_path: Path) -> None:
+    description = describe(plugin_path)
+    module = import_plugin(plugin_path)
+    assert description['version'] == module.__version__
+    assert description['metadata'] == module.metadata
+    assert description['logger'] == module.logger.logger_name
+    assert dump_group(description['app']) == dump_group(module.app)
+
+
+@pytest.mark.parametrize('source', [
+    'import typer\napp = typer.Typer()\nfor name in ("a", "b"):\n    app.command(name)(print)\n',
+    'import typer\ndef make_app():\n    return typer.Typer()\napp = make_app()\n',
+    'import typer\napp = typer.Typer()\n@app.command()\n@decorator\ndef command():\n    pass\n',
+    'import typer\napp = typer.Typer()\n__version__ = compute_version()\n',
+    'import typer\nfrom .missing import *\napp = typer.Typer()\n',
+    'app = 1\n',
+])
+def test_describe_requires_import(tmp_path: Path, source: str) -> None:
+    path = tmp_path / 'plugin.py'
+    path.write_text(source)
+    with pytest.raises(StaticAnalysisError):
+        describe(path)
@@ -0,0 +1,58 @@
+'''Tests of the artifact store of plugin archives.'''
+import hashlib
+import io
+import os
+
+import pytest
+
+from dogeek_cli.store import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path) -> ArtifactStore:
+    return ArtifactStore(tmp_path / 'store', 1024)
+
+
+def test_put_and_find(store: ArtifactStore) -> None:
+    sha256 = store.put(io.BytesIO(b'archive'))
+    assert sha256 == hashlib.sha256(b'archive').hexdigest()
+    assert store.archive_path(sha256).read_bytes() == b'archive'
+    assert store.find('hello', '1.0.0') is None
+    store.record('hello', '1.0.0', sha256, 'registry')
+    assert store.find('hello', '1.0.0') == {'sha256': sha256, 'registry': 'registry'}
+    # Archives missing from the store aren't found
+    store.archive_path(sha256).unlink()
+    assert store.find('hello', '1.0.0') is None
+
+
+def test_put_checks_the_checksum(store: ArtifactStore) -> None:
+    assert store.put(io.BytesIO(b'archive'), sha256='0' * 64) is None
+    assert list(store.path.iterdir()) == []
+
+
+def test_evicts_least_recently_used_archives(store: ArtifactStore) -> None:
+    digests = []
+    for i in range(2):
+        digests.append(store.put(io.BytesIO(bytes([i]) * 400)))
+        store.record('hello', f'1.0.{i}', digests[-1], None)
+        # Distinct modification times, as on slower file systems
+        os.utime(store.archive_path(digests[-1]), (i, i))
+    # Looking an archive up marks it as recently used
+    assert store.find('hello', '1.0.0') is not None
+    digests.append(store.put(io.BytesIO(b'\x02' * 400)))
+    stored = {path.name for path in store.path.glob('*.tar.gz')}
+    assert stored == {store.archive_path(sha256).name for sha256 in (digests[0], digests[2])}
+
+
+def test_the_last_archive_is_kept(store: ArtifactStore) -> None:
+    sha256 = store.put(io.BytesIO(b'x' * 2048))
+    assert store.archive_path(sha256).exists()
+
+
+def test_previous_version(store: ArtifactStore) -> None:
+    for version in ('1.0.0', '1.1.0', '1.2.0'):
+        store.record('hello', version, store.put(io.BytesIO(version.encode('utf8'))), None)
+    assert store.previous_version('hello', '1.2.0') == '1.1.0'
+    store.archive_path(store.find('hello', '1.1.0')['sha256']).unlink()
+    assert store.previous_version('hello', '1.2.0') == '1.0.0'
+    assert store.previous_version('missing', '1.0.0') is None
@@ -0,0 +1,83 @@
+'''Tests of the bulk upgrade of the plugins, against a local stand-in registry.'''
+import io
+from typing import Callable, Iterator
+
+import pytest
+
+from dogeek_cli.config import config, plugins_path, plugins_registry
+from dogeek_cli.plugin import Plugin
+from dogeek_cli.store import store
+from dogeek_cli.upgrades import upgrade_plugins
+
+from tests.conftest import PLUGIN_SOURCE, make_archive
+from tests.stand_in_registry import StandInRegistry
+
+
+@pytest.fixture
+def registry() -> Iterator[StandInRegistry]:
+    (config.app_path / 'key.pub').write_text('ssh-rsa AAAA test')
+    registry = StandInRegistry()
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def install(plugin_name: str, registry: StandInRegistry) -> Iterator[Callable[..., Plugin]]:
+    '''Installs the first of `versions` of a single file plugin, all of them are on the stand-in registry.'''
+    plugins = []
+
+    def install(suffix: str, *versions: str, broken: str | None = None) -> Plugin:
+        name = f'{plugin_name}_{suffix}'
+        for version in versions:
+            source = PLUGIN_SOURCE.format(version=version)
+            if version == broken:
+                # Can't be described from its source, nor imported
+                source = 'import missing_module_of_a_broken_plugin'
+            registry.add(name, version, {f'{name}.py': source.encode('utf8')})
+        plugins.append(Plugin(name))
+        archive = make_archive({f'{name}.py': PLUGIN_SOURCE.format(version=versions[0]).encode('utf8')})
+        assert plugins[-1].install_archive(io.BytesIO(archive), registry.url) == 0
+        return plugins[-1]
+
+    yield install
+    for plugin in plugins:
+        if plugin.plugin_name in plugins_registry:
+            plugin.uninstall()
+
+
+@pytest.mark.parametrize('batch_lookups', [True, False], ids=['batched', 'concurrent'])
+def test_plugins_are_upgraded(registry: StandInRegistry, install, batch_lookups: bool) -> None:
+    registry.batch_lookups = batch_lookups
+    first, second = install('first', '1.0.0', '1.1.0'), install('second', '1.0.0', '2.0.0')
+    up_to_date = install('up_to_date', '1.0.0')
+    upgrades, timings = upgrade_plugins([first, second, up_to_date])
+    assert {upgrade.plugin.plugin_name: (upgrade.version, upgrade.status) for upgrade in upgrades} == {
+        first.plugin_name: ('1.1.0', 'upgraded'), second.plugin_name: ('2.0.0', 'upgraded'),
+    }
+    assert set(timings) == {'plan', 'download', 'extract', 'commit'}
+    assert Plugin(first.plugin_name).version_string == '1.1.0'
+    assert Plugin(second.plugin_name).version_string == '2.0.0'
+    assert store.find(second.plugin_name, '2.0.0')['registry'] == registry.url
+    assert not list(plugins_path.glob('.install-*'))
+
+
+def test_broken_upgrades_are_reverted(install) -> None:
+    working, broken = install('working', '1.0.0', '1.1.0'), install('broken', '1.0.0', '1.1.0', broken='1.1.0')
+    meta = plugins_registry.read_meta(broken.plugin_name)
+    upgrades, _ = upgrade_plugins([working, broken])
+    statuses = {upgrade.plugin.plugin_name: upgrade.status for upgrade in upgrades}
+    assert statuses[working.plugin_name] == 'upgraded'
+    assert statuses[broken.plugin_name].startswith('reverted')
+    # The previous version is still installed, with its registry entry
+    reverted = Plugin(broken.plugin_name)
+    assert reverted.version_string == '1.0.0'
+    assert 'missing_module' not in reverted.path.read_text()
+    assert plugins_registry.read_meta(broken.plugin_name) == meta
+    assert Plugin(working.plugin_name).version_string == '1.1.0'
+
+
+def test_local_plugins_are_skipped(install) -> None:
+    plugin = install('local', '1.0.0', '1.1.0')
+    plugins_registry[plugin.plugin_name] = {**plugins_registry[plugin.plugin_name], 'installed_from': None}
+    upgrades, _ = upgrade_plugins([plugin])
+    assert upgrades == []
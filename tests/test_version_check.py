@@ -0,0 +1,70 @@
+'''Tests of the check for new versions of the package, from its cached latest version.'''
+import importlib
+import json
+from pathlib import Path
+import time
+
+import pytest
+
+from dogeek_cli.config import config
+
+utils_module = importlib.import_module('dogeek_cli.utils')
+
+
+@pytest.fixture
+def cache_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    cache_path = tmp_path / 'version.json'
+    monkeypatch.setattr(utils_module, 'version_cache_path', cache_path)
+    return cache_path
+
+
+@pytest.fixture
+def refreshes(monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+    '''Records the background refreshes of the cache, and the requests to pypi.'''
+    refreshes = []
+    monkeypatch.setattr(utils_module.subprocess, 'Popen', lambda args, **kwargs: refreshes.append(args))
+    monkeypatch.setattr(utils_module, 'get_pypi_version', lambda *args, **kwargs: pytest.fail('pypi was requested'))
+    return refreshes
+
+
+def test_fresh_caches_are_used(cache_path: Path, refreshes: list, capsys: pytest.CaptureFixture) -> None:
+    cache_path.write_text(json.dumps({'checked_at': time.time(), 'latest_version': '2.0.0'}))
+    utils_module.check_version('1.0.0')
+    assert refreshes == []
+    assert 'dogeek_cli v2.0.0 is out!' in capsys.readouterr().err
+
+    utils_module.check_version('2.0.0')
+    assert 'is out' not in capsys.readouterr().err
+
+
+def test_stale_caches_are_refreshed_in_background(cache_path: Path, refreshes: list) -> None:
+    checked_at = time.time() - config['app.version_check_ttl'] - 1
+    cache_path.write_text(json.dumps({'checked_at': checked_at, 'latest_version': '2.0.0'}))
+    utils_module.check_version('1.0.0')
+    assert len(refreshes) == 1
+    assert 'refresh_version_cache()' in refreshes[0][-1]
+    # Marked as checked, for the next runs not to refresh it again
+    cache = json.loads(cache_path.read_text())
+    assert cache['checked_at'] > checked_at and cache['latest_version'] == '2.0.0'
+    utils_module.check_version('1.0.0')
+    assert len(refreshes) == 1
+
+
+@pytest.mark.parametrize('content', [None, '', '{"checked_at": '], ids=['missing', 'empty', 'corrupt'])
+def test_unreadable_caches_are_refreshed(
+    cache_path: Path, refreshes: list, content: str | None, capsys: pytest.CaptureFixture
+) -> None:
+    if content is not None:
+        cache_path.write_text(content)
+    utils_module.check_version('1.0.0')
+    assert len(refreshes) == 1
+    assert json.loads(cache_path.read_text())['latest_version'] is None
+    assert capsys.readouterr().err == ''
+
+
+def test_refreshes_keep_the_known_version_offline(cache_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_path.write_text(json.dumps({'checked_at': 0, 'latest_version': '2.0.0'}))
+    monkeypatch.setattr(utils_module, 'get_pypi_version', lambda *args, **kwargs: None)
+    utils_module.refresh_version_cache()
+    cache = json.loads(cache_path.read_text())
+    assert cache['checked_at'] > 0 and cache['latest_version'] == '2.0.0'